@@ -0,0 +1,32 @@
+""" pytest fixtures: the simulated radio (garage_sim), and a daemon serving it """
+
+import pytest
+
+import garage_airtime
+import garage_radiod
+import garage_rfm69
+
+
+@pytest.fixture
+def radio(monkeypatch):
+    """A simulated RFM69 from open_radio(), with air time taking no time"""
+    monkeypatch.setenv("GARAGE_SIM_TIME_SCALE", "0")
+    radio = garage_rfm69.open_radio("sim")
+    yield radio
+    radio.shutdown()
+    garage_rfm69.release_radio(radio)
+
+
+@pytest.fixture
+def server(radio, tmp_path):
+    """A RadioServer owning the simulated radio, with unlimited air time and
+    no hot standby, which tests can dispatch() to directly"""
+    server = garage_radiod.RadioServer(
+        str(tmp_path / "radiod.sock"),
+        [radio],
+        garage_rfm69,
+        hot_standby=False,
+        budget=garage_airtime.UnlimitedBudget(),
+    )
+    yield server
+    server.server_close()
@@ -1,63 +1,180 @@
 """ Garage Gate Opener Frontend """
-import subprocess
+import functools
+import queue
+import time
+
 import flask
+import markupsafe
 
-app = flask.Flask(__name__)
-app.config["DEBUG"] = False
+import garage_log
+import garage_radiod
+import garage_rfm69
+import garage_scheduler
+from garage_log import LOG
+from garage_metrics import REGISTRY
 
+# Fixed pages are rendered once, not per request
+MAINPAGE_HTML = (
+    '<div style="   display: flex;justify-content: center;align-items: center;'
+    'height: 100%;border: 3px solid green;  " ><p>Garage Gate</p> </div>'
+).encode()
+NOPE_HTML = (
+    '<div style="   display: flex;justify-content: center;align-items: center;'
+    'height: 100%;border: 3px solid red;" ><p style="font-size: 300%">Nope</p> </div>'
+).encode()
+WRONG_COMMAND_HTML = (
+    '<div style="display: flex;justify-content: center;align-items: center;'
+    'height: 25%;border: 5px solid red;"><p style="font-size: 300%">'
+    "Wrong command</p></div>"
+).encode()
+HTML_HEADERS = {"Content-Type": "text/html; charset=utf-8"}
+METRICS_HEADERS = {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+# What a Sonoff style Pulse names in place of a device
+SONOFF_RELAY = "doorRelayPin"
+# How often a telemetry stream asks the daemon for new samples
+TELEMETRY_POLL = 0.1
+# Longest wait between retries of a telemetry stream while the daemon is down
+TELEMETRY_BACKOFF = 5.0
 
-def pulse():
-    """Run the radio code as a subprocess"""
-    if app.config["DEBUG"]:
-        # Run in a mode where no radio transmission is sent
-        radio_args = ["/usr/bin/python3", "garage_rfm69.py", "-t"]
-    else:
-        # Run in live mode, sending the radio transmission
-        radio_args = ["/usr/bin/python3", "garage_rfm69.py", "-d"]
-    try:
-        callout = subprocess.run(
-            radio_args,
-            capture_output=True,
-            check=True,
+PULSES = REGISTRY.counter("garage_web_pulses_total", "Bursts asked of the daemon")
+PULSE_FAILURES = REGISTRY.counter(
+    "garage_web_pulse_failures_total", "Bursts which failed or found no daemon"
+)
+PULSE_SECONDS = REGISTRY.histogram(
+    "garage_web_pulse_seconds", "Daemon round trips for a burst"
+)
+
+garage = flask.Blueprint("garage", __name__)
+
+
+class Garage:
+    """Per-app state: warm connections to the radio daemon, and the scheduler"""
+
+    def __init__(self, app):
+        self.app = app
+        # A connection for each burst which can be on air at once
+        self.radiods = queue.Queue()
+        for _ in range(app.config["TRANSMITTERS"]):
+            radiod = garage_radiod.RadiodClient(app.config["RADIOD_SOCKET"])
+            try:
+                radiod.connect()
+            except OSError as err:
+                # The daemon may still be starting, the first request retries
+                LOG.warning("Radio daemon not up yet: {error}", error=err)
+            self.radiods.put(radiod)
+        # Metrics and telemetry queries shouldn't queue behind a whole burst
+        self.monitor = garage_radiod.RadiodClient(app.config["RADIOD_SOCKET"])
+        # The devices the daemon compiles, from the same profiles file, so
+        # unknown names are turned away before they reach it or its log
+        self.devices = set(garage_rfm69.compile_devices())
+        # Overlapping requests share one burst, rather than queueing up several
+        self.scheduler = garage_scheduler.TransmitScheduler(
+            workers=app.config["TRANSMITTERS"]
+        )
+
+    def pulse(self, progress=None, device=None):
+        """Ask the radio daemon to transmit a device's signal (by default the
+        garage's), passing each output line to progress"""
+        message = {
+            "cmd": "pulse",
+            # Run in a mode where no radio transmission is sent
+            "dry_run": self.app.config["DRY_RUN"],
+            # Otherwise dump the registers alongside the live transmission
+            "debug": not self.app.config["DRY_RUN"],
+        }
+        if device:
+            message["device"] = device
+        if progress:
+            # Followers want every FIFO top up, as console lines with their
+            # level, so the output can still be given at the usual level
+            message.update(follow=True, level="debug", fields=["line", "level"])
+        PULSES.inc()
+        radiod = self.radiods.get()
+        try:
+            with PULSE_SECONDS.time():
+                reply = radiod.request(
+                    message,
+                    on_event=progress and (lambda event: progress(event["line"])),
+                )
+        except (OSError, ValueError) as err:
+            PULSE_FAILURES.inc()
+            LOG.error("Radio daemon unavailable: {error}", error=err)
+            return (False, f"Radio daemon unavailable: {err}")
+        finally:
+            self.radiods.put(radiod)
+        if not reply["ok"]:
+            PULSE_FAILURES.inc()
+        LOG.log(
+            garage_log.SUCCESS if reply["ok"] else garage_log.WARNING,
+            "Pulse for {device}: {ok}",
+            device=device or "garage",
+            ok=reply["ok"],
+            radio=reply.get("radio"),
+            armed=reply.get("armed"),
         )
-        print("exit status:", callout.returncode)
-        print("stdout:", callout.stdout.decode())
-        print("stderr:", callout.stderr.decode())
-        return (bool(callout.returncode == 0), callout.stdout.decode())
-    except subprocess.CalledProcessError as err:
-        print("exit status:", err.returncode)
-        print("stdout:", err.stdout.decode())
-        print("stderr:", err.stderr.decode())
-        return (bool(err.returncode == 0), err.stderr.decode())
-
-
-@app.route("/", methods=["GET"])
+        output = reply["output"]
+        if progress and "log" in reply:
+            output = "".join(
+                record["line"] + "\n"
+                for record in reply["log"]
+                if garage_log.LEVELS[record["level"]] >= garage_log.INFO
+            )
+        return (bool(reply["ok"]), output)
+
+
+def state():
+    return flask.current_app.extensions["garage"]
+
+
+@garage.route("/", methods=["GET"])
 def mainpage():
     """help"""
-    return (
-        '<div style="   display: flex;justify-content: center;align-items: center;'
-        'height: 100%;border: 3px solid green;  " ><p>Garage Gate</p> </div>'
-    )
+    return MAINPAGE_HTML, 200, HTML_HEADERS
 
 
-@app.route("/control", methods=["GET"])
+@garage.route("/control", methods=["GET"])
 def control():
     """control"""
     # Mocking a Sonoff relay?
     # GET /control?cmd=Pulse,doorRelayPin,1,500
+    # GET /control?cmd=Pulse,<device>
     cmd = flask.request.args.get("cmd", default=False, type=str)
 
     # We only respond to cmd control requests
     if not cmd:
-        return (
-            '<div style="   display: flex;justify-content: center;align-items: center;'
-            'height: 100%;border: 3px solid red;" ><p style="font-size: 300%">Nope</p> </div>',
-            503,
-        )
+        return NOPE_HTML, 503, HTML_HEADERS
 
     # If we do get a 'Pulse' cmd, then call the radio function
-    if cmd.split(",")[0] == "Pulse":
-        returncode, returntext = pulse()
+    command, *params = cmd.split(",")
+    if command == "Pulse":
+        # The Sonoff's own relay pin means our default device
+        device = params[0] if params and params[0] != SONOFF_RELAY else None
+        if device and device not in state().devices:
+            return WRONG_COMMAND_HTML, 404, HTML_HEADERS
+        try:
+            # Overlapping requests for the same device share a burst
+            job = state().scheduler.submit(
+                ",".join(filter(None, ("Pulse", device))),
+                functools.partial(state().pulse, device=device),
+                # Only an async caller gets the job's events to follow
+                watched="async" in flask.request.args,
+            )
+        except garage_scheduler.SchedulerBusy as err:
+            job, returncode, returntext = None, False, f"Radio busy: {err}"
+        # GET /control?cmd=Pulse&async : don't wait, hand back the job
+        if job and "async" in flask.request.args:
+            return flask.jsonify(job_status(job)), 202
+        if job:
+            try:
+                returncode, returntext = job.wait(garage_radiod.RADIOD_TIMEOUT)
+            except TimeoutError as err:
+                if not state().scheduler.cancel(job):
+                    # On air already, or joined by others, so it will still go
+                    # out: hand back the job as the async path does
+                    return flask.jsonify(job_status(job)), 202
+                returncode, returntext = False, f"Radio busy, not sent: {err}"
+        # The daemon's output can carry text from the request
+        returntext = markupsafe.escape(returntext)
         if returncode:
             return (
                 f'<div style="display: flex;justify-content: center;align-items: center;'
@@ -74,12 +191,146 @@ def control():
         )
 
     # If the cmd isn't for a 'Pulse', then provide some vague feedback
-    return (
-        '<div style="display: flex;justify-content: center;align-items: center;'
-        'height: 25%;border: 5px solid red;"><p style="font-size: 300%">'
-        "Wrong command</p></div>",
-        503,
+    return WRONG_COMMAND_HTML, 503, HTML_HEADERS
+
+
+@garage.route("/metrics", methods=["GET"])
+def metrics():
+    """Prometheus metrics, for this process and the radio daemon"""
+    text = REGISTRY.render()
+    try:
+        reply = state().monitor.request({"cmd": "metrics"})
+    except (OSError, ValueError) as err:
+        text += f"# radiod unavailable: {err}\n"
+    else:
+        text += reply["output"]
+    return text, 200, METRICS_HEADERS
+
+
+@garage.route("/telemetry", methods=["GET"])
+def telemetry():
+    """Radio telemetry over the last ?seconds=60, downsampled to ?points=120"""
+    message = {
+        "cmd": "telemetry",
+        "seconds": flask.request.args.get("seconds", default=60, type=float),
+        "points": flask.request.args.get("points", default=120, type=int),
+    }
+    try:
+        return flask.jsonify(state().monitor.request(message))
+    except (OSError, ValueError) as err:
+        return flask.jsonify({"ok": False, "output": str(err)}), 503
+
+
+@garage.route("/telemetry/events", methods=["GET"])
+def telemetry_events():
+    """Stream new telemetry samples as Server-Sent Events, a batch per event"""
+    # Its own connection, polling for as long as the browser keeps listening
+    client = garage_radiod.RadiodClient(flask.current_app.config["RADIOD_SOCKET"])
+
+    def stream():
+        # Start from now, not the whole history
+        after, idle = None, 0
+        try:
+            backoff = TELEMETRY_POLL
+            while True:
+                try:
+                    reply = client.request({"cmd": "telemetry", "since": after})
+                except (OSError, ValueError) as err:
+                    # Tell the browser, then retry, backing off while it's down
+                    error = flask.json.dumps({"ok": False, "output": str(err)})
+                    yield f"event: error\ndata: {error}\n\n"
+                    time.sleep(backoff)
+                    backoff = min(backoff * 2, TELEMETRY_BACKOFF)
+                    continue
+                backoff = TELEMETRY_POLL
+                if after is None:
+                    fields = flask.json.dumps(reply["fields"])
+                    yield f"event: fields\ndata: {fields}\n\n"
+                elif reply["samples"]:
+                    idle = 0
+                    yield f"data: {flask.json.dumps(reply['samples'])}\n\n"
+                else:
+                    idle += TELEMETRY_POLL
+                    if idle >= 15:
+                        idle = 0
+                        yield ": keepalive\n\n"
+                after = reply["next"]
+                time.sleep(TELEMETRY_POLL)
+        finally:
+            client.close()
+
+    return flask.Response(
+        stream(), mimetype="text/event-stream", headers={"Cache-Control": "no-cache"}
     )
 
 
-app.run(host="0", port="80")
+def job_status(job):
+    """JSON friendly summary of a scheduled job"""
+    status = {
+        "job": job.id,
+        "done": job.done.is_set(),
+        "status": flask.url_for("garage.job_info", job_id=job.id),
+        "events": flask.url_for("garage.job_events", job_id=job.id),
+    }
+    if job.done.is_set():
+        status["ok"], status["output"] = job.result or (False, str(job.error))
+    return status
+
+
+@garage.route("/jobs/<job_id>", methods=["GET"])
+def job_info(job_id):
+    """Status of an async /control request"""
+    found = state().scheduler.get(job_id)
+    if not found:
+        return flask.jsonify({"job": job_id, "error": "Unknown job"}), 404
+    return flask.jsonify(job_status(found))
+
+
+@garage.route("/jobs/<job_id>/events", methods=["GET"])
+def job_events(job_id):
+    """Stream an async /control request's progress as Server-Sent Events"""
+    found = state().scheduler.get(job_id)
+    if not found:
+        return flask.jsonify({"job": job_id, "error": "Unknown job"}), 404
+    # Too late for a job already started, which then only sends done
+    found.watched = True
+
+    def stream():
+        for line in found.follow(timeout=15):
+            if line is None:
+                yield ": keepalive\n\n"
+            else:
+                # One data field per line, which the client joins back up
+                yield "".join(f"data: {part}\n" for part in line.split("\n")) + "\n"
+        yield f"event: done\ndata: {flask.json.dumps(job_status(found))}\n\n"
+
+    return flask.Response(
+        flask.stream_with_context(stream()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache"},
+    )
+
+
+def create_app(config=None):
+    """App factory, e.g. gunicorn -k gthread --threads 16 'garage:create_app()'
+
+    Async job ids live in the process which scheduled them, so scale with
+    threads rather than worker processes.
+    """
+    app = flask.Flask(__name__)
+    app.config["DEBUG"] = False
+    # Go through the motions without sending the radio transmission
+    app.config["DRY_RUN"] = False
+    app.config["RADIOD_SOCKET"] = garage_radiod.RADIOD_SOCKET
+    # Bursts sent at once, as many as the daemon has radios
+    app.config["TRANSMITTERS"] = 1
+    app.config.from_prefixed_env("GARAGE")
+    if config:
+        app.config.update(config)
+    app.register_blueprint(garage)
+    app.extensions["garage"] = Garage(app)
+    return app
+
+
+if __name__ == "__main__":
+    create_app().run(host="0", port="80")
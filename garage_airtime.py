@@ -0,0 +1,181 @@
+""" Air time accounting, keeping transmissions within a duty cycle """
+
+import collections
+import os
+import threading
+import time
+
+from garage_metrics import REGISTRY
+
+# EN 300 220 allows 433.05-434.79MHz transmitters a 10% duty cycle, over an hour
+DUTY_CYCLE = float(os.environ.get("GARAGE_DUTY_CYCLE", 0.1))
+DUTY_WINDOW = float(os.environ.get("GARAGE_DUTY_WINDOW", 3600))
+# Seconds on air the token bucket holds, a handful of whole pulses back to back
+AIRTIME_BURST = float(os.environ.get("GARAGE_AIRTIME_BURST", 60))
+# Longest a burst waits for air time before it is turned away
+AIRTIME_MAX_DEFER = 5.0
+
+AIRTIME_SECONDS = REGISTRY.counter(
+    "garage_airtime_seconds_total", "Seconds on air, per device", ("device",)
+)
+DECISIONS = REGISTRY.counter(
+    "garage_airtime_decisions_total",
+    "Bursts sent in full, shortened, deferred or refused for air time",
+    ("decision",),
+)
+
+
+class OverBudget(Exception):
+    """Not enough air time left, for retry_after seconds at least"""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class Reservation:
+    """Air time set aside by AirtimeBudget.reserve(), from time on"""
+
+    def __init__(self, when, seconds):
+        self.time = when
+        self.seconds = seconds
+
+
+class AirtimeBudget:
+    """A token bucket of air time, checked against a rolling duty cycle.
+
+    Tokens are seconds on air, refilling at duty_cycle per second up to burst,
+    which lets a few pulses go back to back but holds the long run average to
+    the duty cycle. Reservations are logged too, and nothing is granted which
+    would take the last window over the duty cycle, whatever the bucket holds.
+    """
+
+    def __init__(
+        self,
+        duty_cycle=DUTY_CYCLE,
+        window=DUTY_WINDOW,
+        burst=AIRTIME_BURST,
+        clock=time.monotonic,
+    ):
+        self.duty_cycle = duty_cycle
+        self.window = window
+        self.burst = burst
+        self.clock = clock
+        self.tokens = burst
+        self.used = 0.0
+        self._refilled = clock()
+        self._log = collections.deque()
+        self._changed = threading.Condition()
+
+    def _refill(self, now):
+        self.tokens = min(
+            self.tokens + (now - self._refilled) * self.duty_cycle, self.burst
+        )
+        self._refilled = now
+        while self._log and self._log[0].time <= now - self.window:
+            self.used -= self._log.popleft().seconds
+
+    def _available(self):
+        return max(min(self.tokens, self.duty_cycle * self.window - self.used), 0)
+
+    def _delay(self, seconds, now):
+        """How long until seconds are available, if nothing else is reserved"""
+        if seconds > min(self.burst, self.duty_cycle * self.window):
+            return float("inf")
+        delay = max(seconds - self.tokens, 0) / self.duty_cycle
+        # Waiting for the oldest reservations to leave the window
+        excess = self.used + seconds - self.duty_cycle * self.window
+        for reservation in self._log:
+            if excess <= 0:
+                break
+            excess -= reservation.seconds
+            delay = max(delay, reservation.time + self.window - now)
+        return delay
+
+    def reserve(self, seconds, minimum=None, max_wait=AIRTIME_MAX_DEFER):
+        """Set aside up to seconds on air, but no less than minimum (default
+        all of it), waiting up to max_wait for them. Returns a Reservation for
+        what was granted, to settle() once its real air time is known."""
+        minimum = seconds if minimum is None else min(minimum, seconds)
+        deadline = self.clock() + max_wait
+        deferred = False
+        with self._changed:
+            while True:
+                now = self.clock()
+                self._refill(now)
+                available = self._available()
+                if available >= minimum:
+                    break
+                delay = self._delay(minimum, now)
+                if now + delay > deadline:
+                    DECISIONS.labels("refused").inc()
+                    raise OverBudget(
+                        f"Over the {self.duty_cycle:.0%} air time budget, "
+                        f"{available:.1f}s of the {minimum:.1f}s needed left",
+                        delay,
+                    )
+                deferred = True
+                self._changed.wait(delay)
+            reservation = Reservation(now, min(seconds, available))
+            self.tokens -= reservation.seconds
+            self.used += reservation.seconds
+            self._log.append(reservation)
+        if deferred:
+            DECISIONS.labels("deferred").inc()
+        decision = "full" if reservation.seconds >= seconds else "shortened"
+        DECISIONS.labels(decision).inc()
+        return reservation
+
+    def settle(self, reservation, seconds):
+        """Charge a reservation what it really used, handing back the rest"""
+        with self._changed:
+            unused = reservation.seconds - seconds
+            reservation.seconds = seconds
+            if any(logged is reservation for logged in self._log):
+                self.used -= unused
+            self.tokens = min(self.tokens + unused, self.burst)
+            self._changed.notify_all()
+
+    def status(self):
+        """What's left and what's been used, as a dict"""
+        with self._changed:
+            self._refill(self.clock())
+            return {
+                "duty_cycle": self.duty_cycle,
+                "window": self.window,
+                "used": round(self.used, 3),
+                "tokens": round(self.tokens, 3),
+                "available": round(self._available(), 3),
+            }
+
+
+class UnlimitedBudget:
+    """An AirtimeBudget which grants everything at once, only keeping count,
+    for benchmarks and tests on the simulated radio"""
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self.used = 0.0
+        self._lock = threading.Lock()
+
+    def reserve(self, seconds, minimum=None, max_wait=AIRTIME_MAX_DEFER):
+        # pylint: disable=unused-argument
+        with self._lock:
+            self.used += seconds
+        DECISIONS.labels("full").inc()
+        return Reservation(self.clock(), seconds)
+
+    def settle(self, reservation, seconds):
+        with self._lock:
+            self.used += seconds - reservation.seconds
+            reservation.seconds = seconds
+
+    def status(self):
+        with self._lock:
+            return {
+                "duty_cycle": None,
+                "window": None,
+                "used": round(self.used, 3),
+                "tokens": None,
+                "available": None,
+            }
@@ -0,0 +1,188 @@
+#!/usr/bin/python3
+""" Offline analyzer for garage_capfile recordings.
+
+Edge captures are split into bursts of activity, their symbol time is
+estimated and frames decoded, through the same pipeline garage_capture runs
+live. RSSI captures get level statistics and the periods spent above the
+noise floor. Files are read through mmap a chunk at a time, so recordings
+far bigger than memory are fine.
+"""
+
+import argparse
+import collections
+import datetime
+
+import numpy as np
+
+import garage_capfile
+import garage_capture
+
+# Records handled per step, bounding memory whatever the file size
+ANALYZE_CHUNK = 1 << 22
+# Quiet for this long between edges ends a burst
+BURST_GAP_US = 250000
+# RSSI this far above the median counts as activity
+RSSI_MARGIN_DB = 10
+
+# A burst of edges, between the first and last edge, ns
+Burst = collections.namedtuple("Burst", "start_ns end_ns edges")
+
+
+def chunks(records, size=ANALYZE_CHUNK):
+    """(times, values) views of records, size at a time"""
+    for start in range(0, len(records), size):
+        block = records[start : start + size]
+        yield block["t"], block["value"]
+
+
+def bursts(records, gap_us=BURST_GAP_US, size=ANALYZE_CHUNK):
+    """Split edges into Bursts wherever they are more than gap_us apart"""
+    gap_ns = gap_us * 1000
+    start = last = None
+    edges = 0
+    for times, _ in chunks(records, size):
+        if last is None:
+            joined, offset, start = times, 0, times[0]
+        else:
+            # Look for a gap from the previous chunk's last edge too
+            joined, offset = np.concatenate(([last], times)), 1
+        position = 0
+        for index in np.flatnonzero(np.diff(joined) > gap_ns):
+            edges += index - offset + 1 - position
+            yield Burst(start, joined[index], edges)
+            start, edges, position = joined[index + 1], 0, index - offset + 1
+        edges += len(times) - position
+        last = times[-1]
+    if start is not None:
+        yield Burst(start, last, edges)
+
+
+def symbol_estimate(frames):
+    """Symbol time over all frames, weighted by their length: (mean, stdev)"""
+    if not frames:
+        return float("nan"), float("nan")
+    units = np.array([frame.symbol_us for frame in frames])
+    weights = np.array([len(frame.symbols) for frame in frames])
+    mean = np.average(units, weights=weights)
+    return mean, float(np.sqrt(np.average((units - mean) ** 2, weights=weights)))
+
+
+def wall_clock(header, t_ns):
+    return datetime.datetime.fromtimestamp((header.epoch_ns + int(t_ns)) / 1e9)
+
+
+def analyze_edges(header, records, args):
+    found = list(bursts(records, args.burst_gap_us))
+    decoded = list(
+        garage_capture.symbols(
+            garage_capture.frames(garage_capture.pulses(chunks(records)), args.gap_us),
+            symbol_us=args.symbol_us,
+        )
+    )
+    starts = np.array([burst.start_ns for burst in found], dtype=np.int64)
+    per_burst = collections.defaultdict(list)
+    for frame in decoded:
+        per_burst[max(np.searchsorted(starts, frame.start_ns, "right") - 1, 0)].append(
+            frame
+        )
+
+    print(f"[+] {len(found)} bursts")
+    for index, burst in enumerate(found):
+        framed = per_burst.get(index, [])
+        codes = collections.Counter(frame.symbols for frame in framed)
+        line = (
+            f"  - {wall_clock(header, burst.start_ns):%Y-%m-%d %H:%M:%S.%f}"
+            f"  {(burst.end_ns - burst.start_ns) / 1e9:8.3f}s"
+            f"  {burst.edges:7} edges  {len(framed):4} frames"
+        )
+        if codes:
+            line += f"  {codes.most_common(1)[0][0]}"
+        print(line)
+
+    mean, stdev = symbol_estimate(decoded)
+    print(
+        f"[+] Symbol time {mean:.1f}us (+/- {stdev:.1f}us) over {len(decoded)} frames"
+    )
+    print("[+] Codes")
+    for code, count in collections.Counter(f.symbols for f in decoded).most_common(
+        args.top
+    ):
+        print(f"  - {count:6}x {code}")
+
+
+def analyze_rssi(header, records, args):
+    # Raw values are -dBm * 2, so reduce them as integers and convert after
+    counts = np.zeros(256, dtype=np.int64)
+    for _, values in chunks(records):
+        counts += np.bincount(values, minlength=256)
+    levels = -np.arange(256) / 2
+    total = counts.sum()
+    cumulative = np.cumsum(counts[::-1])
+    percentile = {
+        name: levels[::-1][np.searchsorted(cumulative, fraction * total)]
+        for name, fraction in (("p5", 0.05), ("p50", 0.5), ("p95", 0.95))
+    }
+    print(
+        f"[+] RSSI min {levels[np.flatnonzero(counts)[-1]]}dBm, "
+        f"max {levels[np.flatnonzero(counts)[0]]}dBm, "
+        f"mean {np.average(levels, weights=counts):.1f}dBm, "
+        + ", ".join(f"{name} {value}dBm" for name, value in percentile.items())
+    )
+
+    # Periods above the noise floor, as runs of samples over the threshold
+    threshold = percentile["p50"] + args.margin
+    active = []
+    start = last = None
+    for times, values in chunks(records):
+        above = levels[values] > threshold
+        edges = np.flatnonzero(np.diff(above.astype(np.int8), prepend=0, append=0))
+        for begin, end in zip(edges[::2], edges[1::2]):
+            if start is not None and begin == 0:
+                # Carries on from the end of the previous chunk
+                last = times[end - 1]
+            else:
+                if start is not None:
+                    active.append((start, last))
+                start, last = times[begin], times[end - 1]
+            if end < len(times):
+                active.append((start, last))
+                start = None
+    if start is not None:
+        active.append((start, last))
+    print(f"[+] {len(active)} periods above {threshold}dBm")
+    for begin, end in active[: args.top]:
+        print(
+            f"  - {wall_clock(header, begin):%Y-%m-%d %H:%M:%S.%f}"
+            f"  {(end - begin) / 1e9:8.3f}s"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("files", nargs="+")
+    parser.add_argument("--symbol-us", type=float, help="default, estimate it")
+    parser.add_argument("--gap-us", type=float, help="default, from the pulses")
+    parser.add_argument("--burst-gap-us", type=float, default=BURST_GAP_US)
+    parser.add_argument("--margin", type=float, default=RSSI_MARGIN_DB)
+    parser.add_argument("--top", type=int, default=10, help="how many to list")
+    args = parser.parse_args()
+
+    for path in args.files:
+        header, records = garage_capfile.open_capture(path)
+        span = (records["t"][-1] - records["t"][0]) / 1e9 if len(records) else 0
+        kind = {garage_capfile.KIND_EDGES: "edges", garage_capfile.KIND_RSSI: "rssi"}
+        print(
+            f"[*] {path}: {kind.get(header.kind, header.kind)}, {header.count} records"
+            f" over {span:.1f}s, {header.carrier}Hz, {header.bitrate:.0f}bps"
+            + (f", {header.note}" if header.note else "")
+        )
+        if not len(records):
+            continue
+        if header.kind == garage_capfile.KIND_EDGES:
+            analyze_edges(header, records, args)
+        elif header.kind == garage_capfile.KIND_RSSI:
+            analyze_rssi(header, records, args)
+
+
+if __name__ == "__main__":
+    main()
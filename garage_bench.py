@@ -0,0 +1,263 @@
+#!/usr/bin/python3
+""" Benchmark the press-to-RF path against the simulated radio.
+
+Each phase, from HTTP handling in control() down to a single FIFO write, is
+a case timed over many rounds, reporting p50/p95/p99 and throughput. Save a
+baseline with --save, later runs with --compare fail on regressions.
+Concurrent runs (--clients) are kept as separate baseline entries.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import threading
+import time
+
+import garage_airtime
+import garage_log
+import garage_ook
+import garage_radiod
+import garage_rfm69
+import garage_stream
+
+BENCH_BASELINE = "bench_baseline.json"
+# How much slower than the baseline p50 a case may get before it fails
+BENCH_TOLERANCE = 0.25
+
+CASES = {}
+
+
+def case(name, concurrent=False):
+    """Register a benchmark case, a function taking the Environment and
+    returning the callable to time. Only concurrent cases are safe to run
+    from several clients at once, the rest drive the radio directly."""
+
+    def register(func):
+        CASES[name] = (func, concurrent)
+        return func
+
+    return register
+
+
+class Environment:
+    """A simulated radio, a daemon serving it, and the web app if Flask is here"""
+
+    def __init__(self, time_scale):
+        self.time_scale = time_scale
+        os.environ["GARAGE_SIM_TIME_SCALE"] = str(time_scale)
+        self.radio = garage_rfm69.open_radio("sim")
+        self.socket = os.path.join(tempfile.mkdtemp(), "radiod.sock")
+        # Unlimited air time, so cases time the path to the radio rather than
+        # the duty cycle's waits
+        self.server = garage_radiod.RadioServer(
+            self.socket,
+            [self.radio],
+            garage_rfm69,
+            budget=garage_airtime.UnlimitedBudget(),
+        )
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.client = garage_radiod.RadiodClient(self.socket)
+        try:
+            import garage  # pylint: disable=import-outside-toplevel
+        except ImportError as err:
+            print(f"[!] Skipping HTTP cases, {err}")
+            self.app = None
+        else:
+            self.app = garage.create_app({"RADIOD_SOCKET": self.socket})
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.client.close()
+        self.radio.shutdown()
+        garage_rfm69.release_radio(self.radio)
+
+
+@case("payload.compile")
+def bench_payload_compile(env):
+    compile_waveform = garage_ook.compile_waveform.__wrapped__
+    args = (
+        garage_rfm69.GARAGE_SYMBOLS,
+        garage_rfm69.GARAGE_SYMBOL_US,
+        garage_rfm69.GARAGE_GAP_US,
+        garage_rfm69.GARAGE_STREAM_REPEATS,
+        garage_rfm69.GARAGE_BITRATE,
+        garage_rfm69.GARAGE_LEAD_US,
+    )
+    return lambda: compile_waveform(*args)
+
+
+@case("payload.cached")
+def bench_payload_cached(env):
+    args = (
+        garage_rfm69.GARAGE_SYMBOLS,
+        garage_rfm69.GARAGE_SYMBOL_US,
+        garage_rfm69.GARAGE_GAP_US,
+        garage_rfm69.GARAGE_STREAM_REPEATS,
+        garage_rfm69.GARAGE_BITRATE,
+        garage_rfm69.GARAGE_LEAD_US,
+    )
+    return lambda: garage_ook.compile_waveform(*args)
+
+
+@case("radio.init")
+def bench_radio_init(env):
+    def init():
+        radio = garage_rfm69.open_radio("sim")
+        radio.shutdown()
+        garage_rfm69.release_radio(radio)
+
+    return init
+
+
+@case("register_setup.cold")
+def bench_register_setup_cold(env):
+    def setup():
+        env.radio._reset()
+        garage_rfm69.register_setup(env.radio)
+
+    return setup
+
+
+@case("register_setup.warm")
+def bench_register_setup_warm(env):
+    return lambda: garage_rfm69.register_setup(env.radio)
+
+
+@case("register.snapshot")
+def bench_register_snapshot(env):
+    return lambda: garage_rfm69.register_snapshot(env.radio)
+
+
+@case("send.fifo_write")
+def bench_fifo_write(env):
+    payload = garage_rfm69.waveform(garage_rfm69.GARAGE_STREAM_REPEATS).payload
+    chunk = payload[: garage_stream.FIFO_REFILL]
+
+    def write():
+        garage_stream.fifo_write(env.radio, chunk)
+        # Empty it again, so the next round doesn't overrun
+        env.radio._writeReg(garage_rfm69.REG_IRQFLAGS2, 0x10)
+
+    return write
+
+
+@case("send.packet")
+def bench_send_packet(env):
+    garage_rfm69.register_setup(env.radio)
+    return lambda: env.radio.send(False, garage_rfm69.waveform().payload, attempts=1)
+
+
+@case("send.stream")
+def bench_send_stream(env):
+    garage_rfm69.register_setup(env.radio)
+    return lambda: garage_rfm69.transmit(env.radio)
+
+
+@case("dispatch.pulse", concurrent=True)
+def bench_dispatch(env):
+    return lambda: env.client.request({"cmd": "pulse", "dry_run": True})
+
+
+@case("http.control", concurrent=True)
+def bench_http(env):
+    if not env.app:
+        return None
+    client = env.app.test_client()
+    return lambda: client.get("/control?cmd=Pulse")
+
+
+def measure(func, rounds, clients):
+    """Time rounds calls of func on each of clients threads"""
+    timings = []
+    lock = threading.Lock()
+
+    def worker():
+        mine = []
+        for _ in range(rounds):
+            start = time.perf_counter()
+            func()
+            mine.append(time.perf_counter() - start)
+        with lock:
+            timings.extend(mine)
+
+    threads = [threading.Thread(target=worker) for _ in range(clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    timings.sort()
+    return {
+        "rounds": len(timings),
+        "p50": statistics.median(timings),
+        "p95": timings[int(0.95 * (len(timings) - 1))],
+        "p99": timings[int(0.99 * (len(timings) - 1))],
+        "ops": len(timings) / elapsed,
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Names of cases whose p50 regressed past tolerance"""
+    return [
+        name
+        for name, result in results.items()
+        if name in baseline
+        and result["p50"] > baseline[name]["p50"] * (1 + tolerance)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("cases", nargs="*", help="case name prefixes, default all")
+    parser.add_argument("-r", "--rounds", type=int, default=200)
+    parser.add_argument("-c", "--clients", type=int, default=1)
+    parser.add_argument("--time-scale", type=float, default=0)
+    parser.add_argument("--baseline", default=BENCH_BASELINE)
+    parser.add_argument("--save", action="store_true", help="store as the baseline")
+    parser.add_argument("--compare", action="store_true", help="fail on regression")
+    parser.add_argument("--tolerance", type=float, default=BENCH_TOLERANCE)
+    args = parser.parse_args()
+
+    env = Environment(args.time_scale)
+    # Only warnings from the radio code, between the results
+    garage_log.CONSOLE.level = garage_log.WARNING
+    results = {}
+    try:
+        for name, (setup, concurrent) in CASES.items():
+            if args.cases and not name.startswith(tuple(args.cases)):
+                continue
+            func = setup(env)
+            if func is None:
+                continue
+            clients = args.clients if concurrent else 1
+            if clients > 1:
+                name = f"{name} x{clients}"
+            results[name] = result = measure(func, args.rounds, clients)
+            print(
+                f"{name:24} p50 {result['p50'] * 1e6:10.1f}us"
+                f"  p95 {result['p95'] * 1e6:10.1f}us"
+                f"  p99 {result['p99'] * 1e6:10.1f}us"
+                f"  {result['ops']:10.1f} ops/s"
+            )
+    finally:
+        env.close()
+
+    if args.save:
+        with open(args.baseline, "w", encoding="utf-8") as baseline:
+            json.dump(results, baseline, indent=2)
+        print(f"[+] Saved baseline to {args.baseline}")
+    if args.compare:
+        with open(args.baseline, encoding="utf-8") as baseline:
+            regressed = compare(results, json.load(baseline), args.tolerance)
+        for name in regressed:
+            print(f"[!] {name} regressed beyond {args.tolerance:.0%}")
+        if regressed:
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+#!/usr/bin/python3
+""" Carrier calibration, sweeping the receiver across the garage carrier while
+the reference remote is held down, to find where its signal peaks.
+
+Each step tunes RegFrf and samples RSSI and FEI for a dwell time. The
+remote's marks are the loudest samples, so a step scores a high percentile
+of its RSSI, and a parabola through the best step and its neighbours puts
+the peak between steps. FEI from the best step gives a second opinion. With
+--save the offset from the nominal carrier is kept for the device, and
+garage_rfm69 tunes to it at startup.
+"""
+
+import argparse
+import collections
+import datetime
+import itertools
+import time
+
+import numpy as np
+
+import garage_ook
+import garage_rfm69
+import garage_telemetry
+from garage_registers import RF69_MODE_RX, RF69_MODE_STANDBY
+
+# Either side of the nominal carrier to sweep, and the step, Hz
+CALIBRATE_SPAN_HZ = 30000
+CALIBRATE_STEP_HZ = 2000
+# Seconds listening at each step, enough for a few of the remote's frames
+CALIBRATE_DWELL = 0.5
+# RSSI and FEI samples per second
+CALIBRATE_RATE = 200
+# RSSI percentile a step scores, high enough to land on marks not gaps
+CALIBRATE_PERCENTILE = 90
+# Steps must peak this far over the sweep's median RSSI to count as a signal,
+# and FEI is only taken from samples this loud
+SIGNAL_MARGIN_DB = 10
+
+# One step of the sweep: its offset from the nominal carrier, RSSI score,
+# median FEI of the loud samples (nan if none were) and sample count
+Step = collections.namedtuple("Step", "offset rssi fei samples")
+
+
+def listen(radio, carrier, dwell=CALIBRATE_DWELL, rate=CALIBRATE_RATE):
+    """Tune to carrier and return garage_telemetry sample rows for dwell"""
+    radio._setMode(RF69_MODE_STANDBY)
+    garage_rfm69.register_write(radio, garage_rfm69.frequency_registers(carrier))
+    radio._setMode(RF69_MODE_RX)
+    rows = []
+    due = time.monotonic()
+    end = due + dwell
+    while due < end:
+        due += 1 / rate
+        time.sleep(max(due - time.monotonic(), 0))
+        rows.append(garage_telemetry.sample(radio, trigger_fei=True))
+    # The first FEI was measured before tuning here
+    return rows[1:]
+
+
+def sweep(radio, carrier, span=CALIBRATE_SPAN_HZ, step=CALIBRATE_STEP_HZ, **kwargs):
+    """{offset: sample rows} for each step from carrier - span to carrier + span"""
+    sweeps = {}
+    for offset in range(-span, span + 1, step):
+        sweeps[offset] = listen(radio, carrier + offset, **kwargs)
+    return sweeps
+
+
+def score(sweeps, percentile=CALIBRATE_PERCENTILE, margin=SIGNAL_MARGIN_DB):
+    """Steps for each offset of a sweep, and the RSSI floor they were judged on"""
+    rssi = garage_telemetry.FIELD_NAMES.index("rssi")
+    fei = garage_telemetry.FIELD_NAMES.index("fei")
+    floor = float(np.median([row[rssi] for rows in sweeps.values() for row in rows]))
+    steps = []
+    for offset, rows in sorted(sweeps.items()):
+        samples = np.array([(row[rssi], row[fei]) for row in rows]).reshape(-1, 2)
+        # Each sample's FEI was measured when the one before triggered it
+        loud = samples[1:, 1][samples[:-1, 0] >= floor + margin]
+        steps.append(
+            Step(
+                offset,
+                float(np.percentile(samples[:, 0], percentile)),
+                float(np.median(loud)) if len(loud) else float("nan"),
+                len(samples),
+            )
+        )
+    return steps, floor
+
+
+def peak(steps, floor, margin=SIGNAL_MARGIN_DB):
+    """(offset, rssi, fei_offset) of the strongest signal, fei_offset being
+    where FEI at the best step puts it. Raises ValueError if nothing was heard."""
+    scores = np.array([step.rssi for step in steps])
+    best = int(np.argmax(scores))
+    if scores[best] < floor + margin:
+        raise ValueError(
+            f"No signal {margin}dB over the {floor:.1f}dBm floor, "
+            "was the remote held down?"
+        )
+    offset = float(steps[best].offset)
+    if 0 < best < len(steps) - 1:
+        left, middle, right = scores[best - 1 : best + 2]
+        curve = left - 2 * middle + right
+        if curve < 0:
+            width = steps[best + 1].offset - steps[best].offset
+            offset += 0.5 * (left - right) / curve * width
+    # FEI is how far the signal is from where we listened
+    return offset, float(scores[best]), steps[best].offset + steps[best].fei
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--device", default=garage_rfm69.GARAGE_DEVICE)
+    parser.add_argument("--span", type=int, default=CALIBRATE_SPAN_HZ)
+    parser.add_argument("--step", type=int, default=CALIBRATE_STEP_HZ)
+    parser.add_argument("--dwell", type=float, default=CALIBRATE_DWELL)
+    parser.add_argument("--rate", type=float, default=CALIBRATE_RATE)
+    parser.add_argument(
+        "--use-fei",
+        action="store_true",
+        help="save where FEI puts the carrier rather than the RSSI peak",
+    )
+    parser.add_argument("--save", action="store_true", help="keep the offset found")
+    parser.add_argument(
+        "--replay",
+        type=float,
+        nargs="?",
+        const=0.0,
+        metavar="HZ",
+        help="play our own signal this far off the carrier to a simulated "
+        "radio (GARAGE_RADIO=sim)",
+    )
+    args = parser.parse_args()
+
+    carrier = garage_rfm69.GARAGE_CARRIER
+    steps_count = 2 * args.span // args.step + 1
+    with garage_rfm69.open_radio() as radio:
+        garage_rfm69.register_setup(radio)
+        if args.replay is not None:
+            frame = garage_ook.waveform_runs(garage_rfm69.waveform())
+            airtime = garage_rfm69.waveform().airtime
+            repeats = int(steps_count * (args.dwell + 0.1) / airtime) + 1
+            radio.inject_ook(
+                itertools.chain.from_iterable(itertools.repeat(frame, repeats)),
+                carrier=carrier + args.replay,
+            )
+        print(
+            f"[*] Hold the remote down, sweeping {carrier}Hz +/-{args.span}Hz "
+            f"in {steps_count} steps of {args.dwell}s..."
+        )
+        try:
+            sweeps = sweep(
+                radio,
+                carrier,
+                args.span,
+                args.step,
+                dwell=args.dwell,
+                rate=args.rate,
+            )
+        finally:
+            radio._setMode(RF69_MODE_STANDBY)
+            garage_rfm69.release_radio(radio)
+
+    steps, floor = score(sweeps)
+    top = max(step.rssi for step in steps)
+    for step in steps:
+        bar = "#" * max(int(step.rssi - floor), 0)
+        fei = "" if np.isnan(step.fei) else f"  FEI {step.fei:+7.0f}Hz"
+        print(
+            f"  {step.offset:+7}Hz {step.rssi:7.1f}dBm {bar:<{int(top - floor)}}{fei}"
+        )
+    try:
+        offset, rssi, fei_offset = peak(steps, floor)
+    except ValueError as error:
+        raise SystemExit(f"[!] {error}") from error
+    print(f"[+] RSSI peaks at {offset:+.0f}Hz, {rssi:.1f}dBm")
+    if not np.isnan(fei_offset):
+        print(f"[+] FEI puts the carrier at {fei_offset:+.0f}Hz")
+    chosen = fei_offset if args.use_fei and not np.isnan(fei_offset) else offset
+    print(
+        f"[+] Calibrated carrier {carrier + round(chosen)}Hz ({round(chosen):+}Hz), "
+        f"currently {garage_rfm69.carrier_offset():+}Hz"
+    )
+    if args.save:
+        garage_rfm69.save_calibration(
+            args.device,
+            {
+                "offset": round(chosen),
+                "carrier": carrier,
+                "rssi": round(rssi, 1),
+                "fei_offset": None if np.isnan(fei_offset) else round(fei_offset),
+                "time": datetime.datetime.now().isoformat(timespec="seconds"),
+            },
+        )
+        print(f"[+] Saved for {args.device} to {garage_rfm69.CALIBRATION_FILE}")
+
+
+if __name__ == "__main__":
+    main()
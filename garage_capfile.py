@@ -0,0 +1,105 @@
+""" Capture files: a fixed header, then packed (time, value) records.
+
+Layout, all little endian:
+
+    0   4s  magic b"GCAP"
+    4   H   version
+    6   H   kind, KIND_EDGES (value is the DIO2 level after the edge)
+            or KIND_RSSI (value is RegRssiValue, -dBm * 2)
+    8   q   epoch, ns to add to record times for ns since the Unix epoch
+    16  I   carrier, Hz
+    20  f   bitrate, bps
+    24  Q   record count, 0 until the writer is closed
+    32  32s free text note, NUL padded
+    64  ... records: q time in ns (e.g. monotonic, see epoch), B value
+
+Records are 9 bytes with no padding, so the body maps straight onto a NumPy
+structured array through mmap, and nothing is read until it is used.
+"""
+
+import collections
+import mmap
+import struct
+import time
+
+import numpy as np
+
+CAPFILE_MAGIC = b"GCAP"
+CAPFILE_VERSION = 1
+KIND_EDGES = 1
+KIND_RSSI = 2
+
+HEADER = struct.Struct("<4sHHqIfQ32s")
+HEADER_SIZE = 64
+RECORD = np.dtype([("t", "<i8"), ("value", "u1")])
+
+Header = collections.namedtuple(
+    "Header", "version kind epoch_ns carrier bitrate count note"
+)
+
+
+class CaptureWriter:
+    """Append records to a new capture file, finishing the header on close.
+
+    Times default to being time.monotonic_ns(), pass epoch_ns=0 for ones
+    which are already wall clock.
+    """
+
+    def __init__(self, path, kind, carrier=0, bitrate=0.0, note="", epoch_ns=None):
+        if epoch_ns is None:
+            epoch_ns = time.time_ns() - time.monotonic_ns()
+        self.file = open(path, "wb")  # pylint: disable=consider-using-with
+        self.header = Header(CAPFILE_VERSION, kind, epoch_ns, carrier, bitrate, 0, note)
+        self.count = 0
+        self._write_header()
+
+    def _write_header(self):
+        self.file.seek(0)
+        self.file.write(
+            HEADER.pack(
+                CAPFILE_MAGIC,
+                *self.header[:-2],
+                self.count,
+                self.header.note.encode()[:32],
+            ).ljust(HEADER_SIZE, b"\0")
+        )
+        self.file.seek(0, 2)
+
+    def write(self, times, values):
+        """Append arrays of ns timestamps and values"""
+        records = np.empty(len(times), dtype=RECORD)
+        records["t"] = times
+        records["value"] = values
+        self.file.write(records.tobytes())
+        self.count += len(records)
+
+    def close(self):
+        if not self.file.closed:
+            self._write_header()
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def open_capture(path):
+    """(Header, records) for a capture file, records being a read-only
+    structured array straight over an mmap of the file"""
+    with open(path, "rb") as file:
+        size = file.seek(0, 2)
+        if size < HEADER_SIZE:
+            raise ValueError(f"{path} is too short for a capture file")
+        mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    magic, *fields, note = HEADER.unpack_from(mapped)
+    if magic != CAPFILE_MAGIC:
+        raise ValueError(f"{path} is not a capture file")
+    header = Header(*fields, note.rstrip(b"\0").decode(errors="replace"))
+    if header.version != CAPFILE_VERSION:
+        raise ValueError(f"{path} is capture file version {header.version}")
+    # A writer which never closed leaves the count at 0, trust the length
+    count = header.count or (size - HEADER_SIZE) // RECORD.itemsize
+    records = np.frombuffer(mapped, dtype=RECORD, count=count, offset=HEADER_SIZE)
+    return header._replace(count=count), records
@@ -0,0 +1,317 @@
+#!/usr/bin/python3
+""" Continuous mode OOK capture from DIO2, decoded by a NumPy generator pipeline.
+
+In continuous mode without the bit synchronizer, the RFM69 puts the
+demodulated OOK signal straight out on DIO2. EdgeCapture timestamps every
+edge into a preallocated ring from the GPIO callback, then each stage below
+is a generator over the previous one's NumPy blocks:
+
+    edge_blocks -> pulses -> frames -> symbols
+
+turning edges into (level, duration, start) runs, runs into frames split on the
+pause between repeats, and frames into the symbol pattern. A None passes
+down the pipeline whenever edges were dropped, so stages start afresh.
+"""
+
+import argparse
+import array
+import collections
+import time
+
+import numpy as np
+
+import garage_capfile
+import garage_ook
+import garage_rfm69
+from garage_log import LOG
+from garage_registers import (
+    REG_DATAMODUL,
+    RF_DATAMODUL_DATAMODE_CONTINUOUSNOBSYNC,
+    RF_DATAMODUL_MODULATIONSHAPING_00,
+    RF_DATAMODUL_MODULATIONTYPE_OOK,
+    RF69_MODE_RX,
+    RF69_MODE_STANDBY,
+)
+
+# Edges held by the ring, a power of two. At the bitrate's worst case of an
+# edge per 700us symbol, that is 45s of backlog before any are dropped.
+CAPTURE_EDGES = 1 << 16
+# How often edge_blocks() looks for new edges
+CAPTURE_POLL = 0.01
+# A low run this many times the typical high run ends a frame. The garage's
+# highs last a symbol or two and it pauses for 35, whatever the time base.
+FRAME_GAP_RUNS = 8
+# Runs kept waiting for a gap, beyond that it is noise and the oldest go
+FRAME_MAX_RUNS = 4096
+# Frames with fewer runs than this are noise
+FRAME_MIN_RUNS = 8
+# Worst mean distance of run lengths from whole symbols for a frame to count
+SYMBOL_TOLERANCE = 0.2
+
+# Replacing what the garage's register groups set them to, see capture_groups()
+CAPTURE_REGISTERS = (
+    (
+        "Setting continuous mode receive, OOK, without bit synchronizer",
+        {
+            REG_DATAMODUL: RF_DATAMODUL_DATAMODE_CONTINUOUSNOBSYNC
+            | RF_DATAMODUL_MODULATIONTYPE_OOK
+            | RF_DATAMODUL_MODULATIONSHAPING_00
+        },
+    ),
+)
+
+# A decoded frame: its symbols, the symbol time used, how far the run lengths
+# were from whole symbols on average (0 is perfect, 0.5 is noise), and the
+# edge timestamp it started on
+Frame = collections.namedtuple("Frame", "symbols symbol_us error start_ns")
+
+
+class EdgeCapture:
+    """Timestamp every edge on a pin into a preallocated ring.
+
+    The callback runs on the GPIO library's thread and only stores the time
+    and level, readers notice new edges by count going up.
+    """
+
+    def __init__(self, gpio, pin, capacity=CAPTURE_EDGES):
+        if capacity & (capacity - 1):
+            raise ValueError(f"Capture capacity must be a power of two: {capacity}")
+        self.gpio = gpio
+        self.pin = pin
+        self.capacity = capacity
+        self.times = array.array("q", bytes(8 * capacity))
+        self.levels = bytearray(capacity)
+        self.count = 0
+        self.running = True
+        try:
+            gpio.add_event_detect(pin, gpio.BOTH, callback=self._edge)
+            self._detecting = True
+        except RuntimeError:
+            # garage_events already watches it, so share its detection
+            gpio.add_event_callback(pin, self._edge)
+            self._detecting = False
+
+    def _edge(self, pin):
+        if not self.running:
+            return
+        index = self.count & (self.capacity - 1)
+        self.times[index] = time.monotonic_ns()
+        self.levels[index] = self.gpio.input(pin)
+        self.count += 1
+
+    def close(self):
+        # A shared detection can't drop a single callback, so it goes quiet
+        self.running = False
+        if self._detecting:
+            self.gpio.remove_event_detect(self.pin)
+
+
+def edge_blocks(capture, until=None, poll=CAPTURE_POLL):
+    """Yield (times_ns, levels) arrays of new edges, until the monotonic
+    time until or the capture closes"""
+    times = np.frombuffer(capture.times, dtype=np.int64)
+    levels = np.frombuffer(capture.levels, dtype=np.uint8)
+    mask = capture.capacity - 1
+    seen = start = capture.count
+    while True:
+        finished = not capture.running or (until and time.monotonic() > until)
+        count = capture.count
+        if count - seen > capture.capacity:
+            LOG.warning("Dropped {edges} edges", edges=count - seen - capture.capacity)
+            seen = count - capture.capacity
+            yield None
+        if count > seen:
+            index = np.arange(seen, count) & mask
+            yield times[index], levels[index]
+            seen = count
+        if finished:
+            if seen > start:
+                # Close the last run as the capture ends, so it has a length
+                last = levels[(seen - 1) & mask] ^ 1
+                yield np.array([time.monotonic_ns()]), np.array([last], np.uint8)
+            return
+        time.sleep(poll)
+
+
+def pulses(blocks):
+    """Turn edge blocks into (levels, durations_us, starts_ns) runs"""
+    last = None
+    for block in blocks:
+        if block is None:
+            last = None
+            yield None
+            continue
+        times, levels = block
+        if last is not None:
+            times = np.concatenate(([last[0]], times))
+            levels = np.concatenate(([last[1]], levels))
+        last = times[-1], levels[-1]
+        if len(times) < 2:
+            continue
+        durations = np.diff(times) / 1000
+        levels = levels[:-1]
+        # Edges closer together than the callback can read the pin may
+        # repeat a level, so merge runs of the same level
+        starts = np.flatnonzero(np.diff(levels.astype(np.int8), prepend=-1))
+        yield levels[starts], np.add.reduceat(durations, starts), times[starts]
+
+
+def frames(runs, gap_us=None):
+    """Collect runs into (levels, durations_us, starts_ns) frames, split on low
+    runs of at least gap_us, which are left out along with any leading low.
+    Without gap_us, it is FRAME_GAP_RUNS times the median high run so far."""
+    empty = (np.empty(0, np.uint8), np.empty(0), np.empty(0, np.int64))
+    pending = empty
+    for block in runs:
+        if block is None:
+            pending = empty
+            continue
+        pending = tuple(np.concatenate(pair) for pair in zip(pending, block))
+        levels, durations, _ = pending
+        gap = gap_us
+        if not gap:
+            highs = durations[levels != 0]
+            gap = FRAME_GAP_RUNS * np.median(highs) if len(highs) else np.inf
+        gaps = np.flatnonzero((levels == 0) & (durations >= gap))
+        start = 0
+        for gap in gaps:
+            frame = tuple(column[start:gap] for column in pending)
+            start = gap + 1
+            if frame[0].any():
+                first = np.argmax(frame[0])
+                yield tuple(column[first:] for column in frame)
+        pending = tuple(column[start:][-FRAME_MAX_RUNS:] for column in pending)
+
+
+def symbols(framed, symbol_us=None, tolerance=SYMBOL_TOLERANCE):
+    """Recover each frame's symbols, by the whole number of symbol_us each
+    run lasts. Without symbol_us, it is estimated per frame."""
+    for levels, durations, starts in framed:
+        if len(levels) < FRAME_MIN_RUNS:
+            continue
+        unit = symbol_us
+        if not unit:
+            # Guess from the shorter runs, then refine over the whole frame,
+            # where the jitter on each edge cancels out
+            unit = np.percentile(durations, 25)
+            unit = durations.sum() / np.maximum(np.rint(durations / unit), 1).sum()
+        counts = np.maximum(np.rint(durations / unit), 1).astype(np.int64)
+        error = float(np.mean(np.abs(durations / unit - counts)))
+        if error > tolerance:
+            continue
+        bits = np.repeat(levels, counts) + ord("0")
+        yield Frame(
+            bits.astype(np.uint8).tobytes().decode(), float(unit), error, starts[0]
+        )
+
+
+def record(blocks, writer):
+    """Pass edge blocks through, appending them to a garage_capfile writer"""
+    for block in blocks:
+        if block is not None:
+            writer.write(*block)
+        yield block
+
+
+def decode(capture, until=None, symbol_us=None, gap_us=None, writer=None):
+    """The whole pipeline, yielding a Frame for each repeat received"""
+    blocks = edge_blocks(capture, until)
+    if writer:
+        blocks = record(blocks, writer)
+    return symbols(frames(pulses(blocks), gap_us), symbol_us=symbol_us)
+
+
+def capture_groups(groups=None):
+    """Register groups (by default the garage's) with CAPTURE_REGISTERS in
+    place of the registers they set, so each is written once, and groups left
+    empty go"""
+    if groups is None:
+        groups = garage_rfm69.garage().groups
+    captured = set().union(*(registers for _, registers in CAPTURE_REGISTERS))
+    merged = []
+    for description, registers in groups:
+        registers = {
+            reg: value for reg, value in registers.items() if reg not in captured
+        }
+        if registers:
+            merged.append((description, registers))
+    return tuple(merged) + CAPTURE_REGISTERS
+
+
+def capture(radio):
+    """Switch a radio from open_radio() to continuous OOK receive, capturing DIO2"""
+    garage_rfm69.register_setup(radio, groups=capture_groups())
+    radio._setMode(RF69_MODE_RX)
+    events = garage_rfm69.radio_events(radio)
+    return EdgeCapture(events.gpio, events.pins[2])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("-s", "--seconds", type=float, default=10)
+    parser.add_argument("--symbol-us", type=float, help="default, estimate it")
+    parser.add_argument("--gap-us", type=float, help="default, from the pulses")
+    parser.add_argument(
+        "--expect",
+        nargs="?",
+        const=garage_rfm69.GARAGE_SYMBOLS,
+        help="symbols to check for, default the garage's own",
+    )
+    parser.add_argument(
+        "--replay",
+        action="store_true",
+        help="play our own transmission to a simulated radio (GARAGE_RADIO=sim)",
+    )
+    parser.add_argument("--record", help="also save the edges to a capture file")
+    args = parser.parse_args()
+
+    writer = None
+    if args.record:
+        writer = garage_capfile.CaptureWriter(
+            args.record,
+            garage_capfile.KIND_EDGES,
+            garage_rfm69.garage().carrier,
+            garage_rfm69.GARAGE_BITRATE,
+        )
+    with garage_rfm69.open_radio() as radio:
+        edges = capture(radio)
+        if args.replay:
+            radio.inject_ook(garage_ook.waveform_runs(garage_rfm69.waveform()))
+        print(f"[*] Capturing for {args.seconds}s...")
+        seen = collections.Counter()
+        try:
+            for frame in decode(
+                edges,
+                time.monotonic() + args.seconds,
+                args.symbol_us,
+                args.gap_us,
+                writer,
+            ):
+                seen[frame.symbols] += 1
+                print(
+                    f"[+] {len(frame.symbols)} symbols of {frame.symbol_us:.0f}us "
+                    f"(error {frame.error:.2f}) : {frame.symbols}"
+                )
+        except KeyboardInterrupt:
+            pass
+        finally:
+            edges.close()
+            radio._setMode(RF69_MODE_STANDBY)
+            if writer:
+                writer.close()
+                print(f"[+] Saved {writer.count} edges to {args.record}")
+        garage_rfm69.release_radio(radio)
+
+    print(f"[*] {edges.count} edges, {sum(seen.values())} frames")
+    if seen:
+        code, count = seen.most_common(1)[0]
+        print(f"[+] Most common code, {count} times : {code}")
+    if args.expect:
+        matched = seen[args.expect]
+        print(f"[{'+' if matched else '!'}] {matched} frames matched {args.expect}")
+        if not matched:
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
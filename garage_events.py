@@ -0,0 +1,108 @@
+""" RFM69 DIO interrupts as blocking waits with timeouts """
+
+import threading
+import time
+
+from garage_metrics import REGISTRY
+from garage_registers import (
+    REG_OSC1,
+    RF_OSC1_RCCAL_DONE,
+)
+
+# Signals we can see on a DIO pin with the mapping register_setup() applies
+# (DIO0 TxReady, DIO1 FifoLevel, DIO2 FifoNotEmpty), as (DIO, level)
+DIO_SIGNALS = {
+    "tx_ready": (0, 1),
+    "fifo_level": (1, 1),
+    "fifo_below_threshold": (1, 0),
+    "fifo_not_empty": (2, 1),
+    "fifo_empty": (2, 0),
+    # Receiving, with DIO0 remapped by garage_listen
+    "rssi": (0, 1),
+    "payload_ready": (0, 1),
+}
+
+# Signals no DIO pin carries, which come from their flags, sleeping between
+# reads. Packet mode only has ModeReady on DIO4/5, which aren't wired, so
+# nothing waits for it: the library waits for it leaving sleep, the only mode
+# without the FIFO, and the edge the next step waits on (TxReady, or a Listen
+# Mode wake) can only come once the mode is ready.
+FLAG_SIGNALS = {
+    "rc_calibrated": (REG_OSC1, RF_OSC1_RCCAL_DONE),
+}
+FLAG_POLL_INTERVAL = 0.0001
+
+WAIT_SECONDS = REGISTRY.histogram(
+    "garage_radio_wait_seconds", "Time spent waiting on radio signals", ("signal",)
+)
+WAIT_TIMEOUTS = REGISTRY.counter(
+    "garage_radio_wait_timeouts_total", "Radio signals never asserted", ("signal",)
+)
+
+
+class RadioEvents:
+    """Wake waiters on DIO edges instead of sleeping or spinning over SPI.
+
+    pins are the board pins wired to DIO0, DIO1 and DIO2, in that order.
+    """
+
+    def __init__(self, radio, gpio, pins):
+        self.radio = radio
+        self.gpio = gpio
+        self.pins = tuple(pins)
+        self._conditions = {pin: threading.Condition() for pin in self.pins}
+        self._detecting = []
+        self.running = True
+        for pin in self.pins:
+            gpio.setup(pin, gpio.IN)
+            try:
+                gpio.add_event_detect(pin, gpio.BOTH, callback=self._edge)
+                self._detecting.append(pin)
+            except RuntimeError:
+                # The library already watches DIO0, so share its detection
+                gpio.add_event_callback(pin, self._edge)
+
+    def _edge(self, pin):
+        if not self.running:
+            return
+        condition = self._conditions[pin]
+        with condition:
+            condition.notify_all()
+
+    def wait(self, signal, timeout=1.0):
+        """Block until signal is asserted, raise TimeoutError if it isn't"""
+        try:
+            with WAIT_SECONDS.labels(signal).time():
+                if signal in FLAG_SIGNALS:
+                    return self._wait_flag(signal, timeout)
+                return self._wait_dio(signal, timeout)
+        except TimeoutError:
+            WAIT_TIMEOUTS.labels(signal).inc()
+            raise
+
+    def _wait_dio(self, signal, timeout):
+        dio, level = DIO_SIGNALS[signal]
+        pin = self.pins[dio]
+        condition = self._conditions[pin]
+        with condition:
+            if not condition.wait_for(
+                lambda: self.gpio.input(pin) == level, timeout=timeout
+            ):
+                raise TimeoutError(f"No {signal} on DIO{dio} after {timeout}s")
+        return True
+
+    def _wait_flag(self, signal, timeout):
+        reg, mask = FLAG_SIGNALS[signal]
+        deadline = time.monotonic() + timeout
+        while not self.radio._readReg(reg) & mask:
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"No {signal} after {timeout}s")
+            time.sleep(FLAG_POLL_INTERVAL)
+        return True
+
+    def close(self):
+        # A shared detection can't drop a single callback, so it goes quiet
+        self.running = False
+        for pin in self._detecting:
+            self.gpio.remove_event_detect(pin)
+        self._detecting = []
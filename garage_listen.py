@@ -0,0 +1,265 @@
+#!/usr/bin/python3
+""" Listen Mode: the RFM69 duty cycles between idle and receive by itself,
+timed by its RC oscillator, and only raises DIO0 when something is heard.
+
+The host sleeps on the DIO0 edge in the meantime, rather than keeping the
+chip in full receive and polling it. DIO0 is mapped to Rssi (any signal over
+the threshold, e.g. a remote's raw OOK) or to PayloadReady (a whole packet,
+needing the receive side of packet mode set up). Listen Mode is entered from
+standby, and left with the two step ListenAbort sequence.
+"""
+
+import argparse
+import collections
+import threading
+import time
+
+import garage_metrics
+import garage_ook
+import garage_rfm69
+from garage_registers import (
+    REG_DIOMAPPING1,
+    REG_FIFO,
+    REG_IRQFLAGS2,
+    REG_LISTEN1,
+    REG_LISTEN2,
+    REG_LISTEN3,
+    REG_OPMODE,
+    REG_OSC1,
+    REG_RSSITHRESH,
+    REG_RSSIVALUE,
+    RF_DIOMAPPING1_DIO0_01,
+    RF_DIOMAPPING1_DIO0_11,
+    RF_IRQFLAGS2_FIFONOTEMPTY,
+    RF_LISTEN1_CRITERIA_RSSI,
+    RF_LISTEN1_CRITERIA_RSSIANDSYNC,
+    RF_LISTEN1_END_00,
+    RF_LISTEN1_END_01,
+    RF_LISTEN1_END_10,
+    RF_OPMODE_LISTEN_ON,
+    RF_OPMODE_LISTENABORT,
+    RF_OPMODE_RECEIVER,
+    RF_OPMODE_SLEEP,
+    RF_OPMODE_STANDBY,
+    RF_OSC1_RCCAL_START,
+    RF69_MODE_RX,
+    RF69_MODE_SLEEP,
+    RF69_MODE_STANDBY,
+)
+
+# ListenResol values, the duration each coefficient step is worth in seconds
+LISTEN_RESOLUTIONS = ((1, 64e-6), (2, 4.1e-3), (3, 0.262))
+# Defaults: 12.3ms receiving every half second, 2.4% of the time on
+LISTEN_IDLE = 0.5
+LISTEN_RX = 0.0123
+# dBm a signal needs to wake us, RSSI criteria or Rssi on DIO0
+LISTEN_THRESHOLD = -90
+LISTEN_CRITERIA = {
+    "rssi": RF_LISTEN1_CRITERIA_RSSI,
+    "sync": RF_LISTEN1_CRITERIA_RSSIANDSYNC,
+}
+# What the chip does once a receive window meets the criteria:
+#   stop: stay in receive, Listen Mode stops
+#   timeout: stay in receive until PayloadReady or timeout, then standby
+#   resume: as timeout, but Listen Mode carries on, FIFO lost at next wake
+LISTEN_END = {
+    "stop": RF_LISTEN1_END_00,
+    "timeout": RF_LISTEN1_END_01,
+    "resume": RF_LISTEN1_END_10,
+}
+# The DIO0 mapping for each thing which can wake the host
+LISTEN_WAKE = {
+    "rssi": RF_DIOMAPPING1_DIO0_11,
+    "payload_ready": RF_DIOMAPPING1_DIO0_01,
+}
+# RegOpMode Mode bits for the library modes Listen Mode can be left for
+OPMODES = {
+    RF69_MODE_SLEEP: RF_OPMODE_SLEEP,
+    RF69_MODE_STANDBY: RF_OPMODE_STANDBY,
+    RF69_MODE_RX: RF_OPMODE_RECEIVER,
+}
+# RC oscillator calibration takes the datasheet's worst case of under 1ms
+RC_CALIBRATION_TIMEOUT = 0.1
+
+# A time the host was woken: why, the RSSI then, and any FIFO bytes read
+Wake = collections.namedtuple("Wake", "time signal rssi payload")
+
+WAKES = garage_metrics.REGISTRY.counter(
+    "garage_listen_wakes_total", "Times Listen Mode woke the host", ("signal",)
+)
+
+
+def listen_timing(seconds):
+    """(ListenResol, ListenCoef, actual seconds) nearest a duration, at the
+    finest resolution which reaches it"""
+    for resolution, step in LISTEN_RESOLUTIONS:
+        coef = round(seconds / step)
+        if coef <= 0xFF:
+            coef = max(coef, 1)
+            return resolution, coef, coef * step
+    resolution, step = LISTEN_RESOLUTIONS[-1]
+    return resolution, 0xFF, 0xFF * step
+
+
+def listen_registers(idle=LISTEN_IDLE, rx=LISTEN_RX, criteria="rssi", end="timeout"):
+    """{register: value} for RegListen1-3, and the (idle, rx) they really give"""
+    idle_resolution, idle_coef, idle = listen_timing(idle)
+    rx_resolution, rx_coef, rx = listen_timing(rx)
+    registers = {
+        REG_LISTEN1: idle_resolution << 6
+        | rx_resolution << 4
+        | LISTEN_CRITERIA[criteria]
+        | LISTEN_END[end],
+        REG_LISTEN2: idle_coef,
+        REG_LISTEN3: rx_coef,
+    }
+    return registers, (idle, rx)
+
+
+def rc_calibrate(radio, events):
+    """Calibrate the RC oscillator which times Listen Mode, from standby.
+    RcCalDone is on no DIO pin, so this one wait polls RegOsc1 for it."""
+    radio._setMode(RF69_MODE_STANDBY)
+    radio._writeReg(REG_OSC1, radio._readReg(REG_OSC1) | RF_OSC1_RCCAL_START)
+    events.wait("rc_calibrated", RC_CALIBRATION_TIMEOUT)
+
+
+class ListenReceiver:
+    """Run a radio from open_radio() in Listen Mode, for use as a context
+    manager. wait() sleeps until DIO0 says something was heard."""
+
+    def __init__(
+        self,
+        radio,
+        idle=LISTEN_IDLE,
+        rx=LISTEN_RX,
+        criteria="rssi",
+        end="timeout",
+        wake="rssi",
+        threshold=LISTEN_THRESHOLD,
+    ):
+        self.radio = radio
+        self.events = garage_rfm69.radio_events(radio)
+        self.wake = wake
+        self.registers, (self.idle, self.rx) = listen_registers(idle, rx, criteria, end)
+        self.registers[REG_RSSITHRESH] = round(-threshold * 2)
+        self.registers[REG_DIOMAPPING1] = (
+            radio._readReg(REG_DIOMAPPING1) & 0x3F | LISTEN_WAKE[wake]
+        )
+        self.listening = False
+        self._calibrated = False
+
+    def start(self):
+        """Enter Listen Mode, ListenOn being set while in standby"""
+        if not self._calibrated:
+            rc_calibrate(self.radio, self.events)
+            self._calibrated = True
+        self.radio._setMode(RF69_MODE_STANDBY)
+        garage_rfm69.register_write(self.radio, self.registers)
+        # The library still thinks it's in standby, so its own DIO0 handler
+        # leaves PayloadReady to us
+        opmode = self.radio._readReg(REG_OPMODE) & 0x80
+        self.radio._writeReg(
+            REG_OPMODE, opmode | RF_OPMODE_LISTEN_ON | RF_OPMODE_STANDBY
+        )
+        self.listening = True
+
+    def stop(self, mode=RF69_MODE_STANDBY):
+        """Leave Listen Mode for a library mode, in the two single SPI accesses
+        it takes: ListenOn=0 with ListenAbort=1, then again with ListenAbort=0"""
+        opmode = self.radio._readReg(REG_OPMODE) & 0x80 | OPMODES[mode]
+        self.radio._writeReg(REG_OPMODE, opmode | RF_OPMODE_LISTENABORT)
+        self.radio._writeReg(REG_OPMODE, opmode)
+        self.radio.mode = mode
+        self.listening = False
+
+    def wait(self, timeout=None):
+        """Sleep until DIO0 rises and return a Wake, raising TimeoutError
+        after timeout seconds. Listen Mode is left to the caller to restart."""
+        self.events.wait(self.wake, timeout)
+        rssi = -self.radio._readReg(REG_RSSIVALUE) / 2
+        payload = bytearray()
+        if self.wake == "payload_ready":
+            while self.radio._readReg(REG_IRQFLAGS2) & RF_IRQFLAGS2_FIFONOTEMPTY:
+                payload.append(self.radio._readReg(REG_FIFO))
+        WAKES.labels(self.wake).inc()
+        return Wake(time.time(), self.wake, rssi, bytes(payload))
+
+    def __iter__(self):
+        """Wakes forever, back into Listen Mode after each"""
+        while True:
+            if not self.listening:
+                self.start()
+            wake = self.wait()
+            self.stop()
+            yield wake
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        if self.listening:
+            self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--idle", type=float, default=LISTEN_IDLE, help="seconds")
+    parser.add_argument("--rx", type=float, default=LISTEN_RX, help="seconds")
+    parser.add_argument("--criteria", choices=LISTEN_CRITERIA, default="rssi")
+    parser.add_argument("--end", choices=LISTEN_END, default="timeout")
+    parser.add_argument("--wake", choices=LISTEN_WAKE, default="rssi")
+    parser.add_argument("--threshold", type=float, default=LISTEN_THRESHOLD)
+    parser.add_argument(
+        "--replay",
+        type=float,
+        metavar="SECONDS",
+        help="play our own signal to a simulated radio after (GARAGE_RADIO=sim)",
+    )
+    args = parser.parse_args()
+
+    with garage_rfm69.open_radio() as radio:
+        garage_rfm69.register_setup(radio)
+        receiver = ListenReceiver(
+            radio,
+            args.idle,
+            args.rx,
+            args.criteria,
+            args.end,
+            args.wake,
+            args.threshold,
+        )
+        print(
+            f"[*] Listening {receiver.rx * 1000:.1f}ms every "
+            f"{(receiver.idle + receiver.rx) * 1000:.1f}ms "
+            f"({receiver.rx / (receiver.idle + receiver.rx):.1%} duty cycle), "
+            f"waking on {args.wake} over {args.threshold}dBm..."
+        )
+        if args.replay is not None:
+            threading.Timer(
+                args.replay,
+                radio.inject_ook,
+                (garage_ook.waveform_runs(garage_rfm69.waveform()),),
+            ).start()
+        # A held remote wakes every window, so only report the first of a run
+        last = 0
+        try:
+            for wake in receiver:
+                if wake.time - last > 2 * (receiver.idle + receiver.rx) or wake.payload:
+                    print(
+                        f"[+] {time.strftime('%H:%M:%S', time.localtime(wake.time))} "
+                        f"woken by {wake.signal} at {wake.rssi}dBm"
+                        + (f" : {wake.payload.hex()}" if wake.payload else "")
+                    )
+                last = wake.time
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if receiver.listening:
+                receiver.stop()
+            garage_rfm69.release_radio(radio)
+
+
+if __name__ == "__main__":
+    main()
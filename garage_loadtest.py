@@ -0,0 +1,83 @@
+#!/usr/bin/python3
+""" Load test the frontend, reporting requests per second and latency percentiles """
+
+import argparse
+import http.client
+import threading
+import time
+import urllib.parse
+
+
+def percentile(ordered, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not ordered:
+        return float("nan")
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def client(url, count, latencies, statuses, lock):
+    """Send count requests over one kept-alive connection"""
+    parts = urllib.parse.urlsplit(url)
+    path = parts.path or "/"
+    if parts.query:
+        path += "?" + parts.query
+    conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=120)
+    mine = []
+    codes = {}
+    for _ in range(count):
+        start = time.perf_counter()
+        try:
+            conn.request("GET", path)
+            response = conn.getresponse()
+            response.read()
+            status = response.status
+        except (OSError, http.client.HTTPException):
+            conn.close()
+            status = "error"
+        mine.append(time.perf_counter() - start)
+        codes[status] = codes.get(status, 0) + 1
+    conn.close()
+    with lock:
+        latencies.extend(mine)
+        for status, seen in codes.items():
+            statuses[status] = statuses.get(status, 0) + seen
+
+
+def run(url, clients, requests):
+    """Spread requests over concurrent clients, return (seconds, latencies, statuses)"""
+    latencies, statuses, lock = [], {}, threading.Lock()
+    threads = [
+        threading.Thread(
+            target=client,
+            args=(url, requests // clients, latencies, statuses, lock),
+        )
+        for _ in range(clients)
+    ]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - start, sorted(latencies), statuses
+
+
+def report(url, elapsed, latencies, statuses):
+    print(f"[+] {url}")
+    print(f"  - {len(latencies)} requests in {elapsed:.2f}s")
+    print(f"  - {len(latencies) / elapsed:.1f} requests/s")
+    for label, fraction in (("p50", 0.50), ("p95", 0.95), ("p99", 0.99)):
+        print(f"  - {label:23}   {percentile(latencies, fraction) * 1000:.2f} ms")
+    print(f"  - statuses                  {statuses}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("url", nargs="?", default="http://127.0.0.1/")
+    parser.add_argument("-c", "--clients", type=int, default=16)
+    parser.add_argument("-n", "--requests", type=int, default=2000)
+    args = parser.parse_args()
+    report(args.url, *run(args.url, args.clients, args.requests))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+""" Structured event log, levelled records formatted only when they are read.
+
+A record keeps its message as a str.format() template and the values as
+fields, so logging costs a tuple and a deque append, and a record below the
+level isn't made at all. Records go to an in-memory ring, and to the sinks,
+normally a Console, unless the logging thread is capturing them (as the radio
+daemon does per request). Colour is only for a Console on a terminal.
+"""
+
+import collections
+import contextlib
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+
+DEBUG = 10
+INFO = 20
+SUCCESS = 25
+WARNING = 30
+ERROR = 40
+LEVEL_NAMES = {
+    DEBUG: "debug",
+    INFO: "info",
+    SUCCESS: "success",
+    WARNING: "warning",
+    ERROR: "error",
+}
+LEVELS = {name: level for level, name in LEVEL_NAMES.items()}
+# How each level has always been marked on the console
+MARKERS = {DEBUG: "[.]", INFO: "[*]", SUCCESS: "[+]", WARNING: "[!]", ERROR: "[!]"}
+COLOURS = {
+    DEBUG: "\x1b[2m",  # dim
+    SUCCESS: "\x1b[38;2;0;255;161m",  # minty
+    WARNING: "\x1b[38;2;255;170;0m",  # orange
+    ERROR: "\x1b[38;2;255;64;64m",  # red
+}
+COLOUR_SECTION = "\x1b[38;2;0;255;161m"  # minty
+COLOUR_LABEL = "\x1b[38;2;255;170;0m"  # orange
+COLOUR_RESET = "\x1b[0m"
+SECTION_WIDTH = 80
+
+# Records kept in memory, the oldest dropped first
+LOG_CAPACITY = 4096
+LOG_LEVEL = LEVELS[os.environ.get("GARAGE_LOG_LEVEL", "info")]
+# "text", or "json" for a JSON object per line
+LOG_FORMAT = os.environ.get("GARAGE_LOG_FORMAT", "text")
+
+Record = collections.namedtuple("Record", "seq time level message fields")
+
+
+def text(record):
+    """A record's message with its fields filled in"""
+    return record.message.format(**record.fields) if record.fields else record.message
+
+
+def render(record, colour=False):
+    """A record as a console line, in colour if asked"""
+    if "section" in record.fields:
+        head = f"----[ {record.fields['section']} ]"
+        line = head + "-" * max(SECTION_WIDTH - len(head), 0)
+        if colour:
+            line = (
+                f"{COLOUR_SECTION}----[{COLOUR_LABEL} {record.fields['section']} "
+                f"{COLOUR_SECTION}]{line[len(head):]}{COLOUR_RESET}"
+            )
+        return line
+    marker = MARKERS[record.level]
+    if colour and record.level in COLOURS:
+        marker = f"{COLOURS[record.level]}{marker}{COLOUR_RESET}"
+    return f"{marker} {text(record)}"
+
+
+# What as_dict() can give, worked out only when asked for
+_DERIVED = {
+    "seq": lambda record: record.seq,
+    "time": lambda record: record.time,
+    "level": lambda record: LEVEL_NAMES[record.level],
+    "text": text,
+    "line": render,
+}
+
+
+def as_dict(record, fields=None):
+    """A record as a JSON friendly dict, of just the named fields if given:
+    seq, time, level, text, line (as the console shows it) or its own"""
+    if fields is None:
+        fields = ["seq", "time", "level", "text", *record.fields]
+    return {
+        field: (
+            _DERIVED[field](record) if field in _DERIVED else record.fields.get(field)
+        )
+        for field in fields
+    }
+
+
+class Console:
+    """A sink writing records at level and above to stream (by default
+    whatever sys.stdout is at the time), in colour only if it's a terminal,
+    or as JSON lines"""
+
+    def __init__(self, level=INFO, stream=None, colour=None, json_lines=False):
+        self.level = level
+        self.stream = stream
+        self.colour = colour
+        self.json_lines = json_lines
+
+    def __call__(self, record):
+        if record.level < self.level:
+            return
+        stream = self.stream or sys.stdout
+        if self.json_lines:
+            line = json.dumps(as_dict(record), default=str)
+        else:
+            colour = self.colour
+            if colour is None:
+                colour = getattr(stream, "isatty", lambda: False)()
+            line = render(record, colour)
+        stream.write(line + "\n")
+
+
+class Capture:
+    """Records logged by a thread while it captures, each also passed to
+    follow as it comes if given, e.g. to stream it to a client"""
+
+    def __init__(self, level=None, follow=None):
+        self.level = level
+        self.follow = follow
+        self.records = []
+
+    def __call__(self, record):
+        self.records.append(record)
+        if self.follow:
+            self.follow(record)
+
+    def text(self):
+        """The captured records as plain console lines"""
+        return "".join(render(record) + "\n" for record in self.records)
+
+
+class EventLog:
+    """Levelled records into a ring of capacity, and out to sinks"""
+
+    def __init__(self, capacity=LOG_CAPACITY, level=LOG_LEVEL):
+        self.level = level
+        self.records = collections.deque(maxlen=capacity)
+        self.sinks = []
+        self._seq = itertools.count(1)
+        self._local = threading.local()
+
+    def log(self, level, message, **fields):
+        capture = getattr(self._local, "capture", None)
+        if capture is not None and capture.level is not None:
+            if level < capture.level:
+                return
+        elif level < self.level:
+            return
+        record = Record(next(self._seq), time.time(), level, message, fields)
+        self.records.append(record)
+        if capture is not None:
+            capture(record)
+        else:
+            for sink in self.sinks:
+                sink(record)
+
+    def debug(self, message, **fields):
+        self.log(DEBUG, message, **fields)
+
+    def info(self, message, **fields):
+        self.log(INFO, message, **fields)
+
+    def success(self, message, **fields):
+        self.log(SUCCESS, message, **fields)
+
+    def warning(self, message, **fields):
+        self.log(WARNING, message, **fields)
+
+    def error(self, message, **fields):
+        self.log(ERROR, message, **fields)
+
+    def section(self, label):
+        """Start a section of output, drawn as a rule on the console"""
+        self.log(INFO, "{section}", section=label)
+
+    @contextlib.contextmanager
+    def capture(self, level=None, follow=None):
+        """Take the calling thread's records (at level and above, if given,
+        otherwise the log's level) into a Capture rather than the sinks"""
+        previous = getattr(self._local, "capture", None)
+        self._local.capture = capture = Capture(level, follow)
+        try:
+            yield capture
+        finally:
+            self._local.capture = previous
+
+    def since(self, seq=0, level=DEBUG):
+        """Records still in the ring after seq, at level and above"""
+        return [
+            record
+            for record in list(self.records)
+            if record.seq > seq and record.level >= level
+        ]
+
+
+LOG = EventLog()
+CONSOLE = Console(json_lines=LOG_FORMAT == "json")
+LOG.sinks.append(CONSOLE)
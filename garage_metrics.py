@@ -0,0 +1,207 @@
+""" Low overhead counters and histograms, rendered in Prometheus text format """
+
+import bisect
+import contextlib
+import threading
+import time
+
+# Seconds, from a single SPI transfer up to a whole burst on air
+DEFAULT_BUCKETS = (
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+)
+
+
+def _escape(value):
+    value = str(value).replace("\\", "\\\\").replace('"', '\\"')
+    return value.replace("\n", "\\n")
+
+
+def _labels(names, values, extra=""):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def samples(self, name, labels):
+        yield f"{name}{labels} {self.value}"
+
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self._lock = threading.Lock()
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    @contextlib.contextmanager
+    def time(self):
+        """Observe how long the with block takes"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    def samples(self, name, labels, names=(), values=()):
+        total = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            total += count
+            le = "+Inf" if bound == float("inf") else repr(bound)
+            bucket = _labels(names, values, f'le="{le}"')
+            yield f"{name}_bucket{bucket} {total}"
+        yield f"{name}_sum{labels} {self.sum}"
+        yield f"{name}_count{labels} {total}"
+
+
+class Family:
+    """A named metric, with one child per combination of label values"""
+
+    def __init__(self, kind, name, help_text, labels=(), **options):
+        self.kind = kind
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+        self._options = options
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self.kind(**self._options))
+        return child
+
+    # Unlabelled families act as their only child
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def time(self):
+        return self.labels().time()
+
+    def render(self):
+        if not self._children:
+            return
+        kind = "counter" if self.kind is Counter else "histogram"
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} {kind}"
+        for values, child in sorted(self._children.items()):
+            labels = _labels(self.label_names, values)
+            if self.kind is Histogram:
+                yield from child.samples(self.name, labels, self.label_names, values)
+            else:
+                yield from child.samples(self.name, labels)
+
+
+class Registry:
+    """Metrics by name. Ones never touched aren't rendered, so processes which
+    merely import a module only report what they actually do themselves."""
+
+    def __init__(self):
+        self._families = {}
+        self._lock = threading.Lock()
+
+    def _family(self, kind, name, help_text, labels, **options):
+        family = self._families.get(name)
+        if family is None:
+            with self._lock:
+                family = self._families.setdefault(
+                    name, Family(kind, name, help_text, labels, **options)
+                )
+        return family
+
+    def counter(self, name, help_text, labels=()):
+        return self._family(Counter, name, help_text, labels)
+
+    def histogram(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        return self._family(Histogram, name, help_text, labels, buckets=buckets)
+
+    def render(self):
+        lines = []
+        for family in list(self._families.values()):
+            lines.extend(family.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+SPI_TRANSFERS = REGISTRY.counter(
+    "garage_spi_transfers_total",
+    "SPI transfers issued to the radio, single register or burst",
+    ("transfer",),
+)
+SPI_BYTES = REGISTRY.counter(
+    "garage_spi_bytes_total", "Bytes clocked over SPI", ("transfer",)
+)
+
+
+class CountingSpi:
+    """A radio's spidev.SpiDev, counting every transfer, the library's single
+    register _readReg()/_writeReg() as well as bursts"""
+
+    def __init__(self, spi):
+        self.spi = spi
+
+    def xfer(self, data, *args):
+        _count(data)
+        return self.spi.xfer(data, *args)
+
+    def xfer2(self, data, *args):
+        _count(data)
+        return self.spi.xfer2(data, *args)
+
+    def __getattr__(self, name):
+        return getattr(self.spi, name)
+
+
+def _count(data):
+    # An address byte and a value is how the library reads and writes one
+    transfer = "register" if len(data) <= 2 else "burst"
+    SPI_TRANSFERS.labels(transfer).inc()
+    SPI_BYTES.labels(transfer).inc(len(data))
+
+
+def count_spi(radio):
+    """Count every SPI transfer to the radio from here on"""
+    if not isinstance(radio.spi, CountingSpi):
+        radio.spi = CountingSpi(radio.spi)
+
+
+def spi_xfer(radio, data):
+    """radio.spi.xfer2(), a burst transfer, counted by count_spi()"""
+    return radio.spi.xfer2(data)
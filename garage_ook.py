@@ -0,0 +1,124 @@
+#!/usr/bin/python3
+""" OOK waveform compiler, turns symbol patterns into packed FIFO payloads"""
+
+import argparse
+import collections
+import functools
+import itertools
+
+# RFM69 crystal oscillator frequency
+FXOSC = 32000000
+
+# RegBitrate (0x03,0x04) values, the bitrate they really give, and its error
+Bitrate = collections.namedtuple("Bitrate", "msb lsb bitrate error_ppm")
+
+# A compiled transmission, payload is the packed (MSB first) FIFO byte stream
+Waveform = collections.namedtuple(
+    "Waveform",
+    "payload bits bitrate symbol_bits symbol_error_ppm gap_bits lead_bits airtime",
+)
+
+
+@functools.lru_cache(maxsize=None)
+def bitrate_registers(bitrate, fxosc=FXOSC):
+    """Nearest achievable bitrate = FXOSC / (BitrateMsb << 8 | BitrateLsb)"""
+    divider = min(max(round(fxosc / bitrate), 1), 0xFFFF)
+    actual = fxosc / divider
+    return Bitrate(
+        divider >> 8,
+        divider & 0xFF,
+        actual,
+        (actual - bitrate) / bitrate * 1e6,
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def compile_waveform(symbols, symbol_us, gap_us, repeats, bitrate, lead_us=0):
+    """Compile a symbol pattern into the bytes to feed the FIFO.
+
+    Each symbol ("0" or "1") is stretched to the whole number of bits closest
+    to symbol_us at the achievable bitrate. The stream is lead_us of silence,
+    then the pattern repeated with gap_us of silence between repeats, packed
+    with no byte alignment between frames and zero padded at the very end.
+    Results are cached, so asking again for the same parameters is free.
+    """
+    if not symbols or set(symbols) - {"0", "1"}:
+        raise ValueError(f"Symbol pattern must be 0s and 1s: {symbols!r}")
+    if repeats < 1:
+        raise ValueError(f"Need at least one repeat, not {repeats}")
+    rate = bitrate_registers(bitrate)
+    symbol_bits = max(1, round(symbol_us * rate.bitrate / 1e6))
+    gap_bits = round(gap_us * rate.bitrate / 1e6)
+    lead_bits = round(lead_us * rate.bitrate / 1e6)
+
+    frame = "".join(symbol * symbol_bits for symbol in symbols)
+    stream = "0" * lead_bits + ("0" * gap_bits).join([frame] * repeats)
+    bits = len(stream)
+    stream += "0" * (-bits % 8)
+    payload = int(stream, 2).to_bytes(len(stream) // 8, "big")
+
+    actual_symbol_us = symbol_bits / rate.bitrate * 1e6
+    return Waveform(
+        payload,
+        bits,
+        rate,
+        symbol_bits,
+        (actual_symbol_us - symbol_us) / symbol_us * 1e6,
+        gap_bits,
+        lead_bits,
+        len(stream) / rate.bitrate,
+    )
+
+
+def waveform_runs(waveform):
+    """The waveform as it goes on air, (level, seconds) runs of equal bits"""
+    stream = f"{int.from_bytes(waveform.payload, 'big'):0{len(waveform.payload) * 8}b}"
+    bit_time = 1 / waveform.bitrate.bitrate
+    return [
+        (int(level), len(list(run)) * bit_time)
+        for level, run in itertools.groupby(stream[: waveform.bits])
+    ]
+
+
+def describe(waveform):
+    """Print a summary of a compiled waveform"""
+    rate = waveform.bitrate
+    print(
+        f"[+] Bitrate {rate.bitrate:.2f}bps "
+        f"(RegBitrate 0x{rate.msb:02x}{rate.lsb:02x}, {rate.error_ppm:+.0f}ppm)"
+    )
+    print(
+        f"[+] {waveform.symbol_bits} bit(s) per symbol "
+        f"({waveform.symbol_error_ppm:+.0f}ppm), "
+        f"{waveform.lead_bits} lead bits, {waveform.gap_bits} gap bits"
+    )
+    print(
+        f"[+] {waveform.bits} bits in {len(waveform.payload)} bytes, "
+        f"{waveform.airtime * 1000:.1f}ms on air"
+    )
+    print(waveform.payload.hex())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("symbols", help="symbol pattern, e.g. as measured in URH")
+    parser.add_argument("--symbol-us", type=float, default=700)
+    parser.add_argument("--gap-us", type=float, default=25100)
+    parser.add_argument("--lead-us", type=float, default=0)
+    parser.add_argument("--repeats", type=int, default=7)
+    parser.add_argument("--bitrate", type=float, default=1400)
+    args = parser.parse_args()
+    describe(
+        compile_waveform(
+            args.symbols,
+            args.symbol_us,
+            args.gap_us,
+            args.repeats,
+            args.bitrate,
+            args.lead_us,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,451 @@
+#!/usr/bin/python3
+""" Garage radio daemon, keeps one RFM69 initialised and transmits on request """
+
+import contextlib
+import json
+import math
+import os
+import socket
+import socketserver
+import threading
+import time
+import traceback
+
+import garage_airtime
+import garage_log
+import garage_telemetry
+from garage_log import LOG
+from garage_metrics import REGISTRY
+
+# Requests and replies are lines of JSON over a Unix stream socket. A pulse's
+# log records (see garage_log) at "level" and above come back as "output"
+# text, and as "log" entries of any "fields" asked for. With "follow", each is
+# streamed back as a progress event as it's logged too:
+#   -> {"cmd": "pulse", "device": "garage", "dry_run": false, "debug": true,
+#       "follow": true, "level": "debug", "fields": ["line"]}
+#   <- {"event": "log", "line": "[.] Sent 66/2014 bytes"}
+#   <- {"ok": true, "output": "...", "log": [{"line": ...}, ...],
+#       "registers": "<hex snapshot>", "verified": true, "radio": 0, "armed": true}
+# "armed" says the burst went out from hot standby, the radio having been set
+# up and its FIFO loaded after the one before, so it only had to switch to TX.
+# Bursts are held to an air time budget (see garage_airtime), so one may be
+# sent with fewer repeats, wait for air time, or be refused:
+#   <- {"ok": false, "output": "[!] Over the 10% air time budget...",
+#       "retry_after": 3.2}
+#   -> {"cmd": "airtime"}
+#   <- {"ok": true, "duty_cycle": 0.1, "window": 3600, "used": 23.0, ...}
+# The daemon's recent log, everything logged after a record's seq:
+#   -> {"cmd": "log", "since": 0, "level": "warning", "fields": ["time", "text"]}
+#   <- {"ok": true, "next": 1234, "records": [{"time": ..., "text": ...}]}
+# Devices are compiled from their profiles once, as the daemon starts:
+#   -> {"cmd": "devices"}
+#   <- {"ok": true, "devices": {"garage": {"carrier": 433945000, ...}}}
+# The daemon's own metrics, in Prometheus text format, are a request away:
+#   -> {"cmd": "metrics"}
+#   <- {"ok": true, "output": "# HELP ..."}
+# Between bursts, the radio can be sampled for telemetry (see garage_telemetry):
+#   -> {"cmd": "monitor", "rate": 200}
+#   -> {"cmd": "telemetry", "since": 0}
+#   <- {"ok": true, "fields": ["t", "rssi", ...], "next": 1234, "samples": [[...]]}
+#   -> {"cmd": "telemetry", "seconds": 60, "points": 120}
+#   <- {"ok": true, "views": [{"t": ..., "count": 25, "rssi": [min, mean, max]}]}
+RADIOD_SOCKET = os.environ.get("GARAGE_RADIOD_SOCKET", "/tmp/garage-radiod.sock")
+RADIOD_TIMEOUT = 60
+# Telemetry samples per second to start with, 0 is off until asked to monitor
+TELEMETRY_RATE = float(os.environ.get("GARAGE_TELEMETRY_RATE", 0))
+# Keep idle radios armed (see garage_rfm69.arm), 0 sets each burst up from cold
+HOT_STANDBY = os.environ.get("GARAGE_HOT_STANDBY", "1") != "0"
+
+PULSES = REGISTRY.counter("garage_radiod_pulses_total", "Pulse requests handled")
+PULSE_FAILURES = REGISTRY.counter(
+    "garage_radiod_pulse_failures_total", "Pulse requests which raised"
+)
+ARMED_PULSES = REGISTRY.counter(
+    "garage_radiod_armed_pulses_total", "Pulse requests sent from hot standby"
+)
+PULSE_SECONDS = REGISTRY.histogram(
+    "garage_radiod_pulse_seconds", "Pulse requests, including waiting for the radio"
+)
+
+
+class RadiodClient:
+    """A kept-open connection to the daemon, reconnecting if it has dropped"""
+
+    def __init__(self, path=RADIOD_SOCKET, timeout=RADIOD_TIMEOUT):
+        self.path = path
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._sock = None
+        self._reader = None
+
+    def connect(self):
+        self.close()
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._sock.settimeout(self.timeout)
+        self._sock.connect(self.path)
+        self._reader = self._sock.makefile("rb")
+
+    def close(self):
+        if self._sock:
+            self._reader.close()
+            self._sock.close()
+        self._sock = self._reader = None
+
+    def request(self, message, on_event=None):
+        """Send one request and return its decoded reply.
+
+        Progress events arriving before the reply are passed to on_event.
+        """
+        with self._lock:
+            try:
+                if self._sock is None:
+                    self.connect()
+                try:
+                    self._send(message)
+                except OSError:
+                    # The daemon closed the kept-open connection (it restarted,
+                    # say), so it never saw this request, and it is safe to
+                    # send it again. Once written, nothing is sent twice.
+                    self.connect()
+                    self._send(message)
+                return self._receive(on_event)
+            except (OSError, ValueError):
+                self.close()
+                raise
+
+    def _send(self, message):
+        self._sock.sendall(json.dumps(message).encode() + b"\n")
+
+    def _receive(self, on_event):
+        for line in self._reader:
+            data = json.loads(line)
+            if "event" not in data:
+                return data
+            if on_event:
+                on_event(data)
+        # A pulse may have gone out before the daemon stopped, so whether it
+        # did is left to the caller rather than guessed at
+        raise ConnectionError(
+            "Radio daemon closed the connection before replying, "
+            "the request may have been carried out"
+        )
+
+
+def request(message, path=RADIOD_SOCKET, timeout=RADIOD_TIMEOUT, on_event=None):
+    """Send one request to the daemon over a fresh connection"""
+    client = RadiodClient(path, timeout)
+    try:
+        return client.request(message, on_event)
+    finally:
+        client.close()
+
+
+class EventStream:
+    """Follows a request's log Capture, sending each record on to the client
+    as a progress event of just the fields it asked for"""
+
+    def __init__(self, send, fields=None):
+        self.send = send
+        self.fields = fields or ["line"]
+
+    def __call__(self, record):
+        try:
+            self.send(dict(garage_log.as_dict(record, self.fields), event="log"))
+        except OSError:
+            # The client went away, but the burst must still finish
+            self.send = lambda data: None
+
+
+class RadioRequestHandler(socketserver.StreamRequestHandler):
+    """Handle JSON requests against the shared radio, until the client hangs up"""
+
+    def send(self, data):
+        self.wfile.write(json.dumps(data).encode() + b"\n")
+        self.wfile.flush()
+
+    def handle(self):
+        for line in self.rfile:
+            try:
+                message = json.loads(line)
+                reply = self.server.dispatch(message, self.send)
+            except Exception:  # pylint: disable=broad-except
+                reply = {"ok": False, "output": traceback.format_exc()}
+            self.send(reply)
+
+
+class RadioServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Unix socket server owning already set up radios.
+
+    Each client connection (typically one kept open per web worker) gets a
+    thread. Bursts go to whichever radio of the pool is free, preferably one
+    already tuned for the device, so a radio never has two overlapping but
+    different devices can go out at once. Telemetry samples the first radio.
+
+    With hot_standby, a radio is armed again in the background after each
+    burst, for whichever device it is tuned to. Receiving fills the FIFO, so
+    the first radio isn't armed while telemetry is sampling it.
+
+    Every radio's bursts draw on the one air time budget.
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        path,
+        radios,
+        rfm69,
+        telemetry_rate=TELEMETRY_RATE,
+        hot_standby=HOT_STANDBY,
+        budget=None,
+    ):
+        self.pool = rfm69.RadioPool(radios)
+        self.rfm69 = rfm69
+        self.hot_standby = hot_standby
+        self.budget = budget or garage_airtime.AirtimeBudget()
+        self.devices = rfm69.compile_devices()
+        first = self.pool.slots[0]
+        self.sampler = garage_telemetry.Sampler(
+            first.radio, first.lock, rate=telemetry_rate
+        )
+        super().__init__(path, RadioRequestHandler)
+
+    def tune(self):
+        """Set each radio up for a different device, in profile order"""
+        for slot, device in zip(self.pool.slots, self.devices.values()):
+            with slot.lock:
+                LOG.info(
+                    "Radio {radio} for {device}", radio=slot.index, device=device.name
+                )
+                self.rfm69.register_setup(slot.radio, groups=device.groups)
+                slot.device = device.name
+            if self.hot_standby:
+                self.arm(slot)
+
+    def prepare(self, slot, device):
+        """Set a radio up for device and audit it with one burst read, returning
+        the snapshot and {register: wanted value} of any which didn't stick"""
+        self.rfm69.register_setup(slot.radio, groups=device.groups)
+        slot.device = device.name
+        regs = self.rfm69.register_snapshot(slot.radio)
+        unset = self.rfm69.register_verify(slot.radio, regs, device.groups)
+        for reg, value in unset.items():
+            LOG.warning(
+                "Register {register:#04x} is {value:#04x}, wanted {wanted:#04x}",
+                register=reg,
+                value=regs[reg],
+                wanted=value,
+            )
+        return regs, unset
+
+    def arm(self, slot):
+        """Put a radio in hot standby for the device it's tuned to"""
+        with self.pool.hold(slot):
+            if slot.armed or slot.device is None or self.sampling(slot):
+                return
+            device = self.devices[slot.device]
+            slot.registers = self.prepare(slot, device)
+            self.rfm69.arm(slot.radio, device)
+            slot.armed = device.name
+            LOG.success(
+                "Radio {radio} armed for {device}", radio=slot.index, device=device.name
+            )
+
+    def rearm(self, slot):
+        """arm() in the background, so the reply doesn't wait for it"""
+        if self.hot_standby and not slot.armed:
+            threading.Thread(target=self.arm, args=(slot,), daemon=True).start()
+
+    def sampling(self, slot):
+        return slot is self.pool.slots[0] and self.sampler.rate
+
+    def dispatch(self, message, send):
+        if message.get("cmd") == "metrics":
+            return {"ok": True, "output": REGISTRY.render()}
+        if message.get("cmd") == "monitor":
+            rate = float(message.get("rate", 0))
+            first = self.pool.slots[0]
+            with self.pool.hold(first):
+                if rate:
+                    first.armed = None
+                self.sampler.set_rate(rate)
+            self.rearm(first)
+            return {"ok": True, "output": f"Sampling at {self.sampler.rate}Hz"}
+        if message.get("cmd") == "telemetry":
+            return self.telemetry(message)
+        if message.get("cmd") == "airtime":
+            return dict(self.budget.status(), ok=True)
+        if message.get("cmd") == "log":
+            return self.log(message)
+        if message.get("cmd") == "devices":
+            return {
+                "ok": True,
+                "devices": {
+                    name: dict(device.profile._asdict(), carrier=device.carrier)
+                    for name, device in self.devices.items()
+                },
+            }
+        if message.get("cmd") != "pulse":
+            return {"ok": False, "output": f"Unknown command: {message.get('cmd')}"}
+        PULSES.inc()
+        level = message.get("level")
+        follow = message.get("follow") and EventStream(send, message.get("fields"))
+        try:
+            with PULSE_SECONDS.time(), LOG.capture(
+                level and garage_log.LEVELS[level], follow
+            ) as capture:
+                reply = self.pulse(message)
+        except Exception:
+            PULSE_FAILURES.inc()
+            raise
+        # Formatted once, now the burst is over
+        reply["output"] = capture.text()
+        if message.get("fields"):
+            reply["log"] = [
+                garage_log.as_dict(record, message["fields"])
+                for record in capture.records
+            ]
+        return reply
+
+    def log(self, message):
+        since = int(message.get("since", 0))
+        records = LOG.since(since, garage_log.LEVELS[message.get("level", "debug")])
+        return {
+            "ok": True,
+            "next": records[-1].seq if records else since,
+            "records": [
+                garage_log.as_dict(record, message.get("fields")) for record in records
+            ],
+        }
+
+    def telemetry(self, message):
+        ring = self.sampler.ring
+        if "seconds" in message:
+            views = ring.downsample(
+                float(message["seconds"]), int(message.get("points", 120))
+            )
+            return {"ok": True, "views": views}
+        since = message.get("since", 0)
+        after, rows = ring.since(
+            None if since is None else int(since), message.get("limit")
+        )
+        return {
+            "ok": True,
+            "fields": garage_telemetry.FIELD_NAMES,
+            "next": after,
+            "samples": rows,
+        }
+
+    def admit(self, device):
+        """Reserve air time for a burst of device, cut down to as many repeats
+        as the budget has room for, returning the device as it should be sent.
+        Raises garage_airtime.OverBudget."""
+        airtime = device.waveform.airtime
+        shortest = self.rfm69.with_repeats(
+            device, min(self.rfm69.MIN_REPEATS, device.profile.repeats)
+        )
+        started = time.monotonic()
+        reservation = self.budget.reserve(airtime, shortest.waveform.airtime)
+        waited = time.monotonic() - started
+        if waited > 0.01:
+            LOG.info("Waited {waited:.1f}s for air time", waited=waited)
+        if reservation.seconds < airtime:
+            repeats = self.rfm69.repeats_within(device, reservation.seconds)
+            LOG.warning(
+                "Air time budget low, sending {repeats} of {full} repeats",
+                repeats=repeats,
+                full=device.profile.repeats,
+            )
+            device = self.rfm69.with_repeats(device, repeats)
+        self.budget.settle(reservation, device.waveform.airtime)
+        return device
+
+    def pulse(self, message):
+        device = self.devices.get(message.get("device", self.rfm69.GARAGE_DEVICE))
+        if device is None:
+            LOG.error("Unknown device: {device}", device=message["device"])
+            return {"ok": False}
+        if not message.get("dry_run"):
+            try:
+                device = self.admit(device)
+            except garage_airtime.OverBudget as err:
+                LOG.warning("{error}", error=str(err))
+                return {
+                    "ok": False,
+                    "retry_after": (
+                        None if math.isinf(err.retry_after) else err.retry_after
+                    ),
+                }
+        with self.pool.acquire(device.name) as slot:
+            # Armed with the whole signal's first FIFO load, which a burst cut
+            # short may not start with
+            full = self.devices[device.name]
+            armed = slot.armed == device.name and (
+                self.rfm69.first_load(device) == self.rfm69.first_load(full)
+            )
+            try:
+                if armed:
+                    # Set up and audited as it was armed, straight to TX
+                    ARMED_PULSES.inc()
+                    regs, unset = slot.registers
+                else:
+                    # The library's send() moves the radio through its own
+                    # modes, so set up before every burst, normally this writes
+                    # nothing at all, and switching devices only writes the
+                    # registers they differ in. One burst read is cheap enough
+                    # to audit what every burst went out with.
+                    LOG.section(f"RFM69 Register Setup, radio {slot.index}")
+                    regs, unset = self.prepare(slot, device)
+                # A dry run leaves the FIFO as it was armed
+                if not armed or not message.get("dry_run"):
+                    slot.armed = None
+                if message.get("debug"):
+                    self.rfm69.register_debug(slot.radio, regs)
+                self.rfm69.transmit(
+                    slot.radio, not message.get("dry_run"), device, armed
+                )
+                LOG.success("Finished!")
+            finally:
+                self.rearm(slot)
+        if not message.get("dry_run"):
+            garage_airtime.AIRTIME_SECONDS.labels(device.name).inc(
+                device.waveform.airtime
+            )
+        return {
+            "ok": True,
+            "registers": regs.hex(),
+            "verified": not unset,
+            "radio": slot.index,
+            "armed": armed,
+            "repeats": device.profile.repeats,
+            "airtime": device.waveform.airtime,
+        }
+
+
+def serve(path=RADIOD_SOCKET):
+    """Open the radios once and serve transmit requests until interrupted"""
+    import garage_rfm69  # pylint: disable=import-outside-toplevel
+
+    with contextlib.suppress(FileNotFoundError):
+        os.unlink(path)
+    with contextlib.ExitStack() as stack:
+        radios = [
+            stack.enter_context(garage_rfm69.open_radio(wiring=wiring))
+            for wiring in garage_rfm69.load_wirings()
+        ]
+        with RadioServer(path, radios, garage_rfm69) as server:
+            LOG.section("RFM69 Register Setup")
+            server.tune()
+            os.chmod(path, 0o660)
+            LOG.success("Devices: {devices}", devices=", ".join(server.devices))
+            LOG.success("Listening on {path}", path=path)
+            try:
+                server.serve_forever()
+            except KeyboardInterrupt:
+                pass
+    with contextlib.suppress(FileNotFoundError):
+        os.unlink(path)
+
+
+if __name__ == "__main__":
+    serve()
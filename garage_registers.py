@@ -0,0 +1,215 @@
+""" RFM69 register map and bit values, as named in the rpi-rfm69 library.
+
+Kept here so nothing needs the hardware library installed just to name a
+register, e.g. when running against the simulated radio.
+"""
+# pylint: disable=line-too-long
+
+#######################################################################
+#### Register addresses
+#######################################################################
+REG_FIFO = 0x00
+REG_OPMODE = 0x01
+REG_DATAMODUL = 0x02
+REG_BITRATEMSB = 0x03
+REG_BITRATELSB = 0x04
+REG_FDEVMSB = 0x05
+REG_FDEVLSB = 0x06
+REG_FRFMSB = 0x07
+REG_FRFMID = 0x08
+REG_FRFLSB = 0x09
+REG_OSC1 = 0x0A
+REG_AFCCTRL = 0x0B
+REG_LOWBAT = 0x0C
+REG_LISTEN1 = 0x0D
+REG_LISTEN2 = 0x0E
+REG_LISTEN3 = 0x0F
+REG_VERSION = 0x10
+REG_PALEVEL = 0x11
+REG_PARAMP = 0x12
+REG_OCP = 0x13
+REG_LNA = 0x18
+REG_RXBW = 0x19
+REG_AFCBW = 0x1A
+REG_OOKPEAK = 0x1B
+REG_OOKAVG = 0x1C
+REG_OOKFIX = 0x1D
+REG_AFCFEI = 0x1E
+REG_AFCMSB = 0x1F
+REG_AFCLSB = 0x20
+REG_FEIMSB = 0x21
+REG_FEILSB = 0x22
+REG_RSSICONFIG = 0x23
+REG_RSSIVALUE = 0x24
+REG_DIOMAPPING1 = 0x25
+REG_DIOMAPPING2 = 0x26
+REG_IRQFLAGS1 = 0x27
+REG_IRQFLAGS2 = 0x28
+REG_RSSITHRESH = 0x29
+REG_RXTIMEOUT1 = 0x2A
+REG_RXTIMEOUT2 = 0x2B
+REG_PREAMBLEMSB = 0x2C
+REG_PREAMBLELSB = 0x2D
+REG_SYNCCONFIG = 0x2E
+REG_SYNCVALUE1 = 0x2F
+REG_SYNCVALUE2 = 0x30
+REG_SYNCVALUE3 = 0x31
+REG_SYNCVALUE4 = 0x32
+REG_SYNCVALUE5 = 0x33
+REG_SYNCVALUE6 = 0x34
+REG_SYNCVALUE7 = 0x35
+REG_SYNCVALUE8 = 0x36
+REG_PACKETCONFIG1 = 0x37
+REG_PAYLOADLENGTH = 0x38
+REG_NODEADRS = 0x39
+REG_BROADCASTADRS = 0x3A
+REG_AUTOMODES = 0x3B
+REG_FIFOTHRESH = 0x3C
+REG_PACKETCONFIG2 = 0x3D
+REG_AESKEY1 = 0x3E
+REG_AESKEY16 = 0x4D
+REG_TEMP1 = 0x4E
+REG_TEMP2 = 0x4F
+REG_TESTLNA = 0x58
+REG_TESTPA1 = 0x5A
+REG_TESTPA2 = 0x5C
+REG_TESTDAGC = 0x6F
+REG_TESTAFC = 0x71
+
+#######################################################################
+#### Bit values
+#######################################################################
+# RegOpMode
+RF_OPMODE_SEQUENCER_OFF = 0x80
+RF_OPMODE_SEQUENCER_ON = 0x00
+RF_OPMODE_LISTEN_ON = 0x40
+RF_OPMODE_LISTEN_OFF = 0x00
+RF_OPMODE_LISTENABORT = 0x20
+RF_OPMODE_SLEEP = 0x00
+RF_OPMODE_STANDBY = 0x04
+RF_OPMODE_SYNTHESIZER = 0x08
+RF_OPMODE_TRANSMITTER = 0x0C
+RF_OPMODE_RECEIVER = 0x10
+
+# RegDataModul
+RF_DATAMODUL_DATAMODE_PACKET = 0x00
+RF_DATAMODUL_DATAMODE_CONTINUOUS = 0x40
+RF_DATAMODUL_DATAMODE_CONTINUOUSNOBSYNC = 0x60
+RF_DATAMODUL_MODULATIONTYPE_FSK = 0x00
+RF_DATAMODUL_MODULATIONTYPE_OOK = 0x08
+RF_DATAMODUL_MODULATIONSHAPING_00 = 0x00
+RF_DATAMODUL_MODULATIONSHAPING_01 = 0x01
+RF_DATAMODUL_MODULATIONSHAPING_10 = 0x02
+RF_DATAMODUL_MODULATIONSHAPING_11 = 0x03
+
+# RegOsc1
+RF_OSC1_RCCAL_START = 0x80
+RF_OSC1_RCCAL_DONE = 0x40
+
+# RegListen1-3
+RF_LISTEN1_RESOL_IDLE_64 = 0x40
+RF_LISTEN1_RESOL_IDLE_4100 = 0x80
+RF_LISTEN1_RESOL_IDLE_262000 = 0xC0
+RF_LISTEN1_RESOL_RX_64 = 0x10
+RF_LISTEN1_RESOL_RX_4100 = 0x20
+RF_LISTEN1_RESOL_RX_262000 = 0x30
+RF_LISTEN1_CRITERIA_RSSI = 0x00
+RF_LISTEN1_CRITERIA_RSSIANDSYNC = 0x08
+RF_LISTEN1_END_00 = 0x00
+RF_LISTEN1_END_01 = 0x02
+RF_LISTEN1_END_10 = 0x04
+
+# RegOcp
+RF_OCP_OFF = 0x0F
+RF_OCP_ON = 0x1A
+
+# RegAfcBw
+RF_AFCBW_DCCFREQAFC_100 = 0x80
+RF_AFCBW_MANTAFC_20 = 0x08
+RF_AFCBW_EXPAFC_3 = 0x03
+
+# RegAfcFei
+RF_AFCFEI_FEI_DONE = 0x40
+RF_AFCFEI_FEI_START = 0x20
+RF_AFCFEI_AFC_DONE = 0x10
+RF_AFCFEI_AFCAUTOCLEAR_ON = 0x08
+RF_AFCFEI_AFCAUTO_ON = 0x04
+RF_AFCFEI_AFC_CLEAR = 0x02
+RF_AFCFEI_AFC_START = 0x01
+
+# RegRssiConfig
+RF_RSSI_DONE = 0x02
+RF_RSSI_START = 0x01
+
+# RegDioMapping1
+RF_DIOMAPPING1_DIO0_00 = 0x00
+RF_DIOMAPPING1_DIO0_01 = 0x40
+RF_DIOMAPPING1_DIO0_10 = 0x80
+RF_DIOMAPPING1_DIO0_11 = 0xC0
+RF_DIOMAPPING1_DIO1_00 = 0x00
+RF_DIOMAPPING1_DIO1_01 = 0x10
+RF_DIOMAPPING1_DIO1_10 = 0x20
+RF_DIOMAPPING1_DIO1_11 = 0x30
+RF_DIOMAPPING1_DIO2_00 = 0x00
+RF_DIOMAPPING1_DIO2_01 = 0x04
+RF_DIOMAPPING1_DIO2_10 = 0x08
+RF_DIOMAPPING1_DIO2_11 = 0x0C
+
+# RegIrqFlags1
+RF_IRQFLAGS1_MODEREADY = 0x80
+RF_IRQFLAGS1_RXREADY = 0x40
+RF_IRQFLAGS1_TXREADY = 0x20
+RF_IRQFLAGS1_PLLLOCK = 0x10
+RF_IRQFLAGS1_RSSI = 0x08
+RF_IRQFLAGS1_TIMEOUT = 0x04
+RF_IRQFLAGS1_AUTOMODE = 0x02
+RF_IRQFLAGS1_SYNCADDRESSMATCH = 0x01
+
+# RegIrqFlags2
+RF_IRQFLAGS2_FIFOFULL = 0x80
+RF_IRQFLAGS2_FIFONOTEMPTY = 0x40
+RF_IRQFLAGS2_FIFOLEVEL = 0x20
+RF_IRQFLAGS2_FIFOOVERRUN = 0x10
+RF_IRQFLAGS2_PACKETSENT = 0x08
+RF_IRQFLAGS2_PAYLOADREADY = 0x04
+RF_IRQFLAGS2_CRCOK = 0x02
+
+# RegSyncConfig
+RF_SYNC_ON = 0x80
+RF_SYNC_OFF = 0x00
+RF_SYNC_FIFOFILL_AUTO = 0x00
+RF_SYNC_FIFOFILL_MANUAL = 0x40
+RF_SYNC_SIZE_1 = 0x00
+RF_SYNC_SIZE_2 = 0x08
+
+# RegPacketConfig1
+RF_PACKET1_FORMAT_FIXED = 0x00
+RF_PACKET1_FORMAT_VARIABLE = 0x80
+RF_PACKET1_DCFREE_OFF = 0x00
+RF_PACKET1_DCFREE_MANCHESTER = 0x20
+RF_PACKET1_DCFREE_WHITENING = 0x40
+RF_PACKET1_CRC_ON = 0x10
+RF_PACKET1_CRC_OFF = 0x00
+RF_PACKET1_CRCAUTOCLEAR_ON = 0x00
+RF_PACKET1_CRCAUTOCLEAR_OFF = 0x08
+RF_PACKET1_ADRSFILTERING_OFF = 0x00
+RF_PACKET1_ADRSFILTERING_NODE = 0x02
+RF_PACKET1_ADRSFILTERING_NODEBROADCAST = 0x04
+
+# RegFifoThresh
+RF_FIFOTHRESH_TXSTART_FIFOTHRESH = 0x00
+RF_FIFOTHRESH_TXSTART_FIFONOTEMPTY = 0x80
+
+# RegTestDagc
+RF_DAGC_NORMAL = 0x00
+RF_DAGC_IMPROVED_LOWBETA1 = 0x20
+RF_DAGC_IMPROVED_LOWBETA0 = 0x30
+
+#######################################################################
+#### Library radio modes, for Radio._setMode()
+#######################################################################
+RF69_MODE_SLEEP = 0
+RF69_MODE_STANDBY = 1
+RF69_MODE_SYNTH = 2
+RF69_MODE_RX = 3
+RF69_MODE_TX = 4
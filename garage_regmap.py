@@ -0,0 +1,489 @@
+#!/usr/bin/python3
+""" Table driven RFM69 register decoder.
+
+The register map is declared once below, as fields (bit ranges with labels or
+a scale) of single registers, plus values spanning several registers. The
+first time a register is seen it is decoded for all 256 possible values, so
+from then on decoding a register_snapshot() is just indexing those tables.
+"""
+
+import argparse
+import collections
+import json
+import sys
+
+from garage_registers import *  # pylint: disable=wildcard-import,unused-wildcard-import
+
+# RFM69 crystal oscillator frequency, and the synthesizer step
+FXOSC = 32000000
+FSTEP = FXOSC / 2**19
+
+# A bit field of a register. bits is the (msb, lsb) range as in the datasheet,
+# labels a sequence or dict by field value, else the value passes through
+# scale (when given) and is shown with its units. A context gives other labels
+# for some values of another register.
+Field = collections.namedtuple(
+    "Field", "name bits labels units scale context", defaults=(None, "", None, None)
+)
+# Labels for a field by the value of the register at address
+Context = collections.namedtuple("Context", "address labels")
+Register = collections.namedtuple("Register", "name address fields")
+# A value spread over registers first to last (MSB first), passed to decode()
+Value = collections.namedtuple("Value", "name first last decode units")
+# A register decoded for each of its 256 possible values
+Tables = collections.namedtuple("Tables", "fields human compact")
+
+ON_OFF = ("Off", "On")
+ENABLED = ("Disabled", "Enabled")
+FLAG = ("0", "1")
+
+
+def _signed16(value):
+    return value - 0x10000 if value & 0x8000 else value
+
+
+REGISTERS = (
+    Register(
+        "RegOpMode",
+        REG_OPMODE,
+        (
+            Field("SequencerOff", (7, 7), ("Automatic", "Forced by Mode")),
+            Field("ListenOn", (6, 6), ON_OFF),
+            Field("ListenAbort", (5, 5), FLAG),
+            Field(
+                "Mode",
+                (4, 2),
+                {
+                    0: "Sleep",
+                    1: "Standby",
+                    2: "Synthesizer",
+                    3: "Transmit",
+                    4: "Receive",
+                },
+            ),
+        ),
+    ),
+    Register(
+        "RegDataModul",
+        REG_DATAMODUL,
+        (
+            Field(
+                "DataMode",
+                (6, 5),
+                (
+                    "Packet mode",
+                    "Reserved",
+                    "Continuous mode with bit synchronizer",
+                    "Continuous mode without bit synchronizer",
+                ),
+            ),
+            Field("ModulationType", (4, 3), ("FSK", "OOK", "Reserved", "Reserved")),
+            Field(
+                "ModulationShaping",
+                (1, 0),
+                (
+                    "No Shaping",
+                    "FSK:GaussianBT=1.0, OOK:FCutoff=BR",
+                    "FSK:GaussianBT=0.5, OOK:FCutoff=2*BR",
+                    "FSK:GaussianBT=0.3, OOK:reserved",
+                ),
+            ),
+        ),
+    ),
+    Register(
+        "RegOsc1",
+        REG_OSC1,
+        (
+            Field("RcCalStart", (7, 7), FLAG),
+            Field("RcCalDone", (6, 6), ("Running", "Done")),
+        ),
+    ),
+    Register("RegVersion", REG_VERSION, (Field("Version", (7, 0), scale=hex),)),
+    Register(
+        "RegPaLevel",
+        REG_PALEVEL,
+        (
+            Field("Pa0On", (7, 7), ENABLED),
+            Field("Pa1On", (6, 6), ENABLED),
+            Field("Pa2On", (5, 5), ENABLED),
+            Field("OutputPower", (4, 0)),
+        ),
+    ),
+    Register(
+        "RegOcp",
+        REG_OCP,
+        (
+            Field("OcpOn", (4, 4), ENABLED),
+            Field("OcpTrim", (3, 0), units="mA", scale=lambda trim: 45 + 5 * trim),
+        ),
+    ),
+    Register(
+        "RegRxBw",
+        REG_RXBW,
+        (
+            Field("DccFreq", (7, 5)),
+            Field("RxBwMant", (4, 3), {0: "16", 1: "20", 2: "24"}),
+            Field("RxBwExp", (2, 0)),
+        ),
+    ),
+    Register(
+        "RegAfcFei",
+        REG_AFCFEI,
+        (
+            Field("FeiDone", (6, 6), FLAG),
+            Field("FeiStart", (5, 5), FLAG),
+            Field("AfcDone", (4, 4), FLAG),
+            Field("AfcAutoclearOn", (3, 3), ON_OFF),
+            Field("AfcAutoOn", (2, 2), ON_OFF),
+            Field("AfcClear", (1, 1), FLAG),
+            Field("AfcStart", (0, 0), FLAG),
+        ),
+    ),
+    Register(
+        "RegRssiValue",
+        REG_RSSIVALUE,
+        (Field("RssiValue", (7, 0), units="dBm", scale=lambda rssi: -rssi / 2),),
+    ),
+    Register(
+        "RegDioMapping1",
+        REG_DIOMAPPING1,
+        (
+            # As mapped in packet mode, while transmitting
+            Field("Dio0Mapping", (7, 6), ("PacketSent", "TxReady", "-", "PllLock")),
+            Field(
+                "Dio1Mapping",
+                (5, 4),
+                ("FifoLevel", "FifoFull", "FifoNotEmpty", "PllLock"),
+            ),
+            Field("Dio2Mapping", (3, 2), ("FifoNotEmpty", "Data", "-", "AutoMode")),
+            Field("Dio3Mapping", (1, 0), ("FifoFull", "TxReady", "-", "PllLock")),
+        ),
+    ),
+    Register(
+        "RegIrqFlags1",
+        REG_IRQFLAGS1,
+        tuple(
+            Field(name, (bit, bit), FLAG)
+            for name, bit in (
+                ("ModeReady", 7),
+                ("RxReady", 6),
+                ("TxReady", 5),
+                ("PllLock", 4),
+                ("Rssi", 3),
+                ("Timeout", 2),
+                ("AutoMode", 1),
+                ("SyncAddressMatch", 0),
+            )
+        ),
+    ),
+    Register(
+        "RegIrqFlags2",
+        REG_IRQFLAGS2,
+        tuple(
+            Field(name, (bit, bit), FLAG)
+            for name, bit in (
+                ("FifoFull", 7),
+                ("FifoNotEmpty", 6),
+                ("FifoLevel", 5),
+                ("FifoOverrun", 4),
+                ("PacketSent", 3),
+                ("PayloadReady", 2),
+                ("CrcOk", 1),
+            )
+        ),
+    ),
+    Register(
+        "RegRssiThresh",
+        REG_RSSITHRESH,
+        (Field("RssiThreshold", (7, 0), units="dBm", scale=lambda rssi: -rssi / 2),),
+    ),
+    Register(
+        "RegSyncConfig",
+        REG_SYNCCONFIG,
+        (
+            Field("SyncOn", (7, 7), ON_OFF),
+            Field(
+                "FifoFillCondition",
+                (6, 6),
+                (
+                    "If SyncAddress interrupt occurs",
+                    "As long as FifoFillCondition is set",
+                ),
+            ),
+            Field("SyncSize", (5, 3), units="bytes", scale=lambda size: size + 1),
+            Field("SyncTol", (2, 0), units="bits"),
+        ),
+    ),
+    Register(
+        "RegPacketConfig1",
+        REG_PACKETCONFIG1,
+        (
+            Field(
+                "PacketFormat",
+                (7, 7),
+                ("Fixed length", "Variable length"),
+                # Fixed length with a PayloadLength of 0 means unlimited length
+                context=Context(
+                    REG_PAYLOADLENGTH, {0: ("Unlimited length", "Variable length")}
+                ),
+            ),
+            Field(
+                "DcFree", (6, 5), ("None (Off)", "Manchester", "Whitening", "Reserved")
+            ),
+            Field("CrcOn", (4, 4), ON_OFF),
+            Field(
+                "CrcAutoClearOff",
+                (3, 3),
+                (
+                    "Clear FIFO on CRC fail restart new packet reception",
+                    "Do not clear FIFO on CRC fail",
+                ),
+            ),
+            Field(
+                "AddressFiltering",
+                (2, 1),
+                (
+                    "None (Off)",
+                    "Address field must match NodeAddress",
+                    "Address field must match NodeAddress or BroadcastAddress",
+                    "Reserved",
+                ),
+            ),
+        ),
+    ),
+    Register(
+        "RegPayloadLength",
+        REG_PAYLOADLENGTH,
+        (Field("PayloadLength", (7, 0), {0: "0 (Unlimited, if fixed length)"}),),
+    ),
+    Register(
+        "RegFifoThresh",
+        REG_FIFOTHRESH,
+        (
+            Field(
+                "TxStartCondition",
+                (7, 7),
+                (
+                    "(0) FifoLevel (number of bytes in FIFO is FifoThreshold + 1)",
+                    "(1) FifoNotEmpty (at least one byte in the FIFO)",
+                ),
+            ),
+            Field(
+                "FifoThreshold",
+                (6, 0),
+                units="bytes (Used to trigger FifoLevel interrupt)",
+            ),
+        ),
+    ),
+    Register(
+        "RegPacketConfig2",
+        REG_PACKETCONFIG2,
+        (
+            Field("InterPacketRxDelay", (7, 4)),
+            Field("AutoRxRestartOn", (1, 1), ON_OFF),
+            Field("AesOn", (0, 0), ON_OFF),
+        ),
+    ),
+    Register(
+        "RegTestPa1",
+        REG_TESTPA1,
+        (Field("Pa20dBm1", (7, 0), {0x55: "Normal and Rx mode", 0x5D: "+20dBm mode"}),),
+    ),
+    Register(
+        "RegTestPa2",
+        REG_TESTPA2,
+        (Field("Pa20dBm2", (7, 0), {0x70: "Normal and Rx mode", 0x7C: "+20dBm mode"}),),
+    ),
+    Register(
+        "RegTestDagc",
+        REG_TESTDAGC,
+        (
+            Field(
+                "ContinuousDagc",
+                (7, 0),
+                {
+                    RF_DAGC_NORMAL: "Normal mode",
+                    RF_DAGC_IMPROVED_LOWBETA1: "Improved, low modulation index",
+                    RF_DAGC_IMPROVED_LOWBETA0: "Improved, other systems",
+                },
+            ),
+        ),
+    ),
+)
+
+VALUES = (
+    Value(
+        "Bitrate",
+        REG_BITRATEMSB,
+        REG_BITRATELSB,
+        lambda rate: round(FXOSC / (rate or 1)),
+        "bps",
+    ),
+    Value(
+        "Fdev",
+        REG_FDEVMSB,
+        REG_FDEVLSB,
+        lambda fdev: round(FSTEP * (fdev & 0x3FFF)),
+        "Hz",
+    ),
+    Value("Frf", REG_FRFMSB, REG_FRFLSB, lambda frf: round(FSTEP * frf), "Hz"),
+    Value(
+        "Fei", REG_FEIMSB, REG_FEILSB, lambda fei: round(FSTEP * _signed16(fei)), "Hz"
+    ),
+    Value("Preamble Length", REG_PREAMBLEMSB, REG_PREAMBLELSB, int, "bytes"),
+    Value("SyncValue", REG_SYNCVALUE1, REG_SYNCVALUE8, "0x{:016x}".format, ""),
+    Value("AesKey", REG_AESKEY1, REG_AESKEY16, "0x{:032x}".format, ""),
+)
+
+
+def _field_value(field, byte, labels):
+    msb, lsb = field.bits
+    raw = (byte >> lsb) & ((1 << (msb - lsb + 1)) - 1)
+    if labels is not None:
+        try:
+            return labels[raw]
+        except (IndexError, KeyError):
+            return raw
+    return field.scale(raw) if field.scale else raw
+
+
+def _with_units(value, units):
+    return f"{value} {units}" if units else f"{value}"
+
+
+def _labels(field, key):
+    return field.labels if key is None else field.context.labels[key]
+
+
+def _build(register, variant):
+    """Decode every possible value of a register, in each output form, with
+    the labels variant picks for fields with a context"""
+    fields, human, compact = [], [], []
+    title = f"{register.name} ({register.address:#04x})"
+    keys = iter(variant)
+    labels = [
+        _labels(field, next(keys)) if field.context else field.labels
+        for field in register.fields
+    ]
+    for byte in range(256):
+        decoded = tuple(
+            (field.name, _field_value(field, byte, field_labels))
+            for field, field_labels in zip(register.fields, labels)
+        )
+        fields.append(dict(decoded))
+        lines = [f"{title:27} : 0b{byte:08b}"]
+        lines.extend(
+            f"  - {name:23}   {_with_units(value, field.units)}"
+            for field, (name, value) in zip(register.fields, decoded)
+        )
+        human.append("\n".join(lines))
+        compact.append(
+            f"{register.name}={byte:#04x} "
+            + " ".join(f"{name}={value}" for name, value in decoded)
+        )
+    return Tables(tuple(fields), tuple(human), tuple(compact))
+
+
+class _Tables(dict):
+    """Per register address and variant, its decoded fields, human and compact
+    text by value. Built on first use, so importing this stays cheap."""
+
+    def __missing__(self, key):
+        address, variant = key
+        tables = self[key] = _build(ADDRESSES[address], variant)
+        return tables
+
+
+ADDRESSES = {register.address: register for register in REGISTERS}
+TABLES = _Tables()
+
+
+def _tables(register, regs):
+    """A register's tables, for the values of any registers its fields'
+    contexts depend on"""
+    variant = []
+    for field in register.fields:
+        if field.context:
+            other = regs[field.context.address]
+            variant.append(other if other in field.context.labels else None)
+    return TABLES[register.address, tuple(variant)]
+
+
+def _value(value, regs):
+    return value.decode(int.from_bytes(regs[value.first : value.last + 1], "big"))
+
+
+def decode(regs):
+    """{name: {"address", "raw", "fields"}} for a snapshot, then the values"""
+    decoded = {
+        register.name: {
+            "address": register.address,
+            "raw": regs[register.address],
+            "fields": _tables(register, regs).fields[regs[register.address]],
+        }
+        for register in REGISTERS
+    }
+    for value in VALUES:
+        decoded[value.name] = {
+            "address": value.first,
+            "raw": regs[value.first : value.last + 1].hex(),
+            "value": _value(value, regs),
+            "units": value.units,
+        }
+    return decoded
+
+
+def human(regs):
+    """Registers and values, in address order"""
+    blocks = [
+        (register.address, _tables(register, regs).human[regs[register.address]])
+        for register in REGISTERS
+    ]
+    for value in VALUES:
+        title = f"{value.name} ({value.first:#04x}-{value.last:#04x})"
+        blocks.append(
+            (
+                value.first,
+                f"{title:27} : -\n"
+                f"  - {value.name:23}   {_with_units(_value(value, regs), value.units)}",
+            )
+        )
+    return "\n".join(text for _, text in sorted(blocks))
+
+
+def compact(regs):
+    line = " | ".join(
+        _tables(register, regs).compact[regs[register.address]]
+        for register in REGISTERS
+    )
+    values = " ".join(f"{value.name}={_value(value, regs)}" for value in VALUES)
+    return f"{line} | {values}"
+
+
+FORMATS = {
+    "human": human,
+    "json": lambda regs: json.dumps(decode(regs)),
+    "compact": compact,
+}
+
+
+def render(regs, form="human"):
+    """Decode a snapshot (bytes indexed by register address) as text"""
+    return FORMATS[form](regs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "snapshot",
+        nargs="?",
+        help="hex register snapshot, as the radio daemon replies with, default stdin",
+    )
+    parser.add_argument("-f", "--format", choices=FORMATS, default="human")
+    args = parser.parse_args()
+    regs = bytes.fromhex((args.snapshot or sys.stdin.read()).strip())
+    print(render(regs, args.format))
+
+
+if __name__ == "__main__":
+    main()
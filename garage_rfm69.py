@@ -1,12 +1,28 @@
 #!/usr/bin/python3
 # pylint: disable=missing-function-docstring,unused-import,redefined-outer-name
+# pylint: disable=wrong-import-position
 """ RFM69 utility to examine if we can send arbitrary OOK signals """
 
-import sys
 import time
-from RFM69 import Radio, FREQ_433MHZ
-from RFM69.registers import *
-import RPi.GPIO as GPIO  # pylint: disable=consider-using-from-import
+
+# Before the other imports, so the startup time main() reports includes them
+STARTED = time.perf_counter()
+
+import collections
+import contextlib
+import functools
+import json
+import os
+import sys
+import threading
+
+import garage_events
+import garage_metrics
+import garage_ook
+import garage_regmap
+import garage_stream
+from garage_log import LOG
+from garage_registers import *
 
 # rpi-rfm69 library needs these, but we aren't using them
 NODE_ID = 0x01
@@ -17,16 +33,56 @@ RECIPIENT_ID = 0x01
 # In URH, we measure each symbol at 700us, therefore 1428.57 baud or bps
 # 1011001011001011001011001011001011001 (37 bits, 26.4ms) [Pause 25.1ms]
 GARAGE_CARRIER = 433945000
-GARAGE_BITRATE = 1400  # Use 1428 here?
-GARAGE_DATA = "²Ë,²È"  # In ASCII, can we send bytes in hex?
+# Use 1428 here? garage_timing.py fits it from a capture of the remote
+GARAGE_BITRATE = 1400
+# The symbol pattern as measured in URH, and its timing
+GARAGE_SYMBOLS = "1011001011001011001011001011001011001"
+GARAGE_SYMBOL_US = 700
+GARAGE_GAP_US = 25100
+# Sending the pattern once per packet, a separate packet with 0x08 sits
+# between the valid data?! So lets use brute force and repeat the pattern
+# within the packet itself, after 16 bits of silence
+GARAGE_LEAD_US = 11400
+GARAGE_REPEATS = 7
+# The fewest repeats a burst is cut down to when air time runs short, as many
+# as that single packet had
+MIN_REPEATS = GARAGE_REPEATS
+# What a whole pulse used to send as 32 packets, streamed gaplessly instead
+GARAGE_STREAM_REPEATS = 32 * GARAGE_REPEATS
 
 # RFM69 crystal oscillator frequency
 FXOSC = 32000000
+# Last register address included in a register_snapshot() (RegTestAfc)
+REG_SNAPSHOT_LAST = 0x71
+# Which radio to drive, the "rfm69" itself, or "sim" (garage_sim) off the Pi
+GARAGE_RADIO = os.environ.get("GARAGE_RADIO", "rfm69")
+# Carrier offsets found by garage_calibrate, per device
+CALIBRATION_FILE = os.environ.get("GARAGE_CALIBRATION", "calibration.json")
+# Device profiles beyond the garage, see load_profiles()
+DEVICES_FILE = os.environ.get("GARAGE_DEVICES", "devices.json")
+GARAGE_DEVICE = "garage"
 # Pi board pins (not GPIO nums)
 RESET_PIN = 22
 INT_PIN = 18  # DIO0
 DIO1_PIN = 16
 DIO2_PIN = 15
+# Radios beyond the first, see load_wirings()
+RADIOS_FILE = os.environ.get("GARAGE_RADIOS", "radios.json")
+# How long RadioPool waits for a busy radio already tuned for a device, before
+# retuning another, long enough for a telemetry sample to finish
+POOL_PREFER_WAIT = 0.005
+
+RADIO_INIT_SECONDS = garage_metrics.REGISTRY.histogram(
+    "garage_radio_init_seconds", "Radio construction, reset and library setup"
+)
+REGISTER_WRITE_SECONDS = garage_metrics.REGISTRY.histogram(
+    "garage_register_write_seconds",
+    "register_setup() writes, per register group",
+    ("group",),
+)
+TRANSMIT_SECONDS = garage_metrics.REGISTRY.histogram(
+    "garage_transmit_seconds", "Sending the whole garage signal"
+)
 
 #######################################################################
 #### Notes:
@@ -61,6 +117,8 @@ DIO2_PIN = 15
 # To stop listen mode, in two single SPI accesses:
 # - 1x Set RegOpMode:ListenOn=0, ListenAbort=1, set desired Mode bits (Sleep/Stdby/Rx/Tx)
 # - 1x Set RegOpMode:ListenOn=0, ListenAbort=0, set desired Mode bits (Sleep/Stdby/Rx/Tx)
+#
+# garage_listen.ListenReceiver does all of the above
 #######################################################################
 
 
@@ -68,470 +126,216 @@ def receiveFunction(radio):
     while True:
         # This call will block until a packet is received
         packet = radio.get_packet()
-        print("Got a packet: ", end="")
         # Process packet
-        print(packet)
-
-
-def separator(**kwargs):
-    position = kwargs.get("position", False)
-    label = kwargs.get("label", False)
-    col_sep = f"\x1b[38;2;0;255;161m"  # minty
-    col_debug = f"\x1b[38;2;255;170;0m"  # orange
-    col_reset = f"\x1b[0m"
-    if position == "begin":
-        if label:
-            print(
-                f"\n{col_sep}{'-'*4}"
-                f"[{col_debug} {label} {col_sep}]"
-                f"{'-'*67}{col_reset}"
-            )
-        else:
-            print(f"{col_sep}{'-'*80}{col_reset}\n")
-    if position == "end":
-        print(f"{col_sep}{'-'*80}{col_reset}\n")
-
-
-def register_debug(radio):
-    """Define some reference sheet parsing methods"""
-
-    def show(**kwargs):
-        """params:
-        reg, bits   # Show title line
-        attr, value # Show associated params
-        units       # optional units
-        """
-        reg = kwargs.get("reg", False)
-        bits = kwargs.get("bits", False)
-        attr = kwargs.get("attr", False)
-        value = kwargs.get("value", False)
-        units = kwargs.get("units", False)
-        col_title = f"\x1b[38;2;0;255;161m"  # minty
-        col_attr = f"\x1b[38;2;0;204;255m"  # bluey
-        col_reset = f"\x1b[0m"
-        # Titles
-        if reg and bits:
-            print(f"{col_title}{reg:27} : {col_reset}0b{bits}")
-        elif reg:
-            print(f"{col_title}{reg:27} : {col_reset}-")
-        # Attributes
-        elif attr:
-            if units:
-                print(f"{col_attr}  - {attr:23}   {value} {units}{col_reset}")
-            else:
-                print(f"{col_attr}  - {attr:23}   {value}{col_reset}")
-
-    def _RegDataModul_parse():
-        # Render as an 8-bit zero-padded string (for hacky slicing)
-        RegDataModul = f"{radio._readReg(REG_DATAMODUL):08b}"
-        show(reg="RegDataModul (0x2)", bits=RegDataModul)
-        RegDataModul = {
-            "DataMode": RegDataModul[-7:-5],
-            "ModulationType": RegDataModul[-5:-3],
-            "ModulationShaping": RegDataModul[-2:],
-        }
-        # Wretched spec sheet parsing...
-        if RegDataModul["DataMode"] == "00":
-            RegDataModul["DataMode"] = "Packet mode"
-        if RegDataModul["DataMode"] == "10":
-            RegDataModul["DataMode"] = "Continuous mode with bit synchronizer"
-        if RegDataModul["DataMode"] == "11":
-            RegDataModul["DataMode"] = "Continuous mode without bit synchronizer"
-        show(attr="DataMode", value=RegDataModul["DataMode"])
-        if RegDataModul["ModulationType"] == "00":
-            RegDataModul["ModulationType"] = "FSK"
-        elif RegDataModul["ModulationType"] == "01":
-            RegDataModul["ModulationType"] = "OOK"
-        elif RegDataModul["ModulationType"] == "11":
-            RegDataModul["ModulationType"] = "mystery1?"
-        elif RegDataModul["ModulationType"] == "11":
-            RegDataModul["ModulationType"] = "mystery2?"
-        show(attr="ModulationType", value=RegDataModul["ModulationType"])
-        if RegDataModul["ModulationShaping"] == "00":
-            RegDataModul["ModulationShaping"] = "No Shaping"
-        elif RegDataModul["ModulationShaping"] == "01":
-            RegDataModul["ModulationShaping"] = "FSK:GaussianBT=1.0, OOK:FCutoff=BR"
-        elif RegDataModul["ModulationShaping"] == "10":
-            RegDataModul["ModulationShaping"] = "FSK:GaussianBT=0.5, OOK:FCutoff=2*BR"
-        elif RegDataModul["ModulationShaping"] == "11":
-            RegDataModul["ModulationShaping"] = "FSK:GaussianBT=0.3, OOK:reserved"
-        show(attr="ModulationShaping", value=RegDataModul["ModulationShaping"])
-
-    def _RegBitrate_parse():
-        # Render as an 8-bit zero-padded string (for hacky slicing)
-        show(
-            reg="RegBitrate (0x3,0x4)",
-            bits=f"{radio._readReg(REG_BITRATEMSB):08b}{radio._readReg(REG_BITRATELSB):08b}",
-        )
-        RegBitrate = round(
-            round(
-                FXOSC
-                / (
-                    radio._readReg(REG_BITRATEMSB) << 8 | radio._readReg(REG_BITRATELSB)
-                ),
-            )
-        )
-        show(attr="Bitrate", value=RegBitrate, units="Hz")
-
-    def _RegPacketConfig1_parse():
-        # Render as an 8-bit zero-padded string (for hacky slicing)
-        RegPacketConfig1 = f"{radio._readReg(REG_PACKETCONFIG1):08b}"
-        show(reg="RegPacketConfig1 (0x2)", bits=RegPacketConfig1)
-        RegPacketConfig1 = {
-            "PacketFormat": RegPacketConfig1[-8:-7],
-            "DcFree": RegPacketConfig1[-7:-5],
-            "CrcOn": RegPacketConfig1[-5:-4],
-            "CrcAutoClearOff": RegPacketConfig1[-4:-3],
-            "AddressFiltering": RegPacketConfig1[-3:-1],
-        }
-        # Wretched spec sheet parsing...
-        if RegPacketConfig1["PacketFormat"] == "0":
-            RegPayloadLength = f"{radio._readReg(REG_PAYLOADLENGTH):08b}"
-            if int(RegPayloadLength, 2) == 0:
-                RegPacketConfig1["PacketFormat"] = "Unlimited length"
-            else:
-                RegPacketConfig1["PacketFormat"] = "Fixed length"
-        elif RegPacketConfig1["PacketFormat"] == "1":
-            RegPacketConfig1["PacketFormat"] = "Variable length"
-        show(attr="PacketFormat", value=RegPacketConfig1["PacketFormat"])
-        if RegPacketConfig1["DcFree"] == "00":
-            RegPacketConfig1["DcFree"] = "None (Off)"
-        elif RegPacketConfig1["DcFree"] == "01":
-            RegPacketConfig1["DcFree"] = "Manchester"
-        elif RegPacketConfig1["DcFree"] == "10":
-            RegPacketConfig1["DcFree"] = "Whitening"
-        show(attr="DcFree", value=RegPacketConfig1["DcFree"])
-        if RegPacketConfig1["CrcOn"] == "0":
-            RegPacketConfig1["CrcOn"] = "Off"
-        elif RegPacketConfig1["CrcOn"] == "1":
-            RegPacketConfig1["CrcOn"] = "On"
-        show(attr="CrcOn", value=RegPacketConfig1["CrcOn"])
-        if RegPacketConfig1["CrcAutoClearOff"] == "0":
-            RegPacketConfig1[
-                "CrcAutoClearOff"
-            ] = "Clear FIFO on CRC fail restart new packet reception"
-        elif RegPacketConfig1["CrcAutoClearOff"] == "1":
-            RegPacketConfig1["CrcAutoClearOff"] = "Do not clear FIFO on CRC fail"
-        show(attr="CrcAutoClearOff", value=RegPacketConfig1["CrcAutoClearOff"])
-        if RegPacketConfig1["AddressFiltering"] == "00":
-            RegPacketConfig1["AddressFiltering"] = "None (Off)"
-        elif RegPacketConfig1["AddressFiltering"] == "01":
-            RegPacketConfig1[
-                "AddressFiltering"
-            ] = "Address field must match NodeAddress"
-        elif RegPacketConfig1["AddressFiltering"] == "10":
-            RegPacketConfig1[
-                "AddressFiltering"
-            ] = "Address field must match NodeAddress or BroadcastAddress"
-        show(attr="AddressFiltering", value=RegPacketConfig1["AddressFiltering"])
-
-    def _RegPacketConfig2_parse():
-        # Render as an 8-bit zero-padded string (for hacky slicing)
-        RegPacketConfig2 = f"{radio._readReg(REG_PACKETCONFIG2):08b}"
-        show(reg="RegPacketConfig2 (0x2)", bits=RegPacketConfig2)
-        RegPacketConfig2 = {
-            "InterPacketRxDelay": RegPacketConfig2[-8:-4],
-            "AutoRxRestartOn": RegPacketConfig2[-2:-1],
-            "AesOn": RegPacketConfig2[-1:],
-        }
-        # Wretched spec sheet parsing...
-        if RegPacketConfig2["AesOn"] == "0":
-            RegPacketConfig2["AesOn"] = "Off"
-        if RegPacketConfig2["AesOn"] == "1":
-            RegPacketConfig2["AesOn"] = "On"
-        show(attr="AesOn", value=RegPacketConfig2["AesOn"])
-
-    def _RegAesKey_parse():
-        # Render as an 8-bit zero-padded string (for hacky slicing)
-        RegAesKey = (
-            f"{radio._readReg(REG_AESKEY1):08b}"
-            f"{radio._readReg(REG_AESKEY2):08b}"
-            f"{radio._readReg(REG_AESKEY3):08b}"
-            f"{radio._readReg(REG_AESKEY4):08b}"
-            f"{radio._readReg(REG_AESKEY5):08b}"
-            f"{radio._readReg(REG_AESKEY6):08b}"
-            f"{radio._readReg(REG_AESKEY7):08b}"
-            f"{radio._readReg(REG_AESKEY8):08b}"
-            f"{radio._readReg(REG_AESKEY9):08b}"
-            f"{radio._readReg(REG_AESKEY10):08b}"
-            f"{radio._readReg(REG_AESKEY11):08b}"
-            f"{radio._readReg(REG_AESKEY12):08b}"
-            f"{radio._readReg(REG_AESKEY13):08b}"
-            f"{radio._readReg(REG_AESKEY14):08b}"
-            f"{radio._readReg(REG_AESKEY15):08b}"
-            f"{radio._readReg(REG_AESKEY16):08b}"
-        )
-        show(reg="RegAesKey (0x3e-0x4d)", bits=False)
-        RegAesKey_hex = hex(int(RegAesKey, 2))
-        show(attr="AesKey", value=f"0x{int(RegAesKey_hex,16):032x}")
-
-    def _RegPreamble_parse():
-        # Render as an 8-bit zero-padded string (for hacky slicing)
-        show(
-            reg="RegPreamble (0x2c,0x2d)",
-            bits=f"{radio._readReg(REG_PREAMBLEMSB):08b}{radio._readReg(REG_PREAMBLELSB):08b}",
-        )
-        RegPreamble = radio._readReg(REG_PREAMBLEMSB) << 8 | radio._readReg(
-            REG_PREAMBLELSB
-        )
-        show(attr="Preamble Length", value=RegPreamble, units="bytes")
-
-    def _RegSyncConfig_parse():
-        # Render as an 8-bit zero-padded string (for hacky slicing)
-        RegSyncConfig = f"{radio._readReg(REG_SYNCCONFIG):08b}"
-        show(reg="RegSyncConfig (0x2e)", bits=RegSyncConfig)
-        RegSyncConfig = {
-            "SyncOn": RegSyncConfig[-8:-7],
-            "FifoFillCondition": RegSyncConfig[-7:-6],
-            "SyncSize": RegSyncConfig[-6:-3],
-            "SyncTol": RegSyncConfig[-3:],
-        }
-        # Wretched spec sheet parsing...
-        if RegSyncConfig["SyncOn"] == "0":
-            RegSyncConfig["SyncOn"] = "Off"
-        elif RegSyncConfig["SyncOn"] == "1":
-            RegSyncConfig["SyncOn"] = "On"
-        show(attr="SyncOn", value=RegSyncConfig["SyncOn"])
-        if RegSyncConfig["FifoFillCondition"] == "0":
-            RegSyncConfig["FifoFillCondition"] = "If SyncAddress interrupt occurs"
-        elif RegSyncConfig["FifoFillCondition"] == "1":
-            RegSyncConfig["FifoFillCondition"] = "As long as FifoFillCondition is set"
-        show(attr="FifoFillCondition", value=RegSyncConfig["FifoFillCondition"])
-        show(
-            attr="SyncSize",
-            value=int(RegSyncConfig["SyncSize"], 2) + 1,
-            units="bytes",
-        )
-        show(attr="SyncTol", value=int(RegSyncConfig["SyncTol"], 2), units="bits")
-
-    def _RegSyncValue_parse():
-        # Render as an 8-bit zero-padded string (for hacky slicing)
-        RegSyncValue = (
-            f"{radio._readReg(REG_SYNCVALUE1):08b}"
-            f"{radio._readReg(REG_SYNCVALUE2):08b}"
-            f"{radio._readReg(REG_SYNCVALUE3):08b}"
-            f"{radio._readReg(REG_SYNCVALUE4):08b}"
-            f"{radio._readReg(REG_SYNCVALUE5):08b}"
-            f"{radio._readReg(REG_SYNCVALUE6):08b}"
-            f"{radio._readReg(REG_SYNCVALUE7):08b}"
-            f"{radio._readReg(REG_SYNCVALUE8):08b}"
-        )
-        show(reg="RegSyncValue (0x2f-0x36)", bits=False)
-        RegSyncValue_hex = hex(int(RegSyncValue, 2))
-        show(attr="SyncValue", value=f"0x{int(RegSyncValue_hex,16):016x}")
-
-    def _RegPayloadLength_parse():
-        # Render as an 8-bit zero-padded string (for hacky slicing)
-        RegPayloadLength = f"{radio._readReg(REG_PAYLOADLENGTH):08b}"
-        show(reg="RegPayloadLength (0x38)", bits=RegPayloadLength)
-        RegPayloadLength = {
-            "PayloadLength": RegPayloadLength[-8:],
-        }
-        # Wretched spec sheet parsing...
-        show(attr="PayloadLength", value=int(RegPayloadLength["PayloadLength"], 2))
-
-    def _RegFifoThresh_parse():
-        # Render as an 8-bit zero-padded string (for hacky slicing)
-        RegFifoThresh = f"{radio._readReg(REG_FIFOTHRESH):08b}"
-        show(reg="RegFifoThresh (0x3c)", bits=RegFifoThresh)
-        RegFifoThresh = {
-            "TxStartCondition": RegFifoThresh[-8:-7],
-            "FifoThreshold": RegFifoThresh[-7:],
-        }
-        # Wretched spec sheet parsing...
-        if RegFifoThresh["TxStartCondition"] == "0":
-            RegFifoThresh[
-                "TxStartCondition"
-            ] = "(0) FifoLevel (number of bytes in FIFO is FifoThreshold + 1)"
-        elif RegFifoThresh["TxStartCondition"] == "1":
-            RegFifoThresh[
-                "TxStartCondition"
-            ] = "(1) FifoNotEmpty (at least one byte in the FIFO)"
-        show(attr="TxStartCondition", value=RegFifoThresh["TxStartCondition"])
-        show(
-            attr="FifoThreshold",
-            value=int(RegFifoThresh["FifoThreshold"], 2),
-            units="bytes (Used to trigger FifoLevel interrupt)",
-        )
+        LOG.info("Got a packet: {packet}", packet=packet)
 
-    def _RegPaLevel_parse():
-        # Render as an 8-bit zero-padded string (for hacky slicing)
-        RegPaLevel = f"{radio._readReg(REG_PALEVEL):08b}"
-        show(reg="RegPaLevel (0x11)", bits=RegPaLevel)
-        RegPaLevel = {
-            "Pa0On": RegPaLevel[-8:-7],
-            "Pa1On": RegPaLevel[-7:-6],
-            "Pa2On": RegPaLevel[-6:-5],
-            "OutputPower": RegPaLevel[-5:],
-        }
-        # Wretched spec sheet parsing...
-        if RegPaLevel["Pa0On"] == "1":
-            RegPaLevel["Pa0On"] = "Enabled"
-        elif RegPaLevel["Pa0On"] == "0":
-            RegPaLevel["Pa0On"] = "Disabled"
-        show(attr="Pa0On", value=RegPaLevel["Pa0On"])
-        if RegPaLevel["Pa1On"] == "1":
-            RegPaLevel["Pa1On"] = "Enabled"
-        elif RegPaLevel["Pa1On"] == "0":
-            RegPaLevel["Pa1On"] = "Disabled"
-        show(attr="Pa1On", value=RegPaLevel["Pa1On"])
-        if RegPaLevel["Pa2On"] == "1":
-            RegPaLevel["Pa2On"] = "Enabled"
-        elif RegPaLevel["Pa2On"] == "0":
-            RegPaLevel["Pa2On"] = "Disabled"
-        show(attr="Pa2On", value=RegPaLevel["Pa2On"])
-        show(attr="OutputPower", value=int(RegPaLevel["OutputPower"], 2), units="dBm")
-
-    def _RegOcp_parse():
-        # Render as an 8-bit zero-padded string (for hacky slicing)
-        RegOcp = f"{radio._readReg(REG_OCP):08b}"
-        show(reg="RegOcp (0x13)", bits=RegOcp)
-        RegOcp = {
-            "OcpOn": RegOcp[-5:-4],
-            "OcpTrim": RegOcp[-4:],
-        }
-        # Wretched spec sheet parsing...
-        if RegOcp["OcpOn"] == "1":
-            RegOcp["OcpOn"] = "Enabled"
-        elif RegOcp["OcpOn"] == "0":
-            RegOcp["OcpOn"] = "Disabled"
-        show(attr="OcpOn", value=RegOcp["OcpOn"])
-        show(attr="OcpTrim", value=45 + (5 * int(RegOcp["OcpTrim"], 2)), units="mA")
-
-    def _RegTestPa1_parse():
-        # Render as an 8-bit zero-padded string (for hacky slicing)
-        RegTestPa1 = f"{radio._readReg(REG_TESTPA1):08b}"
-        show(reg="RegTestPa1 (0x5a)", bits=RegTestPa1)
-        RegTestPa1 = {
-            "Pa20dBm1": RegTestPa1[-8:],
-        }
-        # Wretched spec sheet parsing...
-        if int(RegTestPa1["Pa20dBm1"], 2) == 0x55:
-            RegTestPa1["Pa20dBm1"] = "Normal and Rx mode"
-        elif int(RegTestPa1["Pa20dBm1"], 2) == 0x5D:
-            RegTestPa1["Pa20dBm1"] = "+20dBm mode"
-        show(attr="Pa20dBm1", value=RegTestPa1["Pa20dBm1"])
-
-    def _RegTestPa2_parse():
-        # Render as an 8-bit zero-padded string (for hacky slicing)
-        RegTestPa2 = f"{radio._readReg(REG_TESTPA2):08b}"
-        show(reg="RegTestPa2 (0x5c)", bits=RegTestPa2)
-        RegTestPa2 = {
-            "Pa20dBm2": RegTestPa2[-8:],
-        }
-        # Wretched spec sheet parsing...
-        if int(RegTestPa2["Pa20dBm2"], 2) == 0x70:
-            RegTestPa2["Pa20dBm2"] = "Normal and Rx mode"
-        elif int(RegTestPa2["Pa20dBm2"], 2) == 0x7C:
-            RegTestPa2["Pa20dBm2"] = "+20dBm mode"
-        show(attr="Pa20dBm2", value=RegTestPa2["Pa20dBm2"])
-
-    ####
-    #### Check registers
-    ####
-    separator(label="CONFIG REGISTERS", position="begin")
-    _RegDataModul_parse()
-    _RegBitrate_parse()
-    _RegPacketConfig1_parse()
-    _RegPacketConfig2_parse()
-    _RegAesKey_parse()
-    _RegPreamble_parse()
-    _RegSyncConfig_parse()
-    _RegSyncValue_parse()
-    _RegPayloadLength_parse()
-    _RegFifoThresh_parse()
-    _RegPaLevel_parse()
-    _RegOcp_parse()
-    _RegTestPa1_parse()
-    _RegTestPa2_parse()
-    # print(f"0x5A : RegTestPa1    : {hex(int(registers['0x5a'], 2))}")
-    # print(f"0x5C : RegTestPa2    : {hex(int(registers['0x5c'], 2))}")
-    separator(position="end")
-
-
-def register_setup(radio):
-    """Setup the RFM69 registers for our chosen transmission format"""
-    print(f"[+] Setting frequency to {GARAGE_CARRIER}Hz")
-    radio.set_frequency_in_Hz(GARAGE_CARRIER)
-
-    print("[+] Setting radio to Packet mode, OOK modulation, with no shaping")
-    RF_DATAMODUL_MODULATIONTYPE_MYSTERY1 = 0x10
-    RF_DATAMODUL_MODULATIONTYPE_MYSTERY2 = 0x18
-    radio._writeReg(
-        REG_DATAMODUL,
-        RF_DATAMODUL_DATAMODE_PACKET
-        | RF_DATAMODUL_MODULATIONTYPE_OOK
-        | RF_DATAMODUL_MODULATIONSHAPING_00,
-    )
 
-    print("[+] Setting fixed length packet format, disabling CRC")
-    # Unlimited length packet format is selected when bit PacketFormat is
-    # set to 0 (Fixed) and PayloadLength is set to 0.
-    #
-    # RF_PACKET1_FORMAT_FIXED
-    # RF_PACKET1_FORMAT_VARIABLE
-    radio._writeReg(
-        REG_PACKETCONFIG1,
-        RF_PACKET1_FORMAT_FIXED
-        | RF_PACKET1_DCFREE_OFF
-        | RF_PACKET1_CRC_OFF
-        | RF_PACKET1_CRCAUTOCLEAR_ON
-        | RF_PACKET1_ADRSFILTERING_OFF,
-    )
+def register_snapshot(radio):
+    """Read the whole register map (0x01-0x71) in a single burst SPI transfer.
 
-    print("[+] Setting payload length")
-    radio._writeReg(
-        REG_PAYLOADLENGTH,
-        0x00,
+    Returns bytes indexed by register address. Address 0x00 is the FIFO, which
+    a read would consume, so the burst starts at RegOpMode and index 0 is 0.
+    """
+    burst = garage_metrics.spi_xfer(
+        radio, [REG_OPMODE & 0x7F] + [0] * REG_SNAPSHOT_LAST
+    )
+    return bytes(1) + bytes(burst[1:])
+
+
+def register_debug(radio, regs=None, form="human"):
+    """Decode a snapshot, as "human", "json" or "compact" text, see garage_regmap"""
+    if regs is None:
+        regs = register_snapshot(radio)
+    LOG.section("CONFIG REGISTERS")
+    LOG.info("{registers}", registers=garage_regmap.render(regs, form))
+
+
+# What differs between the devices we can open: the carrier, bitrate, OOK
+# shaping (RegDataModul bits 0-1), RegPaLevel (PA1/PA2 on, and output power
+# in bits 0-4) and the signal itself, repeats being how many are streamed per
+# pulse. The library turns the +20dBm boost on for TX whatever RegPaLevel says.
+Profile = collections.namedtuple(
+    "Profile",
+    "carrier bitrate shaping pa_level symbols symbol_us gap_us lead_us repeats",
+)
+GARAGE_PROFILE = Profile(
+    GARAGE_CARRIER,
+    GARAGE_BITRATE,
+    RF_DATAMODUL_MODULATIONSHAPING_00,
+    0x7F,  # PA1 and PA2 on, full output power, as the library sets up
+    GARAGE_SYMBOLS,
+    GARAGE_SYMBOL_US,
+    GARAGE_GAP_US,
+    GARAGE_LEAD_US,
+    GARAGE_STREAM_REPEATS,
+)
+# A profile compiled, ready to register_setup() with groups and send waveform
+Device = collections.namedtuple("Device", "name profile carrier groups waveform")
+
+
+def load_calibration(path=CALIBRATION_FILE):
+    """{device: calibration} as saved by save_calibration(), {} if there's none"""
+    try:
+        with open(path, encoding="utf-8") as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return {}
+    except ValueError:
+        LOG.warning("Ignoring unreadable calibration file {path}", path=path)
+        return {}
+
+
+def save_calibration(device, calibration, path=CALIBRATION_FILE):
+    """Store a device's calibration, a dict with at least its "offset" in Hz"""
+    calibrations = load_calibration(path)
+    calibrations[device] = calibration
+    # Replaced whole, so a daemon starting up never reads half a file
+    with open(f"{path}.tmp", "w", encoding="utf-8") as file:
+        json.dump(calibrations, file, indent=2, sort_keys=True)
+    os.replace(f"{path}.tmp", path)
+
+
+def waveform(repeats=GARAGE_REPEATS):
+    """The garage's signal repeated, compiled on first use (and cached by
+    garage_ook). Its 7 repeats are what a single packet used to hold:
+    b"\x00\x00\xb2\xcb\x2c\xb2\xc8\x00\x00" * 6 + b"\x00\x00\xb2\xcb\x2c\xb2\xc8" """
+    return garage_ook.compile_waveform(
+        GARAGE_SYMBOLS,
+        GARAGE_SYMBOL_US,
+        GARAGE_GAP_US,
+        repeats,
+        GARAGE_BITRATE,
+        GARAGE_LEAD_US,
     )
 
-    print("[+] Setting FIFO threshold")
-    # TxStartCondition = 0 triggers at this threshold + 1,
-    # so set to payloadlength - 1
-    #
-    # Bit 7 :
-    # RF_FIFOTHRESH_TXSTART_FIFONOTEMPTY = 1 (0x80)
-    # RF_FIFOTHRESH_TXSTART_FIFOTHRESH = 0 (0x00)
-    radio._writeReg(
-        REG_FIFOTHRESH,
-        RF_FIFOTHRESH_TXSTART_FIFONOTEMPTY | 0x00,
+
+def carrier_offset(device=GARAGE_DEVICE):
+    """A device's calibrated carrier offset in Hz, 0 if it hasn't been"""
+    return load_calibration().get(device, {}).get("offset", 0)
+
+
+def frequency_registers(carrier):
+    """RegFrf (0x07-0x09) values for a carrier in Hz, Fstep = FXOSC / 2^19"""
+    frf = int(carrier / (FXOSC / 2**19))
+    return {
+        REG_FRFMSB: (frf >> 16) & 0xFF,
+        REG_FRFMID: (frf >> 8) & 0xFF,
+        REG_FRFLSB: frf & 0xFF,
+    }
+
+
+def profile_registers(profile, carrier, waveform):
+    """The register groups which differ between device profiles"""
+    return (
+        (
+            f"Setting frequency to {carrier}Hz "
+            f"(calibrated {carrier - profile.carrier:+}Hz)",
+            frequency_registers(carrier),
+        ),
+        (
+            "Setting radio to Packet mode, OOK modulation, "
+            f"with shaping {profile.shaping:02b}",
+            {
+                REG_DATAMODUL: RF_DATAMODUL_DATAMODE_PACKET
+                | RF_DATAMODUL_MODULATIONTYPE_OOK
+                | profile.shaping,
+            },
+        ),
+        (
+            # bitrate  = 32MHz(FXOSC) / bitrateMsb,bitrateLsb
+            # 32MHz / wanted_bitrate = bitrateMsb,bitrateLsb
+            # 1200kb/s = 32MHz / 26667 (0x682B) (0b01101000 00101011)
+            # 1400kb/s = 32MHz / 22857 (0x5949) (0b01011001 01001001)
+            f"Setting bitrate to {profile.bitrate}Hz",
+            {
+                REG_BITRATEMSB: waveform.bitrate.msb,
+                REG_BITRATELSB: waveform.bitrate.lsb,
+            },
+        ),
+        (
+            f"Setting PA level to {profile.pa_level:#04x}",
+            {REG_PALEVEL: profile.pa_level},
+        ),
     )
 
-    print("[+] Disable preamble and sync word")
-    radio._writeReg(REG_PREAMBLEMSB, 0x00)
-    radio._writeReg(REG_PREAMBLELSB, 0x00)
-    radio._writeReg(REG_SYNCCONFIG, RF_SYNC_OFF | RF_SYNC_SIZE_1)
-    radio._writeReg(REG_SYNCVALUE1, 0x00)
-    radio._writeReg(REG_SYNCVALUE2, 0x00)
-    # disable address byte - have to edit RPi-RFM69 code
-
-    print(f"[+] Setting bitrate to {GARAGE_BITRATE}Hz")
-    # bitrate  = 32MHz(FXOSC) / bitrateMsb,bitrateLsb
-    # 32MHz / wanted_bitrate = bitrateMsb,bitrateLsb
-    # 1200kb/s = 32MHz / 26667 (0x682B) (0b01101000 00101011)
-    # 1400kb/s = 32MHz / 22857 (0x5949) (0b01011001 01001001)
-    RF_BITRATEMSB_1400 = 0x59
-    RF_BITRATELSB_1400 = 0x49
-    radio._writeReg(REG_BITRATEMSB, RF_BITRATEMSB_1400)
-    radio._writeReg(REG_BITRATELSB, RF_BITRATELSB_1400)
-
-    print(f"[+] Setting +20dBm power amplifier mode, disabling OCP")
-    radio._writeReg(REG_TESTPA1, 0x5D)
-    radio._writeReg(REG_TESTPA2, 0x7C)
-    radio._writeReg(REG_OCP, 0xF)
-
-    # print("[+] Enabling Automatic-Frequency-Correction (AFC)")
+
+# Our chosen transmission format, as (description, {register: value}) groups,
+# which is the same for every device. register_setup() only writes the
+# registers which differ from the chip.
+COMMON_REGISTERS = (
+    # RegTestPa1/2 are left out, as the library owns them: with isHighPower it
+    # writes the +20dBm values entering TX and the normal ones leaving it
+    ("Disabling OCP, for the +20dBm power amplifier mode", {REG_OCP: 0xF}),
+    (
+        # Unlimited length packet format is selected when bit PacketFormat is
+        # set to 0 (Fixed) and PayloadLength is set to 0.
+        #
+        # RF_PACKET1_FORMAT_FIXED
+        # RF_PACKET1_FORMAT_VARIABLE
+        "Setting fixed length packet format, disabling CRC",
+        {
+            REG_PACKETCONFIG1: RF_PACKET1_FORMAT_FIXED
+            | RF_PACKET1_DCFREE_OFF
+            | RF_PACKET1_CRC_OFF
+            | RF_PACKET1_CRCAUTOCLEAR_ON
+            | RF_PACKET1_ADRSFILTERING_OFF,
+        },
+    ),
+    ("Setting payload length", {REG_PAYLOADLENGTH: 0x00}),
+    (
+        # TxStartCondition = 0 triggers at this threshold + 1,
+        # so set to payloadlength - 1
+        #
+        # Bit 7 :
+        # RF_FIFOTHRESH_TXSTART_FIFONOTEMPTY = 1 (0x80)
+        # RF_FIFOTHRESH_TXSTART_FIFOTHRESH = 0 (0x00)
+        #
+        # The threshold itself drives FifoLevel, for topping up the FIFO
+        # while streaming, see garage_stream
+        "Setting FIFO threshold",
+        {
+            REG_FIFOTHRESH: RF_FIFOTHRESH_TXSTART_FIFONOTEMPTY
+            | garage_stream.FIFO_THRESHOLD
+        },
+    ),
+    (
+        # Unlimited length packets have no end for PacketSent to mark, so
+        # use DIO0 for TxReady instead, see garage_events
+        "Mapping DIO0 to TxReady, DIO1 to FifoLevel, DIO2 to FifoNotEmpty",
+        {
+            REG_DIOMAPPING1: RF_DIOMAPPING1_DIO0_01
+            | RF_DIOMAPPING1_DIO1_00
+            | RF_DIOMAPPING1_DIO2_00
+        },
+    ),
+    (
+        # disable address byte - have to edit RPi-RFM69 code
+        "Disable preamble and sync word",
+        {
+            REG_PREAMBLEMSB: 0x00,
+            REG_PREAMBLELSB: 0x00,
+            REG_SYNCCONFIG: RF_SYNC_OFF | RF_SYNC_SIZE_1,
+            REG_SYNCVALUE1: 0x00,
+            REG_SYNCVALUE2: 0x00,
+        },
+    ),
     # Improved AutomaticFrequencyCorrection (AFC) routine for
     # signals with modulation index lower than 2
-    # radio._writeReg(REG_AFCFEI, RF_AFCFEI_AFCAUTO_ON)  # AFC on with each Rx mode
-    # radio._writeReg(REG_AFCCTRL, 0x10)  # AfcLowBetaOn=1 (Bit 5 enabled)
-
-    # print("[+] Enabling Digital-Automatic-Gain-Control (DAGC)")
+    # (
+    #     "Enabling Automatic-Frequency-Correction (AFC)",
+    #     {
+    #         REG_AFCFEI: RF_AFCFEI_AFCAUTO_ON,  # AFC on with each Rx mode
+    #         REG_AFCCTRL: 0x10,  # AfcLowBetaOn=1 (Bit 5 enabled)
+    #     },
+    # ),
+    #
     #   - RF_DAGC_IMPROVED_LOWBETA0 (0x30) for all other systems
     #   - RF_DAGC_IMPROVED_LOWBETA1 (0x20) for low modulation index systems
-    # radio._writeReg(REG_TESTDAGC, RF_DAGC_IMPROVED_LOWBETA1)
-
-    # print("[+] Setting channel filter bandwidth (for AFC mode)")
+    # (
+    #     "Enabling Digital-Automatic-Gain-Control (DAGC)",
+    #     {REG_TESTDAGC: RF_DAGC_IMPROVED_LOWBETA1},
+    # ),
+    #
     # DC Cancellation (DCC) Cutoff Frequencies
     #   - 001 = 8% of RxBw
     #   - 010 = 4% of RxBw (default)
@@ -547,74 +351,487 @@ def register_setup(radio):
     #   - 10b/24,        1,            83.3  (allows reception at f +/- 100kHz)
     # NB: In OOK mode, local oscillator is offset by (0.5 * Bw), with the
     # resulting image attenuated by 30dB.
-    # radio._writeReg(
-    #    REG_AFCBW,
-    #    RF_AFCBW_DCCFREQAFC_100 | RF_AFCBW_MANTAFC_20 | RF_AFCBW_EXPAFC_3,
-    # )
-
-
-with Radio(
-    FREQ_433MHZ,
-    NODE_ID,
-    NETWORK_ID,
-    isHighPower=True,
-    power=100,
-    verbose=True,
-    autoAcknowledge=False,
-    promiscuousMode=True,
-    use_board_pin_numbers=True,
-    interruptPin=INT_PIN,
-    resetPin=RESET_PIN,
-    spiBus=0,
-    spiDevice=0,
-) as radio:
-
-    separator(label="RFM69 Register Setup", position="begin")
-    register_setup(radio)
-    CLEAR_TO_SEND = True
-
-    if len(sys.argv) > 1:
-        if sys.argv[1] == "-d":
-            register_debug(radio)
-        if sys.argv[1] == "-t":
-            CLEAR_TO_SEND = False
-
-    # This works, kinda, but a separate packet with 0x08 sits between the valid
-    # data?!
-    # GARAGE_DATA = b"\x00\x00\xb2\xcb\x2c\xb2\xc8\x00"
-    # So lets use brute force and repeat the pattern within the packet itself
-    GARAGE_DATA = (
-        b"\x00\x00\xb2\xcb\x2c\xb2\xc8\x00\x00"
-        b"\x00\x00\xb2\xcb\x2c\xb2\xc8\x00\x00"
-        b"\x00\x00\xb2\xcb\x2c\xb2\xc8\x00\x00"
-        b"\x00\x00\xb2\xcb\x2c\xb2\xc8\x00\x00"
-        b"\x00\x00\xb2\xcb\x2c\xb2\xc8\x00\x00"
-        b"\x00\x00\xb2\xcb\x2c\xb2\xc8\x00\x00"
-        b"\x00\x00\xb2\xcb\x2c\xb2\xc8"
+    # (
+    #     "Setting channel filter bandwidth (for AFC mode)",
+    #     {
+    #         REG_AFCBW: RF_AFCBW_DCCFREQAFC_100
+    #         | RF_AFCBW_MANTAFC_20
+    #         | RF_AFCBW_EXPAFC_3,
+    #     },
+    # ),
+)
+
+
+def load_profiles(path=DEVICES_FILE):
+    """{name: Profile} of the garage and any devices in a profiles file, which
+    holds {name: {field: value}}, fields left out being the garage's"""
+    profiles = {GARAGE_DEVICE: GARAGE_PROFILE}
+    try:
+        with open(path, encoding="utf-8") as file:
+            found = json.load(file)
+    except FileNotFoundError:
+        return profiles
+    for name, fields in found.items():
+        unknown = set(fields) - set(Profile._fields)
+        if unknown:
+            raise ValueError(f"Device {name} has unknown fields: {sorted(unknown)}")
+        profiles[name] = GARAGE_PROFILE._replace(**fields)
+    return profiles
+
+
+def compile_device(name, profile, calibrations=None):
+    """Compile a Profile into a Device, its calibrated carrier, register groups
+    and packed payload. Waveforms are cached, so profiles can share them."""
+    if calibrations is None:
+        calibrations = load_calibration()
+    carrier = profile.carrier + calibrations.get(name, {}).get("offset", 0)
+    waveform = profile_waveform(profile)
+    groups = profile_registers(profile, carrier, waveform) + COMMON_REGISTERS
+    return Device(name, profile, carrier, groups, waveform)
+
+
+def profile_waveform(profile):
+    """The compiled (and cached) signal a profile sends"""
+    return garage_ook.compile_waveform(
+        profile.symbols,
+        profile.symbol_us,
+        profile.gap_us,
+        profile.repeats,
+        profile.bitrate,
+        profile.lead_us,
     )
-    for p in range(0, 32):
-        print(f"[*] Sending packets for Garage...")
-        # Second packet always gets a 1 bit prefixed ?!
-        # if we mangle GARAGE_DATA to trim it's leading 1 bit, maybe we'll
-        # have valid data from the second packet onwards....
-        # 10110010 11001011 00101100 10110010 11001 / 178 203 44 178 200 / 0xb2cb2cb2c8
-        # becomes...
-        # 01100101 10010110 01011001 01100101 1001  / 101 150 89 101 9   / 0x6596596509
-        # radio._setMode(RF69_MODE_STANDBY)
-        # while (radio._readReg(REG_IRQFLAGS1) & RF_IRQFLAGS1_MODEREADY) == 0x00:
-        #    print("DEBUG: waiting modeready2")
-        #    pass
-
-        if CLEAR_TO_SEND:
-            radio.send(
-                False,
-                GARAGE_DATA,
-                attempts=1,
-                require_ack=False,
-            )
-            time.sleep(0.008)
-        else:
-            print("Not really sending due to '-t'")
-
-
-print("\nFinished!")
+
+
+def with_repeats(device, repeats):
+    """A device sending fewer (or more) repeats, on the same registers. The
+    payload of fewer is the start of the longer one's, a FIFO load aside."""
+    profile = device.profile._replace(repeats=repeats)
+    return device._replace(profile=profile, waveform=profile_waveform(profile))
+
+
+def repeats_within(device, seconds):
+    """The most repeats of a device's signal which fit in seconds on air, the
+    air time being the payload's bits at the bitrate its registers give"""
+    waveform = device.waveform
+    frame_bits = len(device.profile.symbols) * waveform.symbol_bits
+    bits = seconds * waveform.bitrate.bitrate - waveform.lead_bits + waveform.gap_bits
+    repeats = min(int(bits // (frame_bits + waveform.gap_bits)), device.profile.repeats)
+    # Padding to a whole byte may tip the last one over
+    while repeats > 1 and with_repeats(device, repeats).waveform.airtime > seconds:
+        repeats -= 1
+    return max(repeats, 1)
+
+
+def compile_devices(path=DEVICES_FILE):
+    """{name: Device} for every profile, compiled up front"""
+    calibrations = load_calibration()
+    return {
+        name: compile_device(name, profile, calibrations)
+        for name, profile in load_profiles(path).items()
+    }
+
+
+@functools.lru_cache(maxsize=None)
+def garage():
+    """The garage as a compiled device, what transmit() sends by default,
+    compiled with its calibration on first use. garage_calibrate.py --save
+    updates the calibration, which a running process doesn't see."""
+    return compile_device(GARAGE_DEVICE, GARAGE_PROFILE)
+
+
+def register_image(groups=None):
+    """Flatten register groups (by default the garage's) into a single
+    {register: value} image"""
+    if groups is None:
+        groups = garage().groups
+    image = {}
+    for _, registers in groups:
+        image.update(registers)
+    return image
+
+
+def register_diff(image, regs):
+    """Registers in image whose value differs from a snapshot, in address order"""
+    return {reg: value for reg, value in sorted(image.items()) if regs[reg] != value}
+
+
+def register_write(radio, changes):
+    """Write {register: value} changes, one burst SPI transfer per contiguous run"""
+    run = []
+    for reg, value in sorted(changes.items()):
+        if run and reg != run[0] + len(run) - 1:
+            garage_metrics.spi_xfer(radio, [run[0] | 0x80] + run[1:])
+            run = []
+        if not run:
+            run = [reg]
+        run.append(value)
+    if run:
+        garage_metrics.spi_xfer(radio, [run[0] | 0x80] + run[1:])
+
+
+def register_setup(radio, regs=None, groups=None):
+    """Setup the RFM69 registers for our chosen transmission format.
+
+    Compares the wanted image (groups, by default the garage's) against a
+    snapshot of the chip (burst read when regs isn't given) and only writes
+    what differs, a burst per contiguous run of changed registers. Returns the
+    updated snapshot, which can be handed back in next time as a cached shadow.
+    """
+    if groups is None:
+        groups = garage().groups
+    if regs is None:
+        regs = register_snapshot(radio)
+    changes = register_diff(register_image(groups), regs)
+    for description, registers in groups:
+        group = {reg: changes[reg] for reg in registers if reg in changes}
+        if group:
+            LOG.success("{group}", group=description)
+            with REGISTER_WRITE_SECONDS.labels(description).time():
+                register_write(radio, group)
+    if not changes:
+        LOG.success("Registers already set up")
+    shadow = bytearray(regs)
+    for reg, value in changes.items():
+        shadow[reg] = value
+    return bytes(shadow)
+
+
+def register_verify(radio, regs=None, groups=None):
+    """Return the {register: wanted value} entries that didn't stick"""
+    if regs is None:
+        regs = register_snapshot(radio)
+    return register_diff(register_image(groups), regs)
+
+
+# The radio hardware classes, and anything extra its constructor needs
+Backend = collections.namedtuple("Backend", "Radio GPIO freq_band options")
+
+# How a radio is wired up: its SPI chip select (0 for CE0, 1 for CE1) and the
+# board pins for its reset and DIO0-2
+Wiring = collections.namedtuple(
+    "Wiring", "spi_device reset_pin int_pin dio1_pin dio2_pin"
+)
+GARAGE_WIRING = Wiring(0, RESET_PIN, INT_PIN, DIO1_PIN, DIO2_PIN)
+
+
+def load_wirings(path=RADIOS_FILE):
+    """Wirings of every radio, from a list of {field: value} in a radios file,
+    or just GARAGE_WIRING without one"""
+    try:
+        with open(path, encoding="utf-8") as file:
+            found = json.load(file)
+    except FileNotFoundError:
+        return [GARAGE_WIRING]
+    wirings = [Wiring(**fields) for fields in found]
+    pins = [pin for wiring in wirings for pin in wiring[1:]]
+    if len(set(pins)) != len(pins):
+        raise ValueError(f"Radios in {path} share pins: {wirings}")
+    return wirings
+
+
+def load_backend(name=GARAGE_RADIO, wiring=GARAGE_WIRING):
+    """Import a radio backend, only touching hardware modules if it's "rfm69" """
+    # pylint: disable=import-outside-toplevel
+    if name == "rfm69":
+        from RFM69 import Radio, FREQ_433MHZ
+        import RPi.GPIO as GPIO  # pylint: disable=consider-using-from-import
+
+        return Backend(Radio, GPIO, FREQ_433MHZ, {})
+    if name == "sim":
+        import garage_sim
+
+        # Each simulated radio gets its own pins
+        gpio = garage_sim.SimulatedGPIO()
+        return Backend(
+            garage_sim.SimulatedRadio,
+            gpio,
+            None,
+            {
+                "gpio": gpio,
+                "dioPins": (wiring.int_pin, wiring.dio1_pin, wiring.dio2_pin),
+                "time_scale": float(os.environ.get("GARAGE_SIM_TIME_SCALE", 1)),
+            },
+        )
+    raise ValueError(f"Unknown radio backend: {name}")
+
+
+_EVENTS = {}
+
+
+def open_radio(backend=GARAGE_RADIO, wiring=GARAGE_WIRING):
+    """Construct the Radio, for use as a context manager"""
+    hardware = load_backend(backend, wiring)
+    with RADIO_INIT_SECONDS.time():
+        radio = hardware.Radio(
+            hardware.freq_band,
+            NODE_ID,
+            NETWORK_ID,
+            isHighPower=True,
+            power=100,
+            verbose=True,
+            autoAcknowledge=False,
+            promiscuousMode=True,
+            use_board_pin_numbers=True,
+            interruptPin=wiring.int_pin,
+            resetPin=wiring.reset_pin,
+            spiBus=0,
+            spiDevice=wiring.spi_device,
+            **hardware.options,
+        )
+    garage_metrics.count_spi(radio)
+    _EVENTS[radio] = garage_events.RadioEvents(
+        radio, hardware.GPIO, (wiring.int_pin, wiring.dio1_pin, wiring.dio2_pin)
+    )
+    return radio
+
+
+def radio_events(radio):
+    """The DIO event waits for a radio from open_radio()"""
+    return _EVENTS[radio]
+
+
+def release_radio(radio):
+    """Stop watching the DIO pins of a radio which has been shut down"""
+    _EVENTS.pop(radio).close()
+
+
+class RadioSlot:
+    """A radio in a RadioPool, its lock, the device it's tuned for, and the
+    device it's armed for (see arm()), with the registers it was armed with"""
+
+    def __init__(self, index, radio):
+        self.index = index
+        self.radio = radio
+        self.lock = threading.Lock()
+        self.device = None
+        self.used = 0
+        self.armed = None
+        self.registers = None
+
+
+class RadioPool:
+    """Radios on their own chip selects, handed out one burst at a time.
+
+    acquire() prefers a free radio already tuned for the device, then
+    whichever free radio has been idle longest, so bursts for different
+    devices go out in parallel and each device tends to keep its own radio.
+    """
+
+    def __init__(self, radios):
+        self.slots = [RadioSlot(index, radio) for index, radio in enumerate(radios)]
+        self._freed = threading.Condition()
+
+    def _take(self, device, prefer):
+        """A free slot tuned for device, or unless prefer and one is tuned,
+        the free slot idle longest, else None. Never blocks, it runs under
+        _freed."""
+        tuned = [slot for slot in self.slots if slot.device == device]
+        for slot in tuned:
+            if slot.lock.acquire(blocking=False):
+                return slot
+        if prefer and tuned:
+            return None
+        for slot in sorted(self.slots, key=lambda slot: slot.used):
+            if slot.lock.acquire(blocking=False):
+                return slot
+        return None
+
+    @contextlib.contextmanager
+    def acquire(self, device):
+        """Hold a RadioSlot for a burst of device, waiting while all are busy.
+        Set its device once it has been tuned."""
+        deadline = time.monotonic() + POOL_PREFER_WAIT
+
+        def take():
+            return self._take(device, time.monotonic() < deadline)
+
+        # Waiting on _freed lets it go, so releases aren't held up meanwhile
+        with self._freed:
+            slot = self._freed.wait_for(take, POOL_PREFER_WAIT)
+            if not slot:
+                # Past the deadline, so any free radio will do
+                slot = self._freed.wait_for(take)
+        try:
+            yield slot
+        finally:
+            slot.used = time.monotonic()
+            self._release(slot)
+
+    @contextlib.contextmanager
+    def hold(self, slot):
+        """Hold a particular slot between bursts, e.g. to arm() it"""
+        slot.lock.acquire()
+        try:
+            yield slot
+        finally:
+            self._release(slot)
+
+    def _release(self, slot):
+        slot.lock.release()
+        with self._freed:
+            self._freed.notify_all()
+
+
+def arm(radio, device=None):
+    """Hot standby: leave the radio in standby with the first FIFO load of a
+    device's signal written, so transmit(armed=True) starts with the switch to
+    TX. Assumes register_setup() with the device's groups, and only holds
+    while nothing else touches the radio, receiving especially."""
+    device = device or garage()
+    garage_stream.fifo_arm(radio, first_load(device))
+
+
+def first_load(device):
+    """What arm() leaves in the FIFO for a device"""
+    return bytes(next(garage_stream.fifo_chunks(device.waveform.payload)))
+
+
+def transmit(radio, clear_to_send=True, device=None, armed=False):
+    """Send a device's signal (by default the garage's), assumes
+    register_setup() has been applied with the device's groups, and if armed,
+    arm() since"""
+    # Sending this as 32 separate radio.send() packets, the second packet
+    # always got a 1 bit prefixed, and needed a blind sleep between packets.
+    # Streaming it as one unlimited length packet has neither problem.
+    device = device or garage()
+    waveform = device.waveform
+    total = len(waveform.payload)
+    LOG.info(
+        "Sending {repeats} repeats for {device}"
+        + (" from hot standby" if armed else "")
+        + ", {bytes} bytes, {airtime:.2f}s on air...",
+        repeats=device.profile.repeats,
+        device=device.name,
+        armed=armed,
+        bytes=total,
+        airtime=waveform.airtime,
+    )
+    if not clear_to_send:
+        LOG.warning("Not really sending, a dry run")
+        return
+
+    def progress(sent):
+        LOG.debug("Sent {sent}/{total} bytes", sent=sent, total=total)
+
+    with TRANSMIT_SECONDS.time():
+        garage_stream.stream_transmit(
+            radio,
+            radio_events(radio),
+            garage_stream.fifo_chunks(waveform.payload),
+            waveform.bitrate.bitrate,
+            progress,
+            armed,
+        )
+
+
+# The old flags, as subcommands
+LEGACY_FLAGS = {"-t": ["dry-run"], "-d": ["transmit", "--dump"]}
+
+
+def load_device(name=GARAGE_DEVICE, repeats=None):
+    """Compile just the named device from the profiles file, with repeats if given"""
+    profiles = load_profiles()
+    if name not in profiles:
+        raise ValueError(f"Unknown device {name}, not one of {sorted(profiles)}")
+    if name == GARAGE_DEVICE and profiles[name] == GARAGE_PROFILE:
+        # Not overridden in the profiles file, so the one already compiled
+        device = garage()
+    else:
+        device = compile_device(name, profiles[name])
+    return device if repeats is None else with_repeats(device, repeats)
+
+
+def command_transmit(args):
+    device = load_device(args.device, args.repeats)
+    with open_radio(args.radio) as radio:
+        try:
+            LOG.section("RFM69 Register Setup")
+            register_setup(radio, groups=device.groups)
+            if args.dump:
+                register_debug(radio, form=args.format)
+            transmit(radio, True, device)
+        finally:
+            release_radio(radio)
+
+
+def command_dry_run(args):
+    transmit(None, False, load_device(args.device, args.repeats))
+
+
+def command_dump_registers(args):
+    with open_radio(args.radio) as radio:
+        try:
+            if args.setup:
+                LOG.section("RFM69 Register Setup")
+                register_setup(radio, groups=load_device(args.device).groups)
+            register_debug(radio, form=args.format)
+        finally:
+            release_radio(radio)
+
+
+def command_receive(args):
+    with open_radio(args.radio) as radio:
+        try:
+            receiveFunction(radio)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            release_radio(radio)
+
+
+def main(argv=None):
+    # pylint: disable=import-outside-toplevel
+    import argparse
+
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv:
+        argv = ["transmit"]
+    elif argv[0] in LEGACY_FLAGS:
+        argv = LEGACY_FLAGS[argv[0]] + argv[1:]
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    commands = parser.add_subparsers(dest="command", required=True)
+    radio = argparse.ArgumentParser(add_help=False)
+    radio.add_argument(
+        "--radio", choices=("rfm69", "sim"), default=GARAGE_RADIO, help="backend"
+    )
+    device = argparse.ArgumentParser(add_help=False)
+    device.add_argument("--device", default=GARAGE_DEVICE, help="profile name")
+    device.add_argument("--repeats", type=int, help="instead of the profile's")
+    form = argparse.ArgumentParser(add_help=False)
+    form.add_argument("--format", choices=("human", "json", "compact"), default="human")
+
+    transmit_parser = commands.add_parser(
+        "transmit", parents=[radio, device, form], help="send a device's signal (-d)"
+    )
+    transmit_parser.add_argument(
+        "--dump", action="store_true", help="dump the registers after setup"
+    )
+    transmit_parser.set_defaults(func=command_transmit)
+    commands.add_parser(
+        "dry-run", parents=[device], help="what transmit would send, no radio (-t)"
+    ).set_defaults(func=command_dry_run)
+    dump_parser = commands.add_parser(
+        "dump-registers", parents=[radio, device, form], help="decode the registers"
+    )
+    dump_parser.add_argument(
+        "--setup", action="store_true", help="set up for the device first"
+    )
+    dump_parser.set_defaults(func=command_dump_registers)
+    commands.add_parser(
+        "receive", parents=[radio], help="log packets until interrupted"
+    ).set_defaults(func=command_receive)
+    args = parser.parse_args(argv)
+
+    LOG.info(
+        "Started in {startup:.0f}ms", startup=(time.perf_counter() - STARTED) * 1000
+    )
+    try:
+        args.func(args)
+    except ValueError as error:
+        parser.error(str(error))
+    LOG.success("Finished!")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+""" Single-flight transmit scheduler, coalescing concurrent requests """
+
+import collections
+import queue
+import threading
+import uuid
+
+# Distinct commands waiting behind the one on air
+SCHEDULER_QUEUE = 4
+# Finished jobs kept around for status and progress lookups
+SCHEDULER_RECENT = 32
+
+
+class SchedulerBusy(Exception):
+    """The queue is full, the caller should back off and retry"""
+
+
+class Job:
+    """One scheduled transmission, shared by every request coalesced into it"""
+
+    def __init__(self, key, func):
+        self.id = uuid.uuid4().hex
+        self.key = key
+        self.func = func
+        self.callers = 1
+        self.result = None
+        self.error = None
+        self.events = []
+        self.started = False
+        self.cancelled = False
+        # Whether anyone follows its progress, known before it starts
+        self.watched = False
+        self.done = threading.Event()
+        self._changed = threading.Condition()
+
+    def publish(self, event):
+        """Record a progress event and wake anyone following the job"""
+        with self._changed:
+            self.events.append(event)
+            self._changed.notify_all()
+
+    def finish(self, result=None, error=None):
+        with self._changed:
+            self.result = result
+            self.error = error
+            self.done.set()
+            self._changed.notify_all()
+
+    def follow(self, timeout=None):
+        """Yield progress events as they arrive, until the job is done.
+
+        Yields None whenever timeout passes with nothing new, so a streaming
+        response can send a keepalive.
+        """
+        seen = 0
+        while True:
+            with self._changed:
+                self._changed.wait_for(
+                    lambda: len(self.events) > seen or self.done.is_set(), timeout
+                )
+                events = self.events[seen:]
+                finished = self.done.is_set()
+            seen += len(events)
+            if events:
+                yield from events
+            elif not finished:
+                yield None
+            if finished:
+                return
+
+    def wait(self, timeout=None):
+        """Block until the job has run and return its result"""
+        if not self.done.wait(timeout):
+            raise TimeoutError(f"{self.key} still pending after {timeout}s")
+        if self.error:
+            raise self.error
+        return self.result
+
+
+class TransmitScheduler:
+    """Run jobs on worker threads, one at a time each.
+
+    A request for a key which is already queued or on air joins that job
+    rather than running again. Distinct keys queue up to maxsize deep, past
+    that submit() raises SchedulerBusy instead of building up latency.
+    Jobs are called as func(publish), publish taking progress events, or None
+    if no one is watching the job. With more than one worker, as many jobs
+    run at once, e.g. one per radio.
+    """
+
+    def __init__(self, maxsize=SCHEDULER_QUEUE, workers=1):
+        self._queue = queue.Queue(maxsize)
+        self._lock = threading.Lock()
+        self._jobs = {}
+        self._recent = collections.OrderedDict()
+        self._workers = [
+            threading.Thread(target=self._run, daemon=True) for _ in range(workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(self, key, func, watched=False):
+        """Schedule func under key, or join the job already running it.
+        watched says the caller will follow its progress."""
+        with self._lock:
+            job = self._jobs.get(key)
+            if job:
+                job.callers += 1
+                job.watched = job.watched or watched
+                return job
+            job = Job(key, func)
+            job.watched = watched
+            try:
+                self._queue.put_nowait(job)
+            except queue.Full:
+                raise SchedulerBusy(
+                    f"{self._queue.qsize()} transmissions already queued"
+                ) from None
+            self._jobs[key] = job
+            self._recent[job.id] = job
+            while len(self._recent) > SCHEDULER_RECENT:
+                self._recent.popitem(last=False)
+        return job
+
+    def cancel(self, job):
+        """A caller gives up on a job, which is dropped if no one else is
+        waiting for it and it hasn't started. Returns whether it was."""
+        with self._lock:
+            job.callers -= 1
+            if job.callers or job.started or job.done.is_set():
+                return False
+            # Still queued, the worker skips it when it comes up
+            job.cancelled = True
+            del self._jobs[job.key]
+        job.finish((False, "Cancelled before it was sent"))
+        return True
+
+    def get(self, job_id):
+        """Look up a queued, running or recently finished job by id"""
+        with self._lock:
+            return self._recent.get(job_id)
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            with self._lock:
+                if job.cancelled:
+                    continue
+                job.started = True
+            try:
+                result, error = job.func(job.publish if job.watched else None), None
+            except Exception as err:  # pylint: disable=broad-except
+                result, error = None, err
+            with self._lock:
+                del self._jobs[job.key]
+            job.finish(result, error)
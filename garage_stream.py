@@ -0,0 +1,93 @@
+""" Gapless unlimited-length transmission, keeping the RFM69 FIFO topped up """
+
+import time
+
+from garage_metrics import REGISTRY, spi_xfer
+from garage_registers import (
+    REG_FIFO,
+    REG_IRQFLAGS2,
+    RF_IRQFLAGS2_FIFOOVERRUN,
+    RF69_MODE_STANDBY,
+    RF69_MODE_TX,
+)
+
+# The FIFO holds 66 bytes. FifoLevel (DIO1) is high while it holds more than
+# FIFO_THRESHOLD bytes, so once it drops there is room for a full refill.
+FIFO_SIZE = 66
+FIFO_THRESHOLD = 32
+FIFO_REFILL = FIFO_SIZE - FIFO_THRESHOLD
+
+FIFO_WRITE_SECONDS = REGISTRY.histogram(
+    "garage_fifo_write_seconds", "Burst writes into the FIFO"
+)
+TX_BYTES = REGISTRY.counter("garage_tx_bytes_total", "Payload bytes sent on air")
+
+
+def fifo_chunks(payload):
+    """Split a payload into a full first FIFO load, then refill sized chunks"""
+    payload = memoryview(payload)
+    yield payload[:FIFO_SIZE]
+    for offset in range(FIFO_SIZE, len(payload), FIFO_REFILL):
+        yield payload[offset : offset + FIFO_REFILL]
+
+
+def fifo_write(radio, chunk):
+    """Burst write a chunk into the FIFO"""
+    with FIFO_WRITE_SECONDS.time():
+        spi_xfer(radio, [REG_FIFO | 0x80] + list(chunk))
+
+
+def fifo_arm(radio, chunk):
+    """Load the first chunk into an emptied FIFO, leaving the radio in standby.
+
+    With TxStartCondition FifoNotEmpty, switching to TX is then all it takes
+    to start sending, see stream_transmit(armed=True).
+    """
+    # The FIFO can be written before standby is ready, and TxReady only
+    # comes once TX is, see garage_events.FLAG_SIGNALS
+    radio._setMode(RF69_MODE_STANDBY)
+    # Writing FifoOverrun clears anything left over in the FIFO
+    radio._writeReg(REG_IRQFLAGS2, RF_IRQFLAGS2_FIFOOVERRUN)
+    fifo_write(radio, chunk)
+
+
+def stream_transmit(radio, events, chunks, bitrate, progress=None, armed=False):
+    """Send chunks as one continuous unlimited-length packet.
+
+    Expects the radio set up for unlimited length packets (PayloadLength 0),
+    TxStartCondition FifoNotEmpty, FifoThreshold FIFO_THRESHOLD, and the DIO
+    mapping garage_events relies on. The first chunk must fit the FIFO and
+    later ones FIFO_REFILL, as fifo_chunks() yields them. If armed, the first
+    chunk is already in the FIFO from fifo_arm(), and isn't written again.
+    """
+    # Worst case for the FIFO to drain to the threshold, plus slack
+    timeout = FIFO_SIZE * 8 / bitrate + 0.5
+
+    chunks = iter(chunks)
+    first = next(chunks, None)
+    if first is None:
+        return 0
+    if not armed:
+        fifo_arm(radio, first)
+
+    try:
+        # TxStartCondition is FifoNotEmpty, so bits flow once TxReady
+        radio._setMode(RF69_MODE_TX)
+        events.wait("tx_ready")
+        sent = len(first)
+        TX_BYTES.inc(sent)
+        if progress:
+            progress(sent)
+        for chunk in chunks:
+            events.wait("fifo_below_threshold", timeout)
+            fifo_write(radio, chunk)
+            sent += len(chunk)
+            TX_BYTES.inc(len(chunk))
+            if progress:
+                progress(sent)
+        events.wait("fifo_empty", timeout)
+        # The last byte still has to leave the shift register
+        time.sleep(8 / bitrate)
+    finally:
+        radio._setMode(RF69_MODE_STANDBY)
+    return sent
@@ -0,0 +1,250 @@
+#!/usr/bin/python3
+""" Radio telemetry: RSSI, IRQ flags, FEI and mode sampled into a ring buffer """
+
+import argparse
+import array
+import threading
+import time
+
+import garage_metrics
+from garage_registers import (
+    REG_AFCFEI,
+    REG_FEILSB,
+    REG_FEIMSB,
+    REG_IRQFLAGS1,
+    REG_IRQFLAGS2,
+    REG_OPMODE,
+    REG_RSSIVALUE,
+    RF_AFCFEI_FEI_START,
+    RF69_MODE_RX,
+    RF69_MODE_STANDBY,
+)
+
+# How often main() collects new samples from the daemon
+RECORD_POLL = 1.0
+# Samples kept, at 200Hz a little over five minutes
+TELEMETRY_CAPACITY = 65536
+# A sample is one burst read from RegOpMode up to RegIrqFlags2
+TELEMETRY_LAST = REG_IRQFLAGS2
+FSTEP = 32000000 / 2**19
+
+# Sample columns, and the array typecode each is stored as
+FIELDS = (
+    ("t", "d"),  # time.time() of the sample
+    ("rssi", "f"),  # dBm
+    ("fei", "f"),  # Hz
+    ("irqflags1", "B"),
+    ("irqflags2", "B"),
+    ("opmode", "B"),
+)
+FIELD_NAMES = tuple(name for name, _ in FIELDS)
+
+SAMPLES = garage_metrics.REGISTRY.counter(
+    "garage_telemetry_samples_total", "Telemetry samples taken"
+)
+SKIPPED = garage_metrics.REGISTRY.counter(
+    "garage_telemetry_skipped_total", "Telemetry samples skipped, radio busy"
+)
+
+
+class Ring:
+    """Fixed size sample history, a preallocated array per column.
+
+    Samples are numbered from 0 as they are appended, so readers can ask for
+    everything after the last one they saw.
+    """
+
+    def __init__(self, capacity=TELEMETRY_CAPACITY):
+        self.capacity = capacity
+        self.columns = [
+            array.array(code, bytes(array.array(code).itemsize * capacity))
+            for _, code in FIELDS
+        ]
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def append(self, *values):
+        with self._lock:
+            index = self.count % self.capacity
+            for column, value in zip(self.columns, values):
+                column[index] = value
+            self.count += 1
+
+    def _rows(self, first, last):
+        return [
+            tuple(column[seq % self.capacity] for column in self.columns)
+            for seq in range(first, last)
+        ]
+
+    def since(self, seq=0, limit=None):
+        """(next seq, rows) for samples numbered seq onwards still held,
+        a seq of None only gets the next number"""
+        with self._lock:
+            if seq is None:
+                return self.count, []
+            first = max(seq, self.count - self.capacity, 0)
+            last = self.count if limit is None else min(self.count, first + limit)
+            return last, self._rows(first, last)
+
+    def window(self, seconds):
+        """Rows from the last seconds"""
+        with self._lock:
+            times = self.columns[0]
+            first = max(self.count - self.capacity, 0)
+            since = time.time() - seconds
+            # Times only increase, so bisect back from the newest sample
+            low, high = first, self.count
+            while low < high:
+                middle = (low + high) // 2
+                if times[middle % self.capacity] < since:
+                    low = middle + 1
+                else:
+                    high = middle
+            return self._rows(low, self.count)
+
+    def downsample(self, seconds, points):
+        """The last seconds in points buckets: min/mean/max RSSI and FEI,
+        IRQ flags OR'd together, and the last mode"""
+        since = time.time() - seconds
+        width = seconds / points
+        buckets = {}
+        for row in self.window(seconds):
+            bucket = min(int((row[0] - since) / width), points - 1)
+            buckets.setdefault(bucket, []).append(row)
+        views = []
+        for bucket, rows in sorted(buckets.items()):
+            view = {"t": since + bucket * width, "count": len(rows)}
+            for name in ("rssi", "fei"):
+                values = [row[FIELD_NAMES.index(name)] for row in rows]
+                view[name] = (min(values), sum(values) / len(values), max(values))
+            for name in ("irqflags1", "irqflags2"):
+                flags = 0
+                for row in rows:
+                    flags |= row[FIELD_NAMES.index(name)]
+                view[name] = flags
+            view["opmode"] = rows[-1][FIELD_NAMES.index("opmode")]
+            views.append(view)
+        return views
+
+
+def sample(radio, trigger_fei=False):
+    """One burst read of RegOpMode to RegIrqFlags2, as a row for the Ring"""
+    regs = garage_metrics.spi_xfer(radio, [REG_OPMODE & 0x7F] + [0] * TELEMETRY_LAST)
+    fei = regs[REG_FEIMSB] << 8 | regs[REG_FEILSB]
+    if fei & 0x8000:
+        fei -= 0x10000
+    if trigger_fei:
+        # Measured by the next sample
+        radio._writeReg(REG_AFCFEI, regs[REG_AFCFEI] | RF_AFCFEI_FEI_START)
+    return (
+        time.time(),
+        -regs[REG_RSSIVALUE] / 2,
+        fei * FSTEP,
+        regs[REG_IRQFLAGS1],
+        regs[REG_IRQFLAGS2],
+        regs[REG_OPMODE],
+    )
+
+
+class Sampler:
+    """Samples a radio at rate Hz into a Ring, while it isn't transmitting.
+
+    Shares the lock transmissions hold, but never waits on it: a sample due
+    mid-burst is skipped. Between bursts the radio is kept receiving, which
+    is what RSSI and FEI need to mean anything.
+    """
+
+    def __init__(self, radio, lock, ring=None, rate=0, trigger_fei=False):
+        self.radio = radio
+        self.lock = lock
+        self.ring = ring or Ring()
+        self.rate = rate
+        self.trigger_fei = trigger_fei
+        self._changed = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def set_rate(self, rate):
+        """Sample at rate Hz, 0 stops sampling and leaves the radio in standby"""
+        self.rate = rate
+        self._changed.set()
+
+    def _run(self):
+        due = time.monotonic()
+        while True:
+            if not self.rate:
+                if self.lock.acquire(blocking=False):
+                    try:
+                        self.radio._setMode(RF69_MODE_STANDBY)
+                    finally:
+                        self.lock.release()
+                self._changed.wait()
+                self._changed.clear()
+                due = time.monotonic()
+                continue
+            due += 1 / self.rate
+            delay = due - time.monotonic()
+            if delay < 0:
+                # Fell behind, don't try to catch up with a burst of samples
+                due = time.monotonic()
+            elif self._changed.wait(delay):
+                self._changed.clear()
+                due = time.monotonic()
+                continue
+            self._sample()
+
+    def _sample(self):
+        if not self.lock.acquire(blocking=False):
+            SKIPPED.inc()
+            return
+        try:
+            if self.radio.mode != RF69_MODE_RX:
+                self.radio._setMode(RF69_MODE_RX)
+            self.ring.append(*sample(self.radio, self.trigger_fei))
+            SAMPLES.inc()
+        finally:
+            self.lock.release()
+
+
+def main():
+    """Record the daemon's RSSI samples to a garage_capfile, for garage_analyze"""
+    # Only the recorder needs these, the daemon imports this module
+    import garage_capfile
+    import garage_radiod
+
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument("file")
+    parser.add_argument("-s", "--seconds", type=float, help="default, until ^C")
+    parser.add_argument("--rate", type=float, help="ask the daemon to sample at")
+    parser.add_argument("--note", default="")
+    args = parser.parse_args()
+
+    client = garage_radiod.RadiodClient()
+    if args.rate:
+        client.request({"cmd": "monitor", "rate": args.rate})
+    until = args.seconds and time.monotonic() + args.seconds
+    seq = client.request({"cmd": "telemetry", "since": None})["next"]
+    # Sample times are already wall clock, in seconds
+    with garage_capfile.CaptureWriter(
+        args.file, garage_capfile.KIND_RSSI, note=args.note, epoch_ns=0
+    ) as writer:
+        print(f"[*] Recording RSSI to {args.file}...")
+        try:
+            while not until or time.monotonic() < until:
+                time.sleep(RECORD_POLL)
+                reply = client.request({"cmd": "telemetry", "since": seq})
+                if reply["next"] - seq > len(reply["samples"]):
+                    print(f"[!] Missed {reply['next'] - seq - len(reply['samples'])}")
+                seq = reply["next"]
+                rows = reply["samples"]
+                writer.write(
+                    [round(row[0] * 1e9) for row in rows],
+                    [min(round(-row[1] * 2), 255) for row in rows],
+                )
+        except KeyboardInterrupt:
+            pass
+    print(f"[+] Saved {writer.count} samples to {args.file}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+#!/usr/bin/python3
+""" Symbol timing and bitrate estimation from edge captures.
+
+Every run inside a frame lasts a whole number of symbols, give or take edge
+jitter, and OOK receivers stretch marks (and so shrink spaces) by a constant
+amount. So once a histogram of run lengths gives a rough symbol time, the
+count of symbols in each run is known and a least squares fit of
+
+    duration = symbol_us * symbols + (mark or space offset)
+
+over thousands of runs gives the symbol time, with a confidence interval from
+the residuals, free of the mark/space skew. From that comes the nearest
+RegBitrate setting the radio can do.
+"""
+
+import argparse
+import collections
+
+import numpy as np
+
+import garage_analyze
+import garage_capfile
+import garage_capture
+import garage_ook
+import garage_rfm69
+
+# Two sided 95% confidence, for the intervals reported
+CONFIDENCE_Z = 1.96
+# Refinements of the symbol time, each recounting symbols per run
+TIMING_ROUNDS = 3
+
+# The fitted symbol time and its confidence interval, the mark and space
+# offsets, the jitter left on each run, and how many runs were fitted and
+# rejected as too far from a whole number of symbols
+Timing = collections.namedtuple(
+    "Timing", "symbol_us low_us high_us mark_us space_us jitter_us runs rejected"
+)
+
+
+def frame_runs(records, gap_us=None):
+    """(levels, durations_us) of every run inside a frame of an edge capture"""
+    found = [
+        (levels, durations)
+        for levels, durations, _ in garage_capture.frames(
+            garage_capture.pulses(garage_analyze.chunks(records)), gap_us
+        )
+        if len(levels) >= garage_capture.FRAME_MIN_RUNS
+    ]
+    if not found:
+        return np.empty(0, np.uint8), np.empty(0)
+    levels, durations = zip(*found)
+    return np.concatenate(levels), np.concatenate(durations)
+
+
+def estimate(levels, durations, tolerance=garage_capture.SYMBOL_TOLERANCE):
+    """Fit a Timing to runs, raising ValueError if they can't pin one down"""
+    if len(durations) < 4:
+        raise ValueError(f"Too few runs to estimate timing from: {len(durations)}")
+    marks = (levels != 0).astype(float)
+    # Rough start, the shorter runs being one symbol long
+    unit = np.percentile(durations, 25)
+    for _ in range(TIMING_ROUNDS):
+        ratio = durations / unit
+        counts = np.maximum(np.rint(ratio), 1)
+        kept = np.abs(ratio - counts) <= tolerance
+        design = np.column_stack((counts, marks, 1 - marks))[kept]
+        fit, _, rank, _ = np.linalg.lstsq(design, durations[kept], rcond=None)
+        if rank < 3:
+            raise ValueError("Runs are all the same length, or all marks or spaces")
+        unit = fit[0]
+
+    residuals = durations[kept] - design @ fit
+    variance = residuals @ residuals / max(len(residuals) - 3, 1)
+    error = np.sqrt(variance * np.linalg.inv(design.T @ design)[0, 0])
+    return Timing(
+        float(unit),
+        float(unit - CONFIDENCE_Z * error),
+        float(unit + CONFIDENCE_Z * error),
+        float(fit[1]),
+        float(fit[2]),
+        float(np.sqrt(variance)),
+        int(kept.sum()),
+        int((~kept).sum()),
+    )
+
+
+def bitrate(timing, symbol_bits=1):
+    """(bitrate, low, high) in bps for symbol_bits radio bits per symbol"""
+    return tuple(
+        symbol_bits * 1e6 / us
+        for us in (timing.symbol_us, timing.high_us, timing.low_us)
+    )
+
+
+def report(timing, symbol_bits, symbols=garage_rfm69.GARAGE_SYMBOLS):
+    rate, low, high = bitrate(timing, symbol_bits)
+    setting = garage_ook.bitrate_registers(rate)
+    current = garage_rfm69.waveform().bitrate
+    current_ppm = (current.bitrate - rate) / rate * 1e6
+    half_ppm = (high - low) / 2 / rate * 1e6
+
+    print(
+        f"[+] Symbol time {timing.symbol_us:.2f}us "
+        f"({timing.low_us:.2f}-{timing.high_us:.2f}us, 95%) "
+        f"from {timing.runs} runs, {timing.rejected} rejected"
+    )
+    print(
+        f"[+] Marks {timing.mark_us:+.1f}us, spaces {timing.space_us:+.1f}us, "
+        f"jitter {timing.jitter_us:.1f}us per run"
+    )
+    print(
+        f"[+] {symbol_bits} bit(s) per symbol, bitrate {rate:.2f}bps "
+        f"({low:.2f}-{high:.2f}bps, +/-{half_ppm:.0f}ppm)"
+    )
+    print(
+        f"[+] Nearest setting RegBitrate 0x{setting.msb:02x}{setting.lsb:02x}, "
+        f"{setting.bitrate:.2f}bps ({setting.error_ppm:+.0f}ppm)"
+    )
+    # How far out of step the last edge of a frame would be
+    drift_us = abs(current_ppm) / 1e6 * len(symbols) * timing.symbol_us
+    print(
+        f"[{'+' if low <= current.bitrate <= high else '!'}] Currently "
+        f"RegBitrate 0x{current.msb:02x}{current.lsb:02x}, "
+        f"{current.bitrate:.2f}bps ({current_ppm:+.0f}ppm, "
+        f"{drift_us:.1f}us over a frame)"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("files", nargs="+", help="garage_capture --record files")
+    parser.add_argument("--gap-us", type=float, help="default, from the pulses")
+    parser.add_argument(
+        "--symbol-bits",
+        type=int,
+        default=garage_rfm69.waveform().symbol_bits,
+        help="radio bits sent per symbol",
+    )
+    parser.add_argument(
+        "--tolerance", type=float, default=garage_capture.SYMBOL_TOLERANCE
+    )
+    args = parser.parse_args()
+
+    runs = []
+    for path in args.files:
+        header, records = garage_capfile.open_capture(path)
+        if header.kind != garage_capfile.KIND_EDGES:
+            raise SystemExit(f"[!] {path} is not an edge capture")
+        runs.append(frame_runs(records, args.gap_us))
+    levels, durations = (np.concatenate(column) for column in zip(*runs))
+
+    counts = collections.Counter(
+        np.rint(durations / np.percentile(durations, 25)).astype(int).tolist()
+        if len(durations)
+        else []
+    )
+    print(
+        f"[*] {len(durations)} runs in frames, by rough symbols long : "
+        + ", ".join(f"{k}x{count}" for k, count in sorted(counts.items()))
+    )
+    try:
+        timing = estimate(levels, durations, args.tolerance)
+    except ValueError as error:
+        raise SystemExit(f"[!] {error}") from error
+    report(timing, args.symbol_bits)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+""" The benchmark cases, run a few rounds each against the simulated radio """
+
+import pytest
+
+import garage_bench
+import garage_rfm69
+
+ROUNDS = 5
+
+
+@pytest.fixture
+def env(monkeypatch):
+    """The bench's Environment: a simulated radio and a daemon serving it"""
+    monkeypatch.setenv("GARAGE_SIM_TIME_SCALE", "0")
+    env = garage_bench.Environment(0)
+    yield env
+    env.close()
+
+
+def check(result, rounds=ROUNDS):
+    assert result["rounds"] == rounds
+    assert 0 < result["p50"] <= result["p95"] <= result["p99"]
+    assert result["ops"] > 0
+
+
+@pytest.mark.parametrize("name", ["payload.compile", "payload.cached"])
+def test_compile(env, name):
+    func = garage_bench.CASES[name][0](env)
+    assert func() == garage_rfm69.waveform(garage_rfm69.GARAGE_STREAM_REPEATS)
+    check(garage_bench.measure(func, ROUNDS, 1))
+
+
+@pytest.mark.parametrize("name", ["register_setup.cold", "register_setup.warm"])
+def test_register_setup(env, name):
+    check(garage_bench.measure(garage_bench.CASES[name][0](env), ROUNDS, 1))
+    assert not garage_rfm69.register_verify(
+        env.radio, garage_rfm69.register_snapshot(env.radio)
+    )
+
+
+def test_send(env):
+    func = garage_bench.CASES["send.stream"][0](env)
+    check(garage_bench.measure(func, ROUNDS, 1))
+    payload = garage_rfm69.garage().waveform.payload
+    assert bytes(env.radio.transmitted) == payload * ROUNDS
+
+
+@pytest.mark.parametrize("clients", [1, 4])
+def test_dispatch(env, clients):
+    func = garage_bench.CASES["dispatch.pulse"][0](env)
+    check(garage_bench.measure(func, ROUNDS, clients), ROUNDS * clients)
+    # Dry runs, nothing on air
+    assert not env.radio.transmitted
+
+
+def test_compare():
+    baseline = {"fast": {"p50": 1.0}, "slow": {"p50": 1.0}}
+    results = {"fast": {"p50": 1.2}, "slow": {"p50": 1.3}, "new": {"p50": 9.0}}
+    assert garage_bench.compare(results, baseline, 0.25) == ["slow"]
@@ -0,0 +1,23 @@
+"""The capture decoder, fed the garage's own waveform as runs"""
+
+import numpy as np
+import pytest
+
+import garage_capture
+import garage_ook
+import garage_rfm69
+
+
+@pytest.mark.parametrize("time_scale", [0.1, 1, 10])
+def test_frames_split_at_any_time_base(time_scale):
+    waveform = garage_rfm69.waveform()
+    runs = garage_ook.waveform_runs(waveform) + [(0, 1.0)]
+    levels = np.array([level for level, _ in runs], np.uint8)
+    durations = np.array([seconds * 1e6 * time_scale for _, seconds in runs])
+    starts = np.cumsum(durations * 1000).astype(np.int64)
+    decoded = garage_capture.symbols(
+        garage_capture.frames(iter([(levels, durations, starts)]))
+    )
+    assert [frame.symbols for frame in decoded] == [
+        garage_rfm69.GARAGE_SYMBOLS
+    ] * garage_rfm69.GARAGE_REPEATS
@@ -0,0 +1,48 @@
+"""RadioPool handing out radios, the radios themselves being stand-ins"""
+
+import threading
+import time
+
+import garage_rfm69
+
+
+def test_acquire_prefers_the_tuned_radio():
+    pool = garage_rfm69.RadioPool(["a", "b"])
+    pool.slots[0].device = "garage"
+    pool.slots[1].used = -1
+    with pool.acquire("garage") as slot:
+        assert slot.radio == "a"
+
+
+def test_acquire_retunes_a_free_radio_when_the_tuned_one_stays_busy():
+    pool = garage_rfm69.RadioPool(["a", "b"])
+    pool.slots[0].device = "garage"
+    with pool.hold(pool.slots[0]):
+        start = time.monotonic()
+        with pool.acquire("garage") as slot:
+            assert slot.radio == "b"
+        assert time.monotonic() - start >= garage_rfm69.POOL_PREFER_WAIT
+
+
+def test_release_isnt_held_up_by_a_waiting_acquire(monkeypatch):
+    monkeypatch.setattr(garage_rfm69, "POOL_PREFER_WAIT", 1.0)
+    pool = garage_rfm69.RadioPool(["a", "b"])
+    tuned, other = pool.slots
+    tuned.device = "garage"
+    acquired = []
+
+    def waiter():
+        with pool.acquire("garage") as slot:
+            acquired.append(slot)
+
+    with pool.hold(tuned):
+        other.lock.acquire()
+        thread = threading.Thread(target=waiter)
+        thread.start()
+        # The waiter is now waiting out POOL_PREFER_WAIT for the tuned radio
+        time.sleep(0.1)
+        start = time.monotonic()
+        pool._release(other)
+        assert time.monotonic() - start < 0.5
+    thread.join(2)
+    assert acquired == [tuned]
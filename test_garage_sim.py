@@ -0,0 +1,69 @@
+""" Regression tests of the radio code against the simulated RFM69 """
+
+import re
+
+import garage_rfm69
+
+
+def frames_sent(radio, waveform):
+    """Decode what the simulated radio put on air back into symbol patterns,
+    one per frame, splitting on gaps at least as long as the waveform's"""
+    sent = bytes(radio.transmitted)
+    bits = f"{int.from_bytes(sent, 'big'):0{len(sent) * 8}b}"[: waveform.bits]
+    frames = re.split(f"0{{{waveform.gap_bits},}}", bits.strip("0"))
+    return [
+        "".join(
+            run[0] * round(len(run) / waveform.symbol_bits)
+            for run in re.findall("0+|1+", frame)
+        )
+        for frame in frames
+    ]
+
+
+def test_register_setup_leaves_the_garage_image(radio):
+    garage_rfm69.register_setup(radio)
+    regs = garage_rfm69.register_snapshot(radio)
+    image = garage_rfm69.register_image()
+    assert {reg: regs[reg] for reg in image} == image
+    assert not garage_rfm69.register_verify(radio, regs)
+
+
+def test_register_setup_again_writes_nothing(radio):
+    regs = garage_rfm69.register_setup(radio)
+    written = radio.spi.spi.transfers
+    garage_rfm69.register_setup(radio, regs)
+    assert radio.spi.spi.transfers == written
+
+
+def test_transmit_sends_the_waveform(radio):
+    garage_rfm69.register_setup(radio)
+    device = garage_rfm69.with_repeats(garage_rfm69.garage(), 7)
+    garage_rfm69.transmit(radio, True, device)
+    assert bytes(radio.transmitted) == device.waveform.payload
+
+
+def test_pulse_through_the_daemon(server, radio):
+    reply = server.dispatch({"cmd": "pulse"}, lambda event: None)
+    assert reply["ok"] and reply["verified"]
+    device = garage_rfm69.garage()
+    waveform = device.waveform
+    assert bytes(radio.transmitted) == waveform.payload
+    # Every repeat of the signal went out, frame for frame
+    assert (
+        frames_sent(radio, waveform)
+        == [garage_rfm69.GARAGE_SYMBOLS] * device.profile.repeats
+    )
+
+
+def test_dry_run_pulse_sends_nothing(server, radio):
+    reply = server.dispatch({"cmd": "pulse", "dry_run": True}, lambda event: None)
+    assert reply["ok"]
+    assert not radio.transmitted
+
+
+def test_pulse_from_hot_standby(server, radio):
+    server.hot_standby = True
+    server.tune()
+    reply = server.dispatch({"cmd": "pulse"}, lambda event: None)
+    assert reply["armed"]
+    assert bytes(radio.transmitted) == garage_rfm69.garage().waveform.payload